@@ -0,0 +1,464 @@
+"""Benchmark runner for the network scanners and the Django views.
+
+Everything runs against local stand-ins, so results do not depend on the
+network the machine sits in:
+  - ping: a stub backend with fixed latency, every `alive_every`-th address alive
+  - reverse DNS: a resolver cache that answers every address
+  - HTTP: a loopback server with configurable latency that wants Basic Auth
+  - FTP: a loopback server speaking just enough FTP to reject logins
+  - database: a throw-away SQLite file, migrated and seeded
+
+Each scenario runs in its own child process so its peak RSS is its own.
+Results go to stdout (or -o FILE) as JSON:
+
+    python benchmarks/run.py -o bench.json
+    python benchmarks/run.py --only scan_network,view_gaestebuch_home --repeat 20
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import platform
+import resource
+import socketserver
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCENARIOS: Dict[str, Callable[[argparse.Namespace], Dict]] = {}
+
+
+def scenario(name: str):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+# --- stand-ins ---------------------------------------------------------------
+
+class StubPinger:
+    """Ping backend answering after `latency` seconds; every `alive_every`-th address is alive."""
+
+    name = "stub"
+    latency = 0.002
+    alive_every = 8
+
+    def __init__(self, timeout: float = 0.5):
+        self.timeout = timeout
+
+    async def ping(self, ip: str) -> bool:
+        await asyncio.sleep(self.latency)
+        return int(ip.replace(":", ".").split(".")[-1] or 0, 16 if ":" in ip else 10) % self.alive_every == 0
+
+    def close(self) -> None:
+        pass
+
+
+class _StubDnsCache:
+    def get(self, ip):
+        return True, f"host-{ip.replace('.', '-').replace(':', '-')}"
+
+    def set(self, ip, hostname):
+        pass
+
+    def clear(self):
+        pass
+
+
+def default_settings():
+    """Django's default settings for scenarios that call the scanners without the project.
+
+    The scanners read their NETWORKIP_* options from settings, so those need
+    to be configured even where no view or database is involved.
+    """
+    from django.conf import settings
+
+    if not settings.configured:
+        settings.configure()
+
+
+@contextlib.contextmanager
+def stub_network(latency: float, alive_every: int):
+    """Route every ping backend to StubPinger and answer reverse DNS from memory."""
+    default_settings()
+    from networkip import networkscanner
+    from networkip.resolver import get_resolver
+
+    StubPinger.latency = latency
+    StubPinger.alive_every = alive_every
+    backends = dict(networkscanner.BACKENDS)
+    resolver = get_resolver()
+    dns_cache = resolver.cache
+    networkscanner.BACKENDS.update({name: StubPinger for name in backends})
+    networkscanner.BACKENDS["stub"] = StubPinger
+    resolver.cache = _StubDnsCache()
+    try:
+        yield
+    finally:
+        networkscanner.BACKENDS.clear()
+        networkscanner.BACKENDS.update(backends)
+        resolver.cache = dns_cache
+
+
+class _HttpHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    credentials = ("admin", "secret")
+
+    def _reply(self, status: int, extra=()):
+        time.sleep(self.latency)
+        self.send_response(status)
+        for header, value in extra:
+            self.send_header(header, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        user, password = self.credentials
+        token = base64.b64encode(f"{user}:{password}".encode()).decode()
+        if self.path != "/":
+            self._reply(404)
+        elif self.headers.get("Authorization") == f"Basic {token}":
+            self._reply(200)
+        else:
+            self._reply(401, [("WWW-Authenticate", 'Basic realm="bench"')])
+
+    do_HEAD = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class _FtpHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write(b"220 bench\r\n")
+        for line in self.rfile:
+            cmd = line.decode(errors="replace").split(" ", 1)[0].upper().strip()
+            if cmd == "USER":
+                self.wfile.write(b"331 password required\r\n")
+            elif cmd == "PASS":
+                self.wfile.write(b"530 login incorrect\r\n")
+            elif cmd == "QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            else:
+                self.wfile.write(b"502 not implemented\r\n")
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@contextlib.contextmanager
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _closed_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def stand_in_target(latency: float):
+    """Loopback HTTP + FTP targets; the scanner's SSH port points at a closed port."""
+    default_settings()
+    from networkip import internet_scanner
+
+    handler = type("Handler", (_HttpHandler,), {"latency": latency})
+    ports = dict(internet_scanner.FAMILY_PORTS)
+    with serve(ThreadingHTTPServer(("127.0.0.1", 0), handler)) as http_port, \
+            serve(_ThreadingTCPServer(("127.0.0.1", 0), _FtpHandler)) as ftp_port:
+        internet_scanner.FAMILY_PORTS.update({"ssh": _closed_port(), "ftp": ftp_port})
+        try:
+            yield f"http://127.0.0.1:{http_port}"
+        finally:
+            internet_scanner.FAMILY_PORTS.update(ports)
+
+
+def setup_django(tmpdir: str, comments: int = 0):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "projekte.settings")
+    import django
+    from django.conf import settings
+
+    django.setup()
+    settings.DATABASES["default"]["NAME"] = os.path.join(tmpdir, "bench.sqlite3")
+    settings.ALLOWED_HOSTS.append("testserver")
+    settings.NETWORKIP_SCAN_CACHE_TIMEOUT = 0
+    settings.NETWORKIP_INVENTORY = False
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+    if comments:
+        from gaestebuch.models import Kommentar
+        words = "Hallo Grüße aus München Berlin schöne Seite danke toller Server".split()
+        Kommentar.objects.bulk_create(
+            [Kommentar(name=words[i % len(words)], text=" ".join(words[(i + j) % len(words)] for j in range(12)))
+             for i in range(comments)], batch_size=2000)
+
+
+# --- measuring ---------------------------------------------------------------
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def measure(func: Callable[[], int], repeat: int, warmup: int = 1) -> Dict:
+    """Call `func` (returning the number of items it handled) `repeat` times."""
+    for _ in range(warmup):
+        func()
+    durations = []
+    items = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items += func()
+        durations.append(time.perf_counter() - start)
+    total = sum(durations)
+    return {
+        "repeat": repeat,
+        "items": items,
+        "throughput_per_s": items / total if total else None,
+        "mean_s": statistics.fmean(durations),
+        "p50_s": _percentile(durations, 50),
+        "p99_s": _percentile(durations, 99),
+        "min_s": min(durations),
+        "max_s": max(durations),
+    }
+
+
+# --- scenarios ---------------------------------------------------------------
+
+@scenario("scan_network")
+def bench_scan_network(args):
+    from networkip.networkscanner import scan_network
+    with stub_network(args.ping_latency, args.alive_every):
+        return measure(lambda: len(scan_network("10.99.0.", 1, 254)), args.repeat)
+
+
+@scenario("scan_network_streaming")
+def bench_scan_network_streaming(args):
+    from networkip.networkscanner import scan_network_streaming
+
+    first = []
+
+    def run():
+        start = time.perf_counter()
+        n = 0
+        for n, _ in enumerate(scan_network_streaming("10.99.0.", 1, 254, backend="stub"), start=1):
+            if n == 1:
+                first.append(time.perf_counter() - start)
+        return n
+
+    with stub_network(args.ping_latency, args.alive_every):
+        result = measure(run, args.repeat)
+    result["first_result_p50_s"] = _percentile(first, 50)
+    return result
+
+
+@scenario("scan_networks_large")
+def bench_scan_networks_large(args):
+    from networkip.networkscanner import scan_networks
+    with stub_network(args.ping_latency, args.alive_every):
+        return measure(lambda: len(scan_networks("10.98.0.0/20", backend="stub")), max(1, args.repeat // 5))
+
+
+@scenario("scan_internet_security")
+def bench_scan_internet_security(args):
+    from networkip.internet_scanner import scan_internet_security
+    with stand_in_target(args.http_latency) as url:
+        return measure(lambda: sum(1 for _ in scan_internet_security(url)), max(1, args.repeat // 5))
+
+
+@scenario("discover_services")
+def bench_discover_services(args):
+    # 200 loopback hosts x 20 ports, one of them listening; the rest refuse at once
+    import socket
+    default_settings()
+    from networkip.portscan import discover_services
+
+    hosts = [f"127.0.{i // 250}.{i % 250 + 1}" for i in range(200)]
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(64)
+        port = listener.getsockname()[1]
+        ports = [port] + [_closed_port() for _ in range(19)]
+        return measure(lambda: len(discover_services(hosts, ports, max_in_flight=512)), args.repeat)
+
+
+@scenario("view_gaestebuch_home")
+def bench_view_gaestebuch_home(args):
+    from django.test import Client
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup_django(tmpdir, comments=args.comments)
+        client = Client()
+
+        def run():
+            assert client.get("/").status_code == 200
+            return 1
+        return measure(run, args.repeat * 10)
+
+
+@scenario("view_gaestebuch_post")
+def bench_view_gaestebuch_post(args):
+    from django.test import Client
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup_django(tmpdir, comments=args.comments)
+        client = Client()
+
+        def run():
+            assert client.post("/", {"name": "Bench", "text": "Eintrag"}).status_code == 302
+            return 1
+        return measure(run, args.repeat * 10)
+
+
+@scenario("view_gaestebuch_suche")
+def bench_view_gaestebuch_suche(args):
+    from django.test import Client
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup_django(tmpdir, comments=args.comments)
+        client = Client()
+
+        def run():
+            assert client.get("/suche/", {"q": "münchen"}).status_code == 200
+            return 1
+        return measure(run, args.repeat * 10)
+
+
+@scenario("view_networkip_stream")
+def bench_view_networkip_stream(args):
+    from django.test import Client
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup_django(tmpdir)
+        client = Client()
+
+        def run():
+            response = client.get("/networkip/api/home/stream/")
+            return sum(1 for chunk in response.streaming_content for _ in chunk.splitlines())
+
+        with stub_network(args.ping_latency, args.alive_every):
+            return measure(run, args.repeat)
+
+
+@scenario("view_networkip_internet")
+def bench_view_networkip_internet(args):
+    from django.test import Client
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup_django(tmpdir)
+        client = Client()
+        with stand_in_target(args.http_latency) as url:
+            def run():
+                response = client.get("/networkip/api/internet/", {"url": url})
+                return sum(1 for chunk in response.streaming_content for _ in chunk.splitlines())
+            return measure(run, max(1, args.repeat // 5))
+
+
+# --- runner ------------------------------------------------------------------
+
+def run_scenario(name: str, args) -> Dict:
+    result = SCENARIOS[name](args)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    result["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return result
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              timeout=10).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", help="comma-separated scenario names (default: all)")
+    parser.add_argument("--list", action="store_true", help="list scenarios and exit")
+    parser.add_argument("--repeat", type=int, default=10, help="timed iterations per scenario")
+    parser.add_argument("--ping-latency", type=float, default=0.002, help="stub ping answer time in seconds")
+    parser.add_argument("--alive-every", type=int, default=8, help="every n-th stub address answers")
+    parser.add_argument("--http-latency", type=float, default=0.005, help="stand-in HTTP server delay in seconds")
+    parser.add_argument("--comments", type=int, default=5000, help="guestbook rows to seed")
+    parser.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(SCENARIOS))
+        return 0
+
+    if args.scenario:
+        # child process: one scenario, JSON on stdout
+        print(json.dumps(run_scenario(args.scenario, args)))
+        return 0
+
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    passthrough = ["--repeat", str(args.repeat), "--ping-latency", str(args.ping_latency),
+                   "--alive-every", str(args.alive_every), "--http-latency", str(args.http_latency),
+                   "--comments", str(args.comments)]
+    results = {}
+    for name in names:
+        print(f"running {name} ...", file=sys.stderr)
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--scenario", name, *passthrough],
+                              cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode == 0:
+            results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+        else:
+            results[name] = {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+
+    import django
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "parameters": {
+                "repeat": args.repeat,
+                "ping_latency": args.ping_latency,
+                "alive_every": args.alive_every,
+                "http_latency": args.http_latency,
+                "comments": args.comments,
+            },
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(output + "\n")
+    else:
+        print(output)
+    return 0 if all("error" not in r for r in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""Write-behind ingestion of guestbook posts.
+
+Settings:
+  GAESTEBUCH_INGEST_MODE: "sync" (default, one INSERT per post), "buffered"
+      (in-memory queue, lost if the process dies) or "journal" (each post is
+      appended to a per-process journal file first and replayed after a crash;
+      POSIX only)
+  GAESTEBUCH_INGEST_FLUSH_MS: how long a batch may wait to fill up (default 50)
+  GAESTEBUCH_INGEST_MAX_BATCH: rows per flush (default 500)
+  GAESTEBUCH_INGEST_JOURNAL: journal path prefix (default BASE_DIR / "gaestebuch-journal")
+  GAESTEBUCH_INGEST_FSYNC: fsync the journal on every post (default False)
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import List, Optional, Tuple
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+
+from .listing import invalidate_listing
+from .models import Kommentar
+
+logger = logging.getLogger(__name__)
+
+
+def _lock(path: str):
+    """Open `path` and flock it; the open file, or None if another process holds it."""
+    fh = open(path, "a")
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return None
+    return fh
+
+
+class KommentarWriter:
+    """Collects posts and writes them with one bulk_create per batch on a background thread.
+
+    A batch is flushed `flush_interval` seconds after its first post or as
+    soon as it holds `max_batch` posts, whichever comes first. `close()`
+    flushes whatever is left.
+
+    With a journal, the writer holds a flock on its "<journal>.<owner>.lock"
+    file for as long as it lives. Journals whose lock can be taken belong to
+    a dead process; the background thread claims and replays them on start.
+    """
+
+    # seconds before a failed batch is retried
+    retry_interval = 1.0
+
+    def __init__(self, flush_interval: float = 0.05, max_batch: int = 500,
+                 journal: Optional[str] = None, fsync: bool = False):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self._queue: List[Tuple[str, str]] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._journal_file = None
+        self._flushing: List[str] = []
+        self._prefix = journal
+        self._journal = None
+        self._owner_lock = None
+        if journal:
+            # PIDs get reused, so the owner part is made unique
+            owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            self._owner_lock = _lock(f"{journal}.{owner}.lock")
+            self._journal = f"{journal}.{owner}.ndjson"
+            self._start()
+
+    def _start(self) -> None:
+        # with the lock held, or before the writer is shared
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="gaestebuch-writer", daemon=True)
+            self._thread.start()
+
+    def _replay(self) -> None:
+        # on the writer thread: claim journals of dead processes by renaming
+        # them to ours and queue their posts; the claimed files go once written
+        prefix = self._prefix
+        paths = glob.glob(f"{glob.escape(prefix)}.*.ndjson*") + glob.glob(f"{glob.escape(prefix)}.*.lock")
+        owners = {path[len(prefix) + 1:].split('.')[0] for path in paths}
+        for owner in sorted(owners - {self._journal[len(prefix) + 1:].split('.')[0]}):
+            lock = _lock(f"{prefix}.{owner}.lock")
+            if lock is None:
+                # the owner is alive
+                continue
+            entries, claimed = [], []
+            try:
+                for path in sorted(glob.glob(f"{glob.escape(prefix)}.{glob.escape(owner)}.ndjson*")):
+                    target = f"{self._journal}.replay-{os.path.basename(path)}"
+                    try:
+                        os.rename(path, target)
+                    except OSError:
+                        continue
+                    claimed.append(target)
+                    with open(target, encoding="utf-8") as fh:
+                        for line in fh:
+                            try:
+                                entry = json.loads(line)
+                                entries.append((entry["name"], entry["text"]))
+                            except (ValueError, KeyError, TypeError):
+                                # torn last line from a crash mid-write
+                                continue
+                os.unlink(lock.name)
+            finally:
+                lock.close()
+            if claimed:
+                logger.info("replaying %d guestbook posts from %s", len(entries), ", ".join(claimed))
+            with self._cond:
+                self._queue[:0] = entries
+                self._flushing.extend(claimed)
+
+    def submit(self, name: str, text: str) -> None:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("writer is closed")
+            if self._journal:
+                if self._journal_file is None:
+                    self._journal_file = open(self._journal, "a", encoding="utf-8")
+                self._journal_file.write(json.dumps({"name": name, "text": text}) + "\n")
+                self._journal_file.flush()
+                if self.fsync:
+                    os.fsync(self._journal_file.fileno())
+            self._queue.append((name, text))
+            self._start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        if self._journal:
+            try:
+                self._replay()
+            except OSError:
+                logger.exception("could not replay the guestbook journals at %s", self._prefix)
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._closed and len(self._queue) < self.max_batch:
+                    # let the batch fill up
+                    self._cond.wait_for(lambda: self._closed or len(self._queue) >= self.max_batch,
+                                        self.flush_interval)
+                batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+                drained = not self._queue
+                if drained:
+                    self._rotate_journal()
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("could not write %d guestbook posts", len(batch))
+                with self._cond:
+                    self._queue[:0] = batch
+                if self._closed:
+                    # the journal keeps them for the next start
+                    break
+                time.sleep(self.retry_interval)
+                continue
+            if drained:
+                # everything journaled (or replayed) so far is committed now
+                with self._cond:
+                    flushed, self._flushing = self._flushing, []
+                for path in flushed:
+                    os.unlink(path)
+            with self._cond:
+                if self._closed and not self._queue:
+                    break
+        connections.close_all()
+
+    def _rotate_journal(self) -> None:
+        # called with the lock held; the rotated files go once the queue they
+        # cover has been written
+        if self._journal_file is None:
+            return
+        self._journal_file.close()
+        self._journal_file = None
+        flushing = f"{self._journal}.flushing-{len(self._flushing)}"
+        os.replace(self._journal, flushing)
+        self._flushing.append(flushing)
+
+    def _write(self, batch: List[Tuple[str, str]]) -> None:
+        if not batch:
+            return
+        with transaction.atomic():
+            Kommentar.objects.bulk_create([Kommentar(name=name, text=text) for name, text in batch],
+                                          batch_size=self.max_batch)
+        invalidate_listing()
+
+    def close(self, timeout: float = 10) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        if self._owner_lock is not None and (thread is None or not thread.is_alive()):
+            # anything left in the journal is replayed by the next writer
+            os.unlink(self._owner_lock.name)
+            self._owner_lock.close()
+            self._owner_lock = None
+
+
+_writer: Optional[KommentarWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> Optional[KommentarWriter]:
+    """The process-wide writer, or None in "sync" mode."""
+    global _writer
+    mode = getattr(settings, "GAESTEBUCH_INGEST_MODE", "sync")
+    if mode == "sync":
+        return None
+    with _writer_lock:
+        if _writer is None:
+            journal = None
+            if mode == "journal":
+                if fcntl is None:
+                    raise ImproperlyConfigured('GAESTEBUCH_INGEST_MODE "journal" needs fcntl (POSIX)')
+                journal = str(getattr(settings, "GAESTEBUCH_INGEST_JOURNAL",
+                                      Path(settings.BASE_DIR) / "gaestebuch-journal"))
+            _writer = KommentarWriter(
+                flush_interval=getattr(settings, "GAESTEBUCH_INGEST_FLUSH_MS", 50) / 1000,
+                max_batch=getattr(settings, "GAESTEBUCH_INGEST_MAX_BATCH", 500),
+                journal=journal,
+                fsync=getattr(settings, "GAESTEBUCH_INGEST_FSYNC", False),
+            )
+            atexit.register(_writer.close)
+        return _writer
+
+
+def save_kommentar(name: str, text: str) -> None:
+    """Store a post directly or hand it to the write-behind writer, depending on the mode."""
+    writer = get_writer()
+    if writer is None:
+        Kommentar.objects.create(name=name, text=text)
+        invalidate_listing()
+    else:
+        writer.submit(name, text)
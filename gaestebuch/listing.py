@@ -0,0 +1,71 @@
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.functional import cached_property
+from .models import Kommentar
+
+PAGE_SIZE = 20
+# rendered list fragments; stale ones are orphaned by bumping the version.
+# Both live in the default cache, which must be shared between worker
+# processes (see CACHES in settings) for a post to reach all of them.
+FRAGMENT_TIMEOUT = 300
+LISTING_VERSION_KEY = 'gaestebuch:listing:version'
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def listing_version():
+    return cache.get_or_set(LISTING_VERSION_KEY, time.time_ns, None)
+
+
+def invalidate_listing():
+    # new version -> every cached page fragment key changes
+    cache.set(LISTING_VERSION_KEY, time.time_ns(), None)
+
+
+def format_cursor(cursor):
+    # canonical "<microseconds>-<pk>" form of a decoded (datum, pk) cursor
+    datum, pk = cursor
+    delta = datum - _EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds
+    return f"{micros}-{pk}"
+
+
+def encode_cursor(k):
+    return format_cursor((k.datum, k.pk))
+
+
+def decode_cursor(value):
+    try:
+        micros, pk = value.split('-')
+        return _EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+class KommentarPage:
+    """One page of the keyset-paginated listing, queried only when the template needs it."""
+
+    def __init__(self, cursor=None, page_size=PAGE_SIZE):
+        self.cursor = cursor
+        self.page_size = page_size
+
+    @cached_property
+    def _rows(self):
+        qs = Kommentar.objects.only('name', 'text', 'datum').order_by('-datum', '-id')
+        if self.cursor is not None:
+            datum, pk = self.cursor
+            qs = qs.filter(Q(datum__lt=datum) | Q(datum=datum, id__lt=pk))
+        return list(qs[:self.page_size + 1])
+
+    @property
+    def items(self):
+        return self._rows[:self.page_size]
+
+    @property
+    def next_cursor(self):
+        if len(self._rows) > self.page_size:
+            return encode_cursor(self._rows[self.page_size - 1])
+        return None
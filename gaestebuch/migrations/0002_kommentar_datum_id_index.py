@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gaestebuch', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='kommentar',
+            index=models.Index(fields=['-datum', '-id'], name='gaestebuch_datum_id'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations
+
+FTS_TABLE = 'gaestebuch_kommentar_fts'
+
+CREATE = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        name, text,
+        content='gaestebuch_kommentar', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    # external-content table: triggers keep it in step with every write path,
+    # including bulk_create and raw SQL, which bypass model signals
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON gaestebuch_kommentar BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, text) VALUES (new.id, new.name, new.text);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON gaestebuch_kommentar BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) VALUES ('delete', old.id, old.name, old.text);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF name, text ON gaestebuch_kommentar BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, name, text) VALUES (new.id, new.name, new.text);
+    END""",
+    # matches in the name count twice as much as in the text
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(2.0, 1.0)')",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+DROP = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def _has_fts5(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        # FTS5 may also be built in without the compile option being reported
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.gaestebuch_fts5_probe USING fts5(x)")
+            cursor.execute("DROP TABLE temp.gaestebuch_fts5_probe")
+            return True
+        except Exception:
+            return False
+
+
+def create_fts(apps, schema_editor):
+    # other backends (or SQLite without FTS5) use the icontains fallback in search.py
+    if not _has_fts5(schema_editor.connection):
+        return
+    for sql in CREATE:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gaestebuch', '0002_kommentar_datum_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
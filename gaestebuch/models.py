@@ -3,4 +3,10 @@ from django.db import models
 class Kommentar(models.Model):
     name = models.CharField(max_length=100)
     text = models.TextField()
-    datum = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    datum = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the start page: ORDER BY datum DESC, id DESC
+            models.Index(fields=['-datum', '-id'], name='gaestebuch_datum_id'),
+        ]
@@ -0,0 +1,122 @@
+"""Search over guestbook comments: FTS5 on SQLite, icontains everywhere else."""
+import re
+import secrets
+from typing import List, Tuple
+
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Kommentar
+
+SEARCH_PAGE_SIZE = 20
+# deep offsets get slow and nobody reads them
+MAX_PAGE = 50
+FTS_TABLE = 'gaestebuch_kommentar_fts'
+SNIPPET_TOKENS = 32
+
+_fts_tables = {}
+
+
+def fts_available(using: str = 'default') -> bool:
+    if using not in _fts_tables:
+        connection = connections[using]
+        _fts_tables[using] = (connection.vendor == 'sqlite'
+                              and FTS_TABLE in connection.introspection.table_names())
+    return _fts_tables[using]
+
+
+def search_terms(query: str) -> List[str]:
+    return re.findall(r'\w+', query)[:10]
+
+
+def _fts_query(terms: List[str]) -> str:
+    # every term must match, as a prefix; terms are \w+ so quoting needs no escaping
+    return ' '.join(f'"{t}"*' for t in terms)
+
+
+def _new_marks() -> Tuple[str, str]:
+    # highlight markers with a random part, so no stored text can contain them
+    # (any character, control characters included, can be posted); escape()
+    # leaves hex digits and brackets alone
+    nonce = secrets.token_hex(8)
+    return f'[{nonce}[', f']{nonce}]'
+
+
+def _marked_html(value: str, marks: Tuple[str, str]) -> str:
+    start, end = marks
+    return mark_safe(escape(value).replace(start, '<mark>').replace(end, '</mark>'))
+
+
+def _mark_terms(value: str, terms: List[str], marks: Tuple[str, str]) -> str:
+    pattern = re.compile('|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    return pattern.sub(lambda m: marks[0] + m.group(0) + marks[1], value)
+
+
+class SearchPage:
+    """One page of search results; each item has `name_html` and `text_html` with <mark>ed hits."""
+
+    def __init__(self, query: str, page: int = 1, page_size: int = SEARCH_PAGE_SIZE, using: str = 'default'):
+        self.query = query
+        self.terms = search_terms(query)
+        self.page = min(max(page, 1), MAX_PAGE)
+        self.page_size = page_size
+        self.using = using
+        self.ranked = False
+        self._marks = _new_marks()
+        self._rows = self._fetch() if self.terms else []
+
+    def _fetch(self) -> List[Kommentar]:
+        offset = (self.page - 1) * self.page_size
+        if fts_available(self.using):
+            try:
+                rows = list(self._fts(offset))
+                self.ranked = True
+                return rows
+            except DatabaseError:
+                pass
+        return self._fallback(offset)
+
+    def _fts(self, offset: int):
+        sql = f"""
+            SELECT k.id, k.name, k.datum,
+                   highlight({FTS_TABLE}, 0, %s, %s) AS name_marked,
+                   snippet({FTS_TABLE}, 1, %s, %s, '…', {SNIPPET_TOKENS}) AS text_marked
+            FROM {FTS_TABLE} JOIN gaestebuch_kommentar k ON k.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s
+            ORDER BY rank
+            LIMIT %s OFFSET %s
+        """
+        start, end = self._marks
+        params = [start, end, start, end, _fts_query(self.terms), self.page_size + 1, offset]
+        for k in Kommentar.objects.using(self.using).raw(sql, params):
+            k.name_html = _marked_html(k.name_marked, self._marks)
+            k.text_html = _marked_html(k.text_marked, self._marks)
+            yield k
+
+    def _fallback(self, offset: int) -> List[Kommentar]:
+        qs = Kommentar.objects.using(self.using).order_by('-datum', '-id')
+        for term in self.terms:
+            qs = qs.filter(Q(name__icontains=term) | Q(text__icontains=term))
+        rows = list(qs[offset:offset + self.page_size + 1])
+        for k in rows:
+            k.name_html = _marked_html(_mark_terms(k.name, self.terms, self._marks), self._marks)
+            k.text_html = _marked_html(_mark_terms(k.text, self.terms, self._marks), self._marks)
+        return rows
+
+    @property
+    def items(self) -> List[Kommentar]:
+        return self._rows[:self.page_size]
+
+    @property
+    def has_next(self) -> bool:
+        return len(self._rows) > self.page_size and self.page < MAX_PAGE
+
+    @property
+    def next_page(self) -> int:
+        return self.page + 1
+
+    @property
+    def previous_page(self) -> int:
+        return self.page - 1
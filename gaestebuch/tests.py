@@ -0,0 +1,139 @@
+import fcntl
+import glob
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase
+
+from gaestebuch import search
+from gaestebuch.ingest import KommentarWriter
+from gaestebuch.listing import KommentarPage, decode_cursor
+from gaestebuch.models import Kommentar
+
+
+class SearchHighlightTests(TestCase):
+    def setUp(self):
+        search._fts_tables.clear()
+        self.addCleanup(search._fts_tables.clear)
+        # any character can be posted, control characters included
+        Kommentar.objects.create(name='Eva', text='\x02<b>hallo</b> welt\x03 \x02')
+
+    def assert_marked_once(self, page):
+        [k] = page.items
+        self.assertEqual(k.text_html.count('<mark>'), 1)
+        self.assertEqual(k.text_html.count('</mark>'), 1)
+        self.assertIn('&lt;b&gt;', k.text_html)
+
+    def test_fts(self):
+        if not search.fts_available():
+            self.skipTest('no FTS5')
+        page = search.SearchPage('hallo')
+        self.assertTrue(page.ranked)
+        self.assert_marked_once(page)
+
+    def test_fallback(self):
+        search._fts_tables['default'] = False
+        page = search.SearchPage('hallo')
+        self.assertFalse(page.ranked)
+        self.assert_marked_once(page)
+
+
+class KeysetPagingTests(TestCase):
+    def setUp(self):
+        datum = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+        for n in range(5):
+            Kommentar.objects.create(name=f'Gast {n}', text='hallo')
+        # posts within the same microsecond are ordered by id
+        Kommentar.objects.update(datum=datum)
+
+    def test_pages_split_equal_datum_without_gaps_or_repeats(self):
+        seen = []
+        cursor = None
+        while True:
+            page = KommentarPage(cursor, page_size=2)
+            seen.extend(k.pk for k in page.items)
+            if page.next_cursor is None:
+                break
+            cursor = decode_cursor(page.next_cursor)
+        self.assertEqual(seen, sorted(Kommentar.objects.values_list('pk', flat=True), reverse=True))
+
+    def test_invalid_cursor_shows_the_first_page(self):
+        for value in ('abc', '1-2-3', '99999999999999999999999-1', '-1'):
+            self.assertIsNone(decode_cursor(value))
+        response = self.client.get('/', {'vor': 'abc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cursor'], '')
+        self.assertEqual(len(response.context['page'].items), 5)
+
+    def test_fragment_key_uses_the_decoded_cursor(self):
+        first = KommentarPage(page_size=2).next_cursor
+        micros, pk = first.split('-')
+        response = self.client.get('/', {'vor': f'000{micros}-0{pk}'})
+        self.assertEqual(response.context['cursor'], first)
+
+
+class JournalReplayTests(TransactionTestCase):
+    # the writer thread has its own database connection, so the rows must be committed
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.prefix = os.path.join(tmp.name, 'journal')
+
+    def write_journal(self, name, *posts, torn=''):
+        with open(f'{self.prefix}.{name}', 'w', encoding='utf-8') as fh:
+            for post in posts:
+                fh.write(json.dumps({'name': post, 'text': 'hallo'}) + '\n')
+            fh.write(torn)
+
+    def names(self):
+        return sorted(Kommentar.objects.values_list('name', flat=True))
+
+    def test_torn_last_line_is_skipped(self):
+        self.write_journal('4711-dead.ndjson', 'Eva', torn='{"name": "Ad')
+        KommentarWriter(journal=self.prefix, flush_interval=0.01).close()
+        self.assertEqual(self.names(), ['Eva'])
+        self.assertEqual(glob.glob(f'{self.prefix}*'), [])
+
+    def test_rotated_journals_of_dead_processes_are_replayed(self):
+        self.write_journal('4711-dead.ndjson.flushing-0', 'Eva')
+        self.write_journal('4711-dead.ndjson.flushing-1', 'Ida')
+        self.write_journal('4711-dead.ndjson', 'Ole')
+        # an owner holding its lock is alive, however its PID looks
+        self.write_journal('4712-live.ndjson', 'Max')
+        with open(f'{self.prefix}.4712-live.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            KommentarWriter(journal=self.prefix, flush_interval=0.01).close()
+            self.assertEqual(self.names(), ['Eva', 'Ida', 'Ole'])
+            self.assertEqual(sorted(glob.glob(f'{self.prefix}*')),
+                             [f'{self.prefix}.4712-live.lock', f'{self.prefix}.4712-live.ndjson'])
+
+    def test_failed_write_is_requeued(self):
+        writer = KommentarWriter(journal=self.prefix, flush_interval=0.01)
+        writer.retry_interval = 0.01
+        write = writer._write
+        calls = []
+
+        def flaky(batch):
+            if not batch:
+                return
+            calls.append(list(batch))
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            write(batch)
+
+        with mock.patch.object(writer, '_write', flaky), self.assertLogs('gaestebuch.ingest', 'ERROR'):
+            writer.submit('Eva', 'hallo')
+            for _ in range(200):
+                if len(calls) == 2:
+                    break
+                time.sleep(0.01)
+            writer.close()
+        self.assertEqual(calls, [[('Eva', 'hallo')]] * 2)
+        self.assertEqual(self.names(), ['Eva'])
+        self.assertEqual(glob.glob(f'{self.prefix}*'), [])
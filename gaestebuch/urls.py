@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path('', views.home, name='gaestebuch_home'),
+    path('suche/', views.suche, name='gaestebuch_suche'),
 ]
\ No newline at end of file
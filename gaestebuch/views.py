@@ -1,13 +1,36 @@
 from django.shortcuts import render, redirect
-from .models import Kommentar
+from .ingest import save_kommentar
+from .listing import FRAGMENT_TIMEOUT, KommentarPage, decode_cursor, format_cursor, listing_version
+from .search import SearchPage
+
 
 def home(request):
     if request.method == "POST":
         name = request.POST.get("name")
         text = request.POST.get("text")
         if name and text:
-            Kommentar.objects.create(name=name, text=text)
+            save_kommentar(name, text)
         return redirect('gaestebuch_home')
 
-    kommentare = Kommentar.objects.all().order_by('-datum')
-    return render(request, 'gaestebuch/index.html', {'kommentare': kommentare})
\ No newline at end of file
+    raw_cursor = request.GET.get('vor', '')
+    cursor = decode_cursor(raw_cursor) if raw_cursor else None
+    return render(request, 'gaestebuch/index.html', {
+        'page': KommentarPage(cursor),
+        # the fragment is keyed on the decoded cursor, so spellings of the same
+        # position ("007-3", "7-3") share one cache entry
+        'cursor': format_cursor(cursor) if cursor else '',
+        'listing_version': listing_version(),
+        'fragment_timeout': FRAGMENT_TIMEOUT,
+    })
+
+
+def suche(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        seite = int(request.GET.get('seite', 1))
+    except ValueError:
+        seite = 1
+    return render(request, 'gaestebuch/suche.html', {
+        'q': query,
+        'page': SearchPage(query, seite) if query else None,
+    })
@@ -0,0 +1,202 @@
+"""Process-wide limits on scanning work.
+
+PROBE_BUDGET caps probes in flight across every sweep and internet scan
+(NETWORKIP_PROBE_BUDGET, default 512). `admission` caps the scans themselves:
+a limited number run at once, a limited number wait in line, and the rest
+are turned away with a retry hint.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict
+
+from django.conf import settings
+
+from . import metrics
+from .aio import SharedSemaphore
+
+# sized from settings on first use, not at import
+PROBE_BUDGET = SharedSemaphore(lambda: getattr(settings, "NETWORKIP_PROBE_BUDGET", 512))
+
+# how often a waiting scan re-reports its position even if nothing moved
+POSITION_INTERVAL = 1.0
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"scan queue full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A scan's place in the admission queue; release it when the scan is over."""
+
+    def __init__(self, admission: "Admission", key: str):
+        self.admission = admission
+        self.key = key
+        self.admitted = False
+        self.released = False
+        self.since = time.monotonic()
+        self._wakeups = []
+
+    def _wake(self) -> None:
+        # with the admission lock held; threads waiting in wait_sync have no loop
+        for loop, event in self._wakeups:
+            if loop is None:
+                event.set()
+                continue
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass
+
+    async def wait(self) -> AsyncIterator[int]:
+        """Yield the 1-based queue position while waiting; return once admitted."""
+        event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        with self.admission._lock:
+            self._wakeups.append((loop, event))
+        last = None
+        while True:
+            with self.admission._lock:
+                if self.admitted:
+                    return
+                position = self.admission._position(self)
+                event.clear()
+            if position != last:
+                last = position
+                yield position
+            try:
+                await asyncio.wait_for(event.wait(), POSITION_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def wait_sync(self, report: Callable[[int], None], stop: threading.Event) -> bool:
+        """Block until admitted, calling `report` with each new queue position.
+
+        Returns False if `stop` was set first (the ticket is still to be released).
+        """
+        event = threading.Event()
+        with self.admission._lock:
+            self._wakeups.append((None, event))
+        last = None
+        while not stop.is_set():
+            with self.admission._lock:
+                if self.admitted:
+                    return True
+                position = self.admission._position(self)
+                event.clear()
+            if position != last:
+                last = position
+                report(position)
+            event.wait(POSITION_INTERVAL)
+        return False
+
+    def release(self) -> None:
+        self.admission._release(self)
+
+
+class Admission:
+    """Limits how many scans run at once; further ones queue up to a bound.
+
+    Scans with the same key (the same sweep, the same target URL) share one
+    running slot, mirroring how the coordinator shares sweeps.
+
+    Settings:
+      NETWORKIP_MAX_ACTIVE_SCANS: scans running at once (default 4)
+      NETWORKIP_MAX_QUEUED_SCANS: scans waiting for a slot (default 16)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: Dict[str, int] = {}
+        self._queue: deque = deque()
+        # smoothed seconds a slot is held, for Retry-After
+        self._hold = 10.0
+
+    @property
+    def max_active(self) -> int:
+        return getattr(settings, "NETWORKIP_MAX_ACTIVE_SCANS", 4)
+
+    @property
+    def max_queued(self) -> int:
+        return getattr(settings, "NETWORKIP_MAX_QUEUED_SCANS", 16)
+
+    def _retry_after(self) -> int:
+        waves = (len(self._queue) + 1) / max(1, self.max_active)
+        return max(1, math.ceil(self._hold * waves))
+
+    def _refuse(self, key: str) -> None:
+        # with the lock held
+        if key not in self._active and len(self._queue) >= self.max_queued:
+            metrics.ADMISSION_REJECTED.inc()
+            raise Overloaded(self._retry_after())
+
+    def check(self, key: str) -> None:
+        """Raise Overloaded if a scan for `key` would be turned away right now.
+
+        Only a hint for answering before a response starts; `ticket` decides.
+        """
+        with self._lock:
+            self._refuse(key)
+
+    def ticket(self, key: str) -> Ticket:
+        """Admit a scan for `key` or queue it; raise Overloaded if the queue is full."""
+        ticket = Ticket(self, key)
+        with self._lock:
+            if key in self._active or (len(self._active) < self.max_active and not self._queue):
+                self._admit(ticket)
+            else:
+                self._refuse(key)
+                self._queue.append(ticket)
+                metrics.ADMISSION_WAITING.set(len(self._queue))
+        return ticket
+
+    def _position(self, ticket: Ticket) -> int:
+        try:
+            return self._queue.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def _admit(self, ticket: Ticket) -> None:
+        ticket.admitted = True
+        ticket.since = time.monotonic()
+        self._active[ticket.key] = self._active.get(ticket.key, 0) + 1
+
+    def _advance(self) -> None:
+        # admit from the head of the queue; tickets for a key that is already
+        # running go in regardless of the limit
+        admitted = []
+        for ticket in list(self._queue):
+            if ticket.key in self._active or len(self._active) < self.max_active:
+                self._queue.remove(ticket)
+                self._admit(ticket)
+                admitted.append(ticket)
+        metrics.ADMISSION_WAITING.set(len(self._queue))
+        # everyone still waiting has a new position
+        for ticket in admitted + list(self._queue):
+            ticket._wake()
+
+    def _release(self, ticket: Ticket) -> None:
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            if not ticket.admitted:
+                self._queue.remove(ticket)
+            else:
+                self._hold = 0.8 * self._hold + 0.2 * (time.monotonic() - ticket.since)
+                self._active[ticket.key] -= 1
+                if not self._active[ticket.key]:
+                    del self._active[ticket.key]
+            self._advance()
+            ticket._wake()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"active": sum(self._active.values()), "queued": len(self._queue)}
+
+
+admission = Admission()
@@ -0,0 +1,194 @@
+import asyncio
+import threading
+from collections import deque
+from typing import AsyncIterator, Callable, Iterator, List, Union
+
+_ITEM, _ERROR, _DONE = range(3)
+
+
+def iter_sync(agen) -> Iterator:
+    """Drive an async generator from synchronous code on a private event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+async def iterate_in_thread(gen: Iterator) -> AsyncIterator:
+    """Run a blocking generator on its own thread and yield its items asynchronously.
+
+    Closing or cancelling the async iterator stops the generator after the
+    item it is currently producing.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def put(kind, item=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (kind, item))
+        except RuntimeError:
+            # loop already closed, nobody is listening any more
+            stop.set()
+
+    def run():
+        try:
+            for item in gen:
+                if stop.is_set():
+                    break
+                put(_ITEM, item)
+        except BaseException as e:
+            put(_ERROR, e)
+        finally:
+            gen.close()
+            put(_DONE)
+
+    threading.Thread(target=run, name="networkip-iter", daemon=True).start()
+    try:
+        while True:
+            kind, item = await queue.get()
+            if kind == _DONE:
+                return
+            if kind == _ERROR:
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+async def batched(source: AsyncIterator, interval: float) -> AsyncIterator[List]:
+    """Group the items of an async iterator into lists, at most one list per `interval` seconds.
+
+    A list is emitted `interval` seconds after its first item arrived (or when
+    `source` ends), so no item waits longer than that.
+    """
+    loop = asyncio.get_running_loop()
+    upstream = source.__aiter__()
+    pending = None
+    batch: List = []
+    deadline = 0.0
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(upstream.__anext__())
+            timeout = max(0.0, deadline - loop.time()) if batch else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield batch
+                batch = []
+                continue
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                pending = None
+                break
+            pending = None
+            if not batch:
+                deadline = loop.time() + interval
+            batch.append(item)
+        if batch:
+            yield batch
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        if hasattr(upstream, "aclose"):
+            await upstream.aclose()
+
+
+class SharedSemaphore:
+    """Counting semaphore shared by threads and any number of event loops.
+
+    `acquire()` waits without blocking its loop; `acquire_sync()` (and the
+    `with` statement) block the calling thread. Waiters are served in order.
+    `value` may be a callable, which sizes the semaphore on first use.
+    """
+
+    def __init__(self, value: Union[int, Callable[[], int]]):
+        self._size = value
+        self._value = None if callable(value) else value
+        self._lock = threading.Lock()
+        self._waiters: deque = deque()
+
+    def _sized(self) -> int:
+        # with the lock held
+        if self._value is None:
+            self._value = self._size()
+        return self._value
+
+    def _grant(self, future: asyncio.Future) -> None:
+        # runs on the waiter's loop; a waiter cancelled meanwhile passes the slot on
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    async def acquire(self) -> None:
+        with self._lock:
+            if self._sized() > 0 and not self._waiters:
+                self._value -= 1
+                return
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, future))
+                    owed = False
+                except ValueError:
+                    # already granted; give it back unless _grant will
+                    owed = future.done() and not future.cancelled()
+            if owed:
+                self.release()
+            raise
+
+    def acquire_sync(self) -> None:
+        with self._lock:
+            if self._sized() > 0 and not self._waiters:
+                self._value -= 1
+                return
+            event = threading.Event()
+            self._waiters.append((None, event))
+        event.wait()
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if loop is None:
+                    waiter.set()
+                    return
+                try:
+                    loop.call_soon_threadsafe(self._grant, waiter)
+                    return
+                except RuntimeError:
+                    # that loop is closed; try the next waiter
+                    continue
+            self._value = self._sized() + 1
+
+    @property
+    def available(self) -> int:
+        with self._lock:
+            return self._sized()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def __enter__(self):
+        self.acquire_sync()
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class NetworkipConfig(AppConfig):
+    name = 'networkip'
+
+    def ready(self):
+        from . import checks  # noqa: F401  registers the system checks
+        from . import metrics
+
+        metrics.configure()
+        if getattr(settings, 'NETWORKIP_PRELOAD', False):
+            from .warmup import warm_up
+            warm_up()
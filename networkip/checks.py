@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def check_service_ports(app_configs, **kwargs):
+    """NETWORKIP_SERVICE_PORTS must be a port list parse_ports accepts."""
+    from .portscan import DEFAULT_SERVICE_PORTS, parse_ports
+
+    value = getattr(settings, "NETWORKIP_SERVICE_PORTS", DEFAULT_SERVICE_PORTS)
+    try:
+        parse_ports(value)
+    except (TypeError, ValueError, AttributeError) as e:
+        return [Error(
+            f"NETWORKIP_SERVICE_PORTS is not a usable port list: {e}",
+            hint='Use the form "22,80,8000-8010".',
+            obj="settings.NETWORKIP_SERVICE_PORTS",
+            id="networkip.E001",
+        )]
+    return []
@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.utils import timezone
+
+from . import metrics
+from .inventory import prioritized_hosts, record_sweep
+from .neighbors import neighbors_in
+from .networkscanner import (Networks, checked_host_count, ip_sort_key, iter_hosts, parse_networks,
+                             scan_addresses_streaming)
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def scan_key(networks: Networks, **options) -> str:
+    """Cache key identifying a sweep by its (normalized) networks and options."""
+    nets = ",".join(sorted(str(n) for n in parse_networks(networks)))
+    opts = ",".join(f"{k}={v}" for k, v in sorted(options.items()))
+    return "networkip:scan:" + hashlib.sha1(f"{nets}|{opts}".encode()).hexdigest()
+
+
+class SharedScan:
+    """One sweep running on a background thread, fanned out to any number of subscribers.
+
+    Late subscribers first receive the alive hosts found so far and the latest
+    progress, then follow the live events. When the last subscriber leaves
+    before the sweep is finished, the sweep is stopped.
+    """
+
+    def __init__(self, key: str, networks: Networks, options: Dict, on_finish):
+        self.key = key
+        self.networks = networks
+        self.options = options
+        self._on_finish = on_finish
+        self._alive: List[Tuple[int, int, Dict]] = []
+        self._last: Optional[Tuple[int, int, Dict]] = None
+        self._subscribers: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.started = timezone.now()
+        # identifies this sweep's event order to resuming clients (see ScanCoordinator.open)
+        self.token = uuid.uuid4().hex
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="networkip-sweep", daemon=True).start()
+
+    def _publish(self, event) -> None:
+        for loop, queue in list(self._subscribers.values()):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # subscriber's loop is gone
+                pass
+
+    def _run(self) -> None:
+        completed = False
+        try:
+            total = checked_host_count(self.networks)
+            if getattr(settings, "NETWORKIP_INVENTORY", True):
+                ips = prioritized_hosts(self.networks)
+            else:
+                ips = iter_hosts(self.networks)
+            neighbors = None
+            if getattr(settings, "NETWORKIP_PASSIVE_DISCOVERY", True):
+                neighbors = neighbors_in(parse_networks(self.networks))
+            for event in scan_addresses_streaming(ips, total, neighbors=neighbors, **self.options):
+                if self._stop.is_set():
+                    break
+                with self._lock:
+                    if event[2]["alive"]:
+                        self._alive.append(event)
+                    self._last = event
+                    self._publish(event)
+            else:
+                completed = True
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._lock:
+                self.done = True
+                self._publish(_DONE)
+            try:
+                self._on_finish(self, completed)
+            finally:
+                # this thread's DB connection (inventory) would otherwise leak
+                connections.close_all()
+
+    def results(self) -> List[Dict]:
+        return sorted(self.discovered(), key=ip_sort_key)
+
+    def discovered(self) -> List[Dict]:
+        """Alive hosts in the order subscribers received them."""
+        return [result for _, _, result in self._alive]
+
+    async def subscribe(self) -> AsyncIterator[Tuple[int, int, Dict]]:
+        queue: asyncio.Queue = asyncio.Queue()
+        token = id(queue)
+        with self._lock:
+            backlog = list(self._alive)
+            if self._last is not None and not self._last[2]["alive"]:
+                backlog.append(self._last)
+            done = self.done
+            if not done:
+                self._subscribers[token] = (asyncio.get_running_loop(), queue)
+        try:
+            for event in backlog:
+                yield event
+            while not done:
+                event = await queue.get()
+                if event is _DONE:
+                    break
+                yield event
+            if self.error is not None:
+                raise self.error
+        finally:
+            with self._lock:
+                self._subscribers.pop(token, None)
+                if not self._subscribers and not self.done:
+                    self._stop.set()
+
+
+class ScanCoordinator:
+    """Deduplicates concurrent sweeps and serves recent results from Django's cache.
+
+    Completed sweeps are also written to the host inventory (see `inventory`).
+
+    Settings:
+      NETWORKIP_INVENTORY: persist sweeps and probe recently alive hosts first (default True)
+      NETWORKIP_PASSIVE_DISCOVERY: report hosts the kernel neighbor table
+        (ARP / IPv6 neighbor cache) lists as REACHABLE right away instead of
+        pinging them, and ping its other entries first (default True)
+      NETWORKIP_SCAN_CACHE_TIMEOUT: seconds a completed sweep stays fresh (default 60, 0 disables)
+      NETWORKIP_SCAN_CACHE_ALIAS: cache alias to use (default "default")
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, SharedScan] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, "NETWORKIP_SCAN_CACHE_ALIAS", "default")]
+
+    def _finish(self, scan: SharedScan, completed: bool) -> None:
+        if completed:
+            total = scan._last[1] if scan._last else 0
+            timeout = getattr(settings, "NETWORKIP_SCAN_CACHE_TIMEOUT", 60)
+            if timeout:
+                # kept in discovery order, so a client resuming this sweep can skip what it has
+                self.cache.set(scan.key, {"results": scan.discovered(), "total": total, "token": scan.token},
+                               timeout)
+            if getattr(settings, "NETWORKIP_INVENTORY", True):
+                try:
+                    record_sweep(scan.networks, scan.results(), total, scan.started, timezone.now())
+                except Exception:
+                    logger.exception("could not record sweep of %s", scan.networks)
+        with self._lock:
+            if self._inflight.get(scan.key) is scan:
+                del self._inflight[scan.key]
+
+    def _join(self, key: str, networks: Networks, options: Dict) -> SharedScan:
+        with self._lock:
+            scan = self._inflight.get(key)
+            if scan is None or scan._stop.is_set():
+                scan = self._inflight[key] = SharedScan(key, networks, options, self._finish)
+                scan.start()
+                metrics.SWEEPS.inc(outcome="started")
+            else:
+                metrics.SWEEPS.inc(outcome="joined")
+            return scan
+
+    async def cached(self, networks: Networks, **options) -> Optional[Dict]:
+        """The fresh cached result of a sweep, if there is one."""
+        return await self.cache.aget(scan_key(networks, **options))
+
+    async def open(self, networks: Networks, use_cache: bool = True,
+                   **options) -> Tuple[str, AsyncIterator[Tuple[int, int, Dict]]]:
+        """Like `stream`, but also return the token of the sweep being followed.
+
+        Two streams with the same token deliver alive hosts in the same order;
+        a fresh cached result keeps the token of the sweep that produced it.
+        """
+        key = scan_key(networks, **options)
+        if use_cache:
+            cached = await self.cached(networks, **options)
+            if cached is not None:
+                return self.replay(cached)
+        scan = self._join(key, networks, options)
+        return scan.token, scan.subscribe()
+
+    def replay(self, cached: Dict) -> Tuple[str, AsyncIterator[Tuple[int, int, Dict]]]:
+        """`open` for a result the caller already got from `cached`.
+
+        Use it rather than a second lookup, which may find the entry expired
+        and start a sweep the caller holds no admission ticket for.
+        """
+        metrics.SWEEPS.inc(outcome="cached")
+        return cached.get("token", ""), self._replay(cached)
+
+    @staticmethod
+    async def _replay(cached: Dict) -> AsyncIterator[Tuple[int, int, Dict]]:
+        for result in cached["results"]:
+            yield (cached["total"], cached["total"], result)
+
+    async def stream(self, networks: Networks, use_cache: bool = True, **options) -> AsyncIterator[Tuple[int, int, Dict]]:
+        """Yield (current, total, result) for a sweep, attaching to a running one if possible.
+
+        A fresh cached result is replayed as its alive hosts only.
+        """
+        _, events = await self.open(networks, use_cache, **options)
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+
+    async def results(self, networks: Networks, use_cache: bool = True, **options) -> List[Dict]:
+        """Alive hosts of a sweep, sorted by address."""
+        return await _alive_sorted(self.stream(networks, use_cache, **options))
+
+    async def replay_results(self, cached: Dict) -> List[Dict]:
+        """`results` for a result the caller already got from `cached`."""
+        _, events = self.replay(cached)
+        return await _alive_sorted(events)
+
+
+async def _alive_sorted(events: AsyncIterator[Tuple[int, int, Dict]]) -> List[Dict]:
+    alive = [result async for _, _, result in events if result["alive"]]
+    alive.sort(key=ip_sort_key)
+    return alive
+
+
+coordinator = ScanCoordinator()
@@ -0,0 +1,221 @@
+"""HTTP client backends of the internet scanner's probes.
+
+A backend is anything with the `HttpSession` methods: requests.Session
+(`requests_session`) or the dependency-free `StdlibSession`. Probes run on
+worker threads (see internet_scanner.run_probes), so both are blocking
+clients; curl is not a backend but an opt-in cross-check (`CurlBatch`).
+"""
+import base64
+import concurrent.futures
+import http.client
+import ssl
+import subprocess
+import threading
+from typing import Dict, List, Optional, Protocol, Tuple, Union
+from urllib.parse import urljoin, urlsplit
+
+import requests
+import requests.adapters
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+
+# seconds, or (connect, read) as requests takes it
+Timeout = Union[float, Tuple[float, float]]
+
+
+class HttpSession(Protocol):
+    """What the probes use of a client: `get`/`head` with `timeout`, `auth`,
+    `allow_redirects` and `stream`, and `close`."""
+
+    def get(self, url: str, **kwargs): ...
+
+    def head(self, url: str, **kwargs): ...
+
+    def close(self) -> None: ...
+
+
+def requests_session(pool_size: int) -> requests.Session:
+    """requests.Session with a keep-alive pool of `pool_size` connections that blocks when full."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class StdlibResponse:
+    def __init__(self, status_code: int, headers: http.client.HTTPMessage, content: bytes = b""):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def iter_content(self, chunk_size: int = 1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self) -> None:
+        pass
+
+
+class StdlibSession:
+    """Minimal keep-alive HTTP client on `http.client`, call-compatible with the
+    subset of requests.Session the scanner uses (`get`/`head` with `timeout`,
+    `auth`, `allow_redirects` and `stream`).
+
+    Each thread keeps one persistent connection per origin. With
+    `stream=True` only the first `stream_limit` bytes of the body are read;
+    a connection with more left unread is dropped instead of drained.
+    """
+
+    def __init__(self, max_redirects: int = 5, stream_limit: int = 64 * 1024):
+        self.max_redirects = max_redirects
+        self.stream_limit = stream_limit
+        self._local = threading.local()
+        self._connections: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+        self._ssl = ssl.create_default_context()
+
+    def _connection(self, scheme: str, netloc: str, timeout: Timeout) -> http.client.HTTPConnection:
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        conns = self._local.__dict__.setdefault("conns", {})
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(netloc, timeout=connect, context=self._ssl)
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=connect)
+            conns[(scheme, netloc)] = conn
+            with self._lock:
+                self._connections.append(conn)
+        conn.timeout = connect
+        if conn.sock is None:
+            conn.connect()
+        conn.sock.settimeout(read)
+        return conn
+
+    def _drop(self, scheme: str, netloc: str) -> None:
+        conn = self._local.__dict__.get("conns", {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def _send(self, method: str, url: str, headers: Dict[str, str], timeout: Timeout,
+              limit: Optional[int] = None) -> StdlibResponse:
+        parts = urlsplit(url)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        for attempt in range(2):
+            try:
+                conn = self._connection(parts.scheme, parts.netloc, timeout)
+                conn.request(method, target, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read() if limit is None else resp.read(limit)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # the server closed an idle keep-alive connection; retry once on a fresh one
+                self._drop(parts.scheme, parts.netloc)
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                self._drop(parts.scheme, parts.netloc)
+                raise
+            if resp.will_close or (limit is not None and resp.length != 0 and not resp.isclosed()):
+                # the server closes it, or part of the body was left unread
+                self._drop(parts.scheme, parts.netloc)
+            return StdlibResponse(resp.status, resp.headers, body)
+
+    def request(self, method: str, url: str, timeout: Timeout = 5, auth: Optional[Tuple[str, str]] = None,
+                allow_redirects: bool = True, stream: bool = False) -> StdlibResponse:
+        headers = {"User-Agent": "networkip", "Connection": "keep-alive"}
+        if auth is not None:
+            token = base64.b64encode(f"{auth[0]}:{auth[1]}".encode()).decode()
+            headers["Authorization"] = f"Basic {token}"
+        origin = urlsplit(url).netloc
+        for _ in range(self.max_redirects + 1):
+            resp = self._send(method, url, headers, timeout, self.stream_limit if stream else None)
+            location = resp.headers.get("Location")
+            if not allow_redirects or resp.status_code not in _REDIRECTS or not location:
+                return resp
+            url = urljoin(url, location)
+            if resp.status_code == 303:
+                method = "GET"
+            if urlsplit(url).netloc != origin:
+                # like requests: never send credentials to another host
+                headers.pop("Authorization", None)
+        raise http.client.HTTPException(f"more than {self.max_redirects} redirects")
+
+    def get(self, url: str, **kwargs) -> StdlibResponse:
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> StdlibResponse:
+        kwargs.setdefault("allow_redirects", False)
+        return self.request("HEAD", url, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _curl_quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class CurlBatch:
+    """Runs the Basic Auth request for every credential pair of one URL in a single curl process.
+
+    The first caller of `status()` starts curl with a config file holding one
+    `next`-separated transfer per pair; curl reuses its connection between
+    them. Everyone else waits for that run and reads their pair's status.
+    """
+
+    def __init__(self, url: str, credentials: List[Tuple[str, str]], timeout: float = 6):
+        self.url = url
+        self.credentials = list(credentials)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._future: Optional[concurrent.futures.Future] = None
+
+    def _config(self) -> str:
+        sections = []
+        for username, password in self.credentials:
+            sections.append("\n".join([
+                "silent",
+                f'url = "{_curl_quote(self.url)}"',
+                f'user = "{_curl_quote(f"{username}:{password}")}"',
+                'output = "/dev/null"',
+                'write-out = "%{http_code}\\n"',
+                f"max-time = {self.timeout}",
+            ]))
+        return "\nnext\n".join(sections) + "\n"
+
+    def _run(self) -> Dict[Tuple[str, str], Optional[int]]:
+        proc = subprocess.run(["curl", "--config", "-"], input=self._config(), capture_output=True, text=True,
+                              timeout=self.timeout * len(self.credentials) + 5)
+        codes = proc.stdout.split()
+        statuses: Dict[Tuple[str, str], Optional[int]] = {}
+        for i, pair in enumerate(self.credentials):
+            code = codes[i] if i < len(codes) else ""
+            statuses[pair] = int(code) if code.isdigit() and code != "000" else None
+        return statuses
+
+    def status(self, username: str, password: str) -> Optional[int]:
+        """HTTP status curl got for this pair (None if the transfer failed).
+
+        Raises FileNotFoundError if curl is not installed.
+        """
+        with self._lock:
+            owner = self._future is None
+            if owner:
+                self._future = concurrent.futures.Future()
+        if owner:
+            try:
+                self._future.set_result(self._run())
+            except BaseException as e:
+                self._future.set_exception(e)
+        return self._future.result().get((username, password))
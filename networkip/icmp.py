@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+import os
+import socket
+import struct
+from typing import Dict, Optional, Tuple
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+
+_PAYLOAD = b"networkip-sweep\x00"
+
+
+def _checksum(data: bytes) -> int:
+    """RFC 1071 internet checksum."""
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _echo_request(family: int, ident: int, seq: int) -> bytes:
+    if family == socket.AF_INET6:
+        # the kernel fills in the ICMPv6 checksum (it covers the pseudo header)
+        return struct.pack("!BBHHH", ICMPV6_ECHO_REQUEST, 0, 0, ident, seq) + _PAYLOAD
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    csum = _checksum(header + _PAYLOAD)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, csum, ident, seq) + _PAYLOAD
+
+
+def open_icmp_socket(family: int = socket.AF_INET) -> Tuple[socket.socket, bool]:
+    """Open a non-blocking ICMP socket for `family`.
+
+    Tries an unprivileged datagram ICMP socket first (needs
+    net.ipv4.ping_group_range to include our gid), then a raw socket
+    (needs root or CAP_NET_RAW). Returns (sock, is_raw); raises OSError
+    when neither is permitted.
+    """
+    proto = socket.IPPROTO_ICMPV6 if family == socket.AF_INET6 else socket.IPPROTO_ICMP
+    try:
+        sock = socket.socket(family, socket.SOCK_DGRAM, proto)
+        raw = False
+    except OSError:
+        sock = socket.socket(family, socket.SOCK_RAW, proto)
+        raw = True
+    try:
+        # a /24 worth of replies arrives in one burst; don't let the kernel drop them
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    except OSError:
+        pass
+    sock.setblocking(False)
+    return sock, raw
+
+
+_available: Dict[int, bool] = {}
+
+
+def icmp_available(family: int = socket.AF_INET) -> bool:
+    """True if this process may open an ICMP socket (result is cached)."""
+    if family not in _available:
+        try:
+            sock, _ = open_icmp_socket(family)
+            sock.close()
+            _available[family] = True
+        except OSError:
+            _available[family] = False
+    return _available[family]
+
+
+class IcmpPinger:
+    """Sends echo requests through one socket per address family and matches replies.
+
+    Replies are matched by sequence number (and identifier on raw sockets,
+    which see every ICMP packet on the host). Must be used from a single
+    event loop; call `close()` when done.
+    """
+
+    name = "icmp"
+
+    def __init__(self, timeout: float = 0.5, retries: int = 1):
+        self.timeout = timeout
+        self.retries = retries
+        self._ident = (os.getpid() ^ id(self)) & 0xFFFF
+        self._seq = itertools.count(1)
+        self._pending: Dict[Tuple[int, int], Tuple[str, asyncio.Future]] = {}
+        self._sockets: Dict[int, Tuple[socket.socket, bool]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _socket(self, family: int) -> Tuple[socket.socket, bool]:
+        if family not in self._sockets:
+            sock, raw = open_icmp_socket(family)
+            self._loop = asyncio.get_running_loop()
+            self._loop.add_reader(sock.fileno(), self._on_readable, family, sock, raw)
+            self._sockets[family] = (sock, raw)
+        return self._sockets[family]
+
+    def _on_readable(self, family: int, sock: socket.socket, raw: bool) -> None:
+        while True:
+            try:
+                data, addr = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if family == socket.AF_INET:
+                if raw:
+                    data = data[(data[0] & 0x0F) * 4:]
+                reply_type = ICMP_ECHO_REPLY
+            else:
+                reply_type = ICMPV6_ECHO_REPLY
+            if len(data) < 8 or data[0] != reply_type:
+                continue
+            ident, seq = struct.unpack("!HH", data[4:8])
+            # datagram sockets get their identifier rewritten by the kernel and
+            # only ever see their own replies, so the sequence is enough there
+            if raw and ident != self._ident:
+                continue
+            entry = self._pending.get((family, seq))
+            if entry is None:
+                continue
+            ip, fut = entry
+            if addr[0].split('%')[0] != ip.split('%')[0]:
+                continue
+            if not fut.done():
+                fut.set_result(True)
+
+    async def ping(self, ip: str) -> bool:
+        """Return True if `ip` answers an echo request within the timeout."""
+        loop = asyncio.get_running_loop()
+        try:
+            family, _, _, _, sockaddr = socket.getaddrinfo(
+                ip, 0, type=socket.SOCK_DGRAM, flags=socket.AI_NUMERICHOST)[0]
+        except socket.gaierror:
+            return False
+        try:
+            sock, _ = self._socket(family)
+        except OSError:
+            return False
+
+        for _ in range(self.retries + 1):
+            seq = next(self._seq) & 0xFFFF
+            key = (family, seq)
+            fut = loop.create_future()
+            self._pending[key] = (ip, fut)
+            try:
+                await loop.sock_sendto(sock, _echo_request(family, self._ident, seq), sockaddr)
+                return await asyncio.wait_for(fut, self.timeout)
+            except asyncio.TimeoutError:
+                continue
+            except OSError:
+                # EHOSTUNREACH, ENETUNREACH, EACCES (broadcast) ...
+                return False
+            finally:
+                self._pending.pop(key, None)
+        return False
+
+    def close(self) -> None:
+        for sock, _ in self._sockets.values():
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.remove_reader(sock.fileno())
+            sock.close()
+        self._sockets.clear()
+        for _, fut in self._pending.values():
+            fut.cancel()
+        self._pending.clear()
@@ -1,20 +1,39 @@
+import concurrent.futures
+import functools
+import hashlib
+import os
+import re
 import socket
 import requests
 import subprocess
-try:
-    import paramiko
-    HAS_PARAMIKO = True
-except Exception:
-    paramiko = None
-    HAS_PARAMIKO = False
-
-from typing import Dict, List, Generator, Tuple
-from urllib.parse import urlparse
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from typing import Callable, Dict, List, Generator, Iterator, NamedTuple, Optional, Sequence, Tuple, Union
+from urllib.parse import quote, urlparse
 import warnings
 
-if HAS_PARAMIKO:
+from django.conf import settings
+
+from . import metrics
+from .admission import PROBE_BUDGET
+from .httpclient import CurlBatch, HttpSession, StdlibSession, requests_session
+from .results import (Analysis, BackdoorFile, Finding, FtpAccess, HttpAccess, HttpBasicAuth, ProbeResult, Skipped,
+                      SshAccess)
+
+
+@functools.lru_cache(maxsize=None)
+def _paramiko():
+    # paramiko pulls in cryptography; only the first SSH probe pays for that
+    try:
+        import paramiko
+    except Exception:
+        return None
     # Suppress paramiko warnings when installed
     warnings.filterwarnings("ignore", category=DeprecationWarning)
+    return paramiko
 
 # Common default credentials to test
 DEFAULT_CREDENTIALS = [
@@ -31,382 +50,721 @@ DEFAULT_CREDENTIALS = [
     ("user", "user"),
 ]
 
-# Common backdoor file paths to check
-BACKDOOR_FILES = [
-    "/shell.php",
-    "/backdoor.php",
-    "/cmd.php",
-    "/.htaccess",
-    "/config.php",
-    "/webshell.php",
-    "/admin.php",
-    "/wp-admin/",
-    "/phpmyadmin/",
-    "/.env",
-    "/web.config",
-]
+# Sensitive-path dictionaries: names of lists in networkip/paths/ ("backdoor",
+# "common") or paths to own files, comma-separated; NETWORKIP_PATH_LISTS
+# selects them. The "backdoor" list holds the paths of the former
+# BACKDOOR_FILES constant; test_backdoor_files() is gone as well, every path
+# is now a probe of its own (see build_probes / test_backdoor_file).
+PATH_LIST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "paths")
+DEFAULT_PATH_LISTS = "backdoor"
+
+# soft-404 detection: a response this close in size to the "not found" page of
+# the same status counts as that page (dynamic tokens change the body hash)
+SOFT_404_MIN_SLACK = 16
+SOFT_404_SLACK = 0.02
+# only this much of a sensitive path's body is downloaded and fingerprinted
+FINGERPRINT_BYTES = 64 * 1024
+
+# Probe concurrency: at most PER_TARGET_LIMIT probes against one host (across
+# all scans of that host), GLOBAL_PROBE_LIMIT in the whole process, and
+# FAMILY_LIMITS per probe family so e.g. SSH logins don't trip MaxStartups.
+GLOBAL_PROBE_LIMIT = 32
+PER_TARGET_LIMIT = 8
+FAMILY_LIMITS = {
+    "http": 4,
+    "backdoor": 4,
+    "ssh": 2,
+    "ftp": 2,
+}
+
+# Keep-alive connections per scan; matches the most HTTP probes that can run at once
+HTTP_POOL_SIZE = FAMILY_LIMITS["http"] + FAMILY_LIMITS["backdoor"]
+
+# HTTP client for the probes (NETWORKIP_HTTP_BACKEND): "requests" or "stdlib"
+# (http.client, no extra dependency). NETWORKIP_CURL_CROSS_CHECK repeats the
+# Basic Auth checks with curl (one curl process per scan).
+DEFAULT_HTTP_BACKEND = "requests"
+
+# Pre-flight: one TCP connect per probe family decides whether the family runs at all
+PREFLIGHT_TIMEOUT = 3.0
+FAMILY_PORTS = {"ssh": 22, "ftp": 21}
+FAMILY_LABELS = {
+    "http": "HTTP-Tests",
+    "backdoor": "Datei-Prüfungen",
+    "ssh": "SSH-Tests",
+    "ftp": "FTP-Tests",
+}
+# Adaptive probe timeouts: connecting gets RTT_FACTOR x the measured connect
+# time, clamped to [MIN, MAX]; waiting for the application's answer gets MAX,
+# since a slow login page says nothing about the network
+MIN_PROBE_TIMEOUT = 1.0
+MAX_PROBE_TIMEOUT = 5.0
+RTT_FACTOR = 10
+
+# seconds, or (connect, read) as requests takes it
+ProbeTimeout = Union[float, Tuple[float, float]]
+
+_REALM_RE = re.compile(r'realm="([^"]*)"', re.IGNORECASE)
+
+_global_slots = threading.BoundedSemaphore(GLOBAL_PROBE_LIMIT)
+_target_slots: "weakref.WeakValueDictionary[str, threading.BoundedSemaphore]" = weakref.WeakValueDictionary()
+_target_slots_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def load_paths(lists: str = DEFAULT_PATH_LISTS) -> Tuple[str, ...]:
+    """Paths of the comma-separated `lists`, in order and without duplicates.
+
+    Each entry is a list name from PATH_LIST_DIR or a file path; files hold one
+    path per line, blank lines and "#" comments are ignored.
+    """
+    paths: Dict[str, None] = {}
+    for name in filter(None, (n.strip() for n in lists.split(","))):
+        filename = name if os.sep in name or name.endswith(".txt") else os.path.join(PATH_LIST_DIR, f"{name}.txt")
+        with open(filename, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    paths["/" + line.lstrip("/")] = None
+    return tuple(paths)
+
+
+def make_session(backend: str = DEFAULT_HTTP_BACKEND, pool_size: int = HTTP_POOL_SIZE) -> HttpSession:
+    """Session with keep-alive connections for one scan's HTTP probes.
+
+    With the requests backend the pool blocks instead of opening extra
+    connections, so every probe of a scan reuses the same few TCP/TLS
+    connections.
+    """
+    if backend == "requests":
+        return requests_session(pool_size)
+    if backend == "stdlib":
+        return StdlibSession(stream_limit=FINGERPRINT_BYTES)
+    raise ValueError(f"unknown HTTP backend: {backend!r}")
 
 
-def test_http_access(url: str) -> Dict:
+def test_http_access(url: str, session: Optional[HttpSession] = None, timeout: ProbeTimeout = 5) -> HttpAccess:
     """Test if a URL is accessible and returns status."""
+    http = session or requests
+    try:
+        resp = http.get(url, timeout=timeout, allow_redirects=False)
+        return HttpAccess(url, resp.status_code, dict(resp.headers))
+    except Exception as e:
+        return HttpAccess(url, error=str(e))
+
+
+def probe_auth_challenge(url: str, session: Optional[HttpSession] = None, timeout: ProbeTimeout = 5) -> Dict:
+    """Request `url` without credentials and describe the auth challenge, if any."""
+    http = session or requests
+    try:
+        resp = http.get(url, timeout=timeout)
+    except Exception as e:
+        return {"url": url, "error": str(e)}
+    challenge = resp.headers.get("WWW-Authenticate", "")
+    realm = _REALM_RE.search(challenge)
+    return {
+        "url": url,
+        "status_code": resp.status_code,
+        "auth_required": resp.status_code == 401,
+        "scheme": challenge.split(" ", 1)[0] or None,
+        "realm": realm.group(1) if realm else None,
+        "server": resp.headers.get("Server"),
+    }
+
+
+def _path_kind(path: str) -> str:
+    # servers often answer unknown directories, scripts and other files differently
+    if path.endswith("/"):
+        return "/"
+    return os.path.splitext(path.rsplit("/", 1)[-1])[1].lower()
+
+
+def _get_prefix(http, url: str, timeout: ProbeTimeout):
+    """GET `url` without following redirects; return the response and at most FINGERPRINT_BYTES of its body.
+
+    The rest of the body is never downloaded (sensitive paths include whole
+    site backups and database dumps).
+    """
+    resp = http.get(url, timeout=timeout, allow_redirects=False, stream=True)
+    prefix = b""
     try:
-        resp = requests.get(url, timeout=5, allow_redirects=False)
-        return {
-            "type": "http_access",
-            "url": url,
-            "status_code": resp.status_code,
-            "accessible": resp.status_code < 400,
-            "headers": dict(resp.headers),
-        }
+        for chunk in resp.iter_content(FINGERPRINT_BYTES):
+            prefix += chunk
+            if len(prefix) >= FINGERPRINT_BYTES:
+                break
+    finally:
+        resp.close()
+    return resp, prefix[:FINGERPRINT_BYTES]
+
+
+def _fingerprint(resp, prefix: bytes, path: str) -> Dict:
+    """Status, size and body hash of a response whose body starts with `prefix`.
+
+    Echoes of the requested path are removed from the body and the redirect
+    target first, so a "not found" page naming the path still matches. The
+    size of a body longer than the prefix comes from Content-Length.
+    """
+    length = len(prefix)
+    if length >= FINGERPRINT_BYTES:
+        declared = resp.headers.get("Content-Length", "")
+        if declared.isdigit():
+            length = max(length, int(declared))
+    body = prefix
+    location = resp.headers.get("Location", "")
+    for echo in {path, quote(path)}:
+        body = body.replace(echo.encode(), b"")
+        location = location.replace(echo, "")
+    return {
+        "status_code": resp.status_code,
+        "length": length,
+        "body_length": length - (len(prefix) - len(body)),
+        "sha256": hashlib.sha256(body).hexdigest(),
+        "location": location,
+    }
+
+
+def probe_not_found(base_url: str, kind: str, session: Optional[HttpSession] = None, timeout: ProbeTimeout = 5) -> Dict:
+    """Fingerprint of the target's answer for a random path that cannot exist (ending in `kind`)."""
+    http = session or requests
+    path = f"/{uuid.uuid4().hex}{kind}"
+    try:
+        resp, prefix = _get_prefix(http, base_url + path, timeout)
     except Exception as e:
-        return {
-            "type": "http_access",
-            "url": url,
-            "accessible": False,
-            "error": str(e),
-        }
+        return {"path": path, "error": str(e)}
+    return {"path": path, **_fingerprint(resp, prefix, path)}
+
 
+def is_soft_404(fingerprint: Dict, baseline: Optional[Dict]) -> bool:
+    """True if `fingerprint` is the target's generic "not found" answer rather than the path itself."""
+    if not baseline or "error" in baseline or fingerprint["status_code"] != baseline["status_code"]:
+        return False
+    if fingerprint["sha256"] == baseline["sha256"]:
+        return True
+    if 300 <= fingerprint["status_code"] < 400:
+        # everything redirects to the same place (e.g. a login page)
+        return fingerprint["location"] == baseline["location"]
+    slack = max(SOFT_404_MIN_SLACK, baseline["body_length"] * SOFT_404_SLACK)
+    return abs(fingerprint["body_length"] - baseline["body_length"]) <= slack
 
-def test_http_basic_auth(url: str, username: str, password: str) -> Dict:
+
+class ProbeCache:
+    """Per-scan memo of unauthenticated probes, so each URL is asked only once.
+
+    Safe to share between concurrently running probes: callers asking for a
+    URL that is still being probed wait for that single request.
+    """
+
+    def __init__(self, session: Optional[HttpSession] = None, timeout: ProbeTimeout = 5):
+        self.session = session
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._results: Dict[Tuple[str, str], concurrent.futures.Future] = {}
+
+    def _once(self, key: Tuple[str, str], func: Callable[[], Dict]) -> Dict:
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = concurrent.futures.Future()
+        if owner:
+            try:
+                future.set_result(func())
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    def auth_challenge(self, url: str) -> Dict:
+        return self._once(("challenge", url), lambda: probe_auth_challenge(url, self.session, self.timeout))
+
+    def not_found(self, base_url: str, path: str) -> Dict:
+        """The soft-404 baseline for paths shaped like `path` (directory, extension)."""
+        kind = _path_kind(path)
+        return self._once(("not_found", f"{base_url}{kind}"),
+                          lambda: probe_not_found(base_url, kind, self.session, self.timeout))
+
+
+def test_http_basic_auth(url: str, username: str, password: str, session: Optional[HttpSession] = None,
+                         probes: Optional[ProbeCache] = None, timeout: ProbeTimeout = 5) -> HttpBasicAuth:
     """Test HTTP Basic Auth with given credentials."""
+    http = session or requests
     try:
         # First, test without auth to see if auth is required
-        resp_no_auth = requests.get(url, timeout=5)
-        if resp_no_auth.status_code != 401:
+        challenge = probes.auth_challenge(url) if probes else probe_auth_challenge(url, session, timeout)
+        if "error" in challenge:
+            return HttpBasicAuth(url, username, password, error=challenge["error"])
+        if not challenge["auth_required"]:
             # No auth required, so credentials don't matter
-            return {
-                "type": "http_basic_auth",
-                "url": url,
-                "username": username,
-                "password": password,
-                "status_code": resp_no_auth.status_code,
-                "success": False,
-                "auth_required": False,
-            }
-        
+            return HttpBasicAuth(url, username, password, status_code=challenge["status_code"], auth_required=False)
+
         # Auth is required, now test with credentials
-        resp = requests.get(url, auth=(username, password), timeout=5)
-        success = resp.status_code < 400
-        return {
-            "type": "http_basic_auth",
-            "url": url,
-            "username": username,
-            "password": password,
-            "status_code": resp.status_code,
-            "success": success,
-            "auth_required": True,
-        }
+        resp = http.get(url, auth=(username, password), timeout=timeout)
+        return HttpBasicAuth(url, username, password, status_code=resp.status_code, auth_required=True,
+                             success=resp.status_code < 400)
     except Exception as e:
-        return {
-            "type": "http_basic_auth",
-            "url": url,
-            "username": username,
-            "password": password,
-            "error": str(e),
-        }
-
-def test_http_basic_auth_curl(url: str, username: str, password: str) -> Dict:
-    """Attempt HTTP Basic Auth using system `curl`. Falls back to requests if curl fehlt."""
+        return HttpBasicAuth(url, username, password, error=str(e))
+
+def test_http_basic_auth_curl(url: str, username: str, password: str,
+                              session: Optional[HttpSession] = None,
+                              probes: Optional[ProbeCache] = None, batch: Optional[CurlBatch] = None) -> HttpBasicAuth:
+    """Attempt HTTP Basic Auth using system `curl`. Falls back to requests if curl fehlt.
+
+    With a `batch`, the authenticated request is part of one shared curl run
+    instead of a curl process of its own.
+    """
     try:
-        # First, test without auth
-        cmd_no_auth = [
-            "curl",
-            "-s",
-            "-o", "/dev/null",
-            "-w", "%{http_code}",
-            url,
-        ]
-        proc_no_auth = subprocess.run(cmd_no_auth, capture_output=True, text=True, timeout=6)
-        stdout_no_auth = proc_no_auth.stdout.strip()
-        status_no_auth = int(stdout_no_auth) if stdout_no_auth.isdigit() else None
+        # First, test without auth (reusing the scan's probe if there is one)
+        if probes is not None:
+            status_no_auth = probes.auth_challenge(url).get("status_code")
+        else:
+            cmd_no_auth = [
+                "curl",
+                "-s",
+                "-o", "/dev/null",
+                "-w", "%{http_code}",
+                url,
+            ]
+            proc_no_auth = subprocess.run(cmd_no_auth, capture_output=True, text=True, timeout=6)
+            stdout_no_auth = proc_no_auth.stdout.strip()
+            status_no_auth = int(stdout_no_auth) if stdout_no_auth.isdigit() else None
         if status_no_auth != 401:
             # No auth required
-            return {
-                "type": "http_basic_auth",
-                "method": "curl",
-                "url": url,
-                "username": username,
-                "password": password,
-                "status_code": status_no_auth,
-                "success": False,
-                "auth_required": False,
-            }
+            return HttpBasicAuth(url, username, password, method="curl", status_code=status_no_auth,
+                                 auth_required=False)
         
         # Auth required, test with credentials
-        cmd = [
-            "curl",
-            "-s",
-            "-o", "/dev/null",
-            "-w", "%{http_code}",
-            "-u", f"{username}:{password}",
-            url,
-        ]
-        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=6)
-        stdout = proc.stdout.strip()
-        status_code = int(stdout) if stdout.isdigit() else None
+        if batch is not None:
+            status_code = batch.status(username, password)
+        else:
+            cmd = [
+                "curl",
+                "-s",
+                "-o", "/dev/null",
+                "-w", "%{http_code}",
+                "-u", f"{username}:{password}",
+                url,
+            ]
+            proc = subprocess.run(cmd, capture_output=True, text=True, timeout=6)
+            stdout = proc.stdout.strip()
+            status_code = int(stdout) if stdout.isdigit() else None
         success = (status_code is not None and status_code < 400)
-        return {
-            "type": "http_basic_auth",
-            "method": "curl",
-            "url": url,
-            "username": username,
-            "password": password,
-            "status_code": status_code,
-            "success": success,
-            "auth_required": True,
-        }
+        return HttpBasicAuth(url, username, password, method="curl", status_code=status_code, auth_required=True,
+                             success=success)
     except FileNotFoundError:
         # curl not available, fallback
-        return {"type": "http_basic_auth", "method": "curl", "error": "curl not installed"}
+        return HttpBasicAuth(url, username, password, method="curl", error="curl not installed")
     except Exception:
         # fallback to requests implementation if anything goes wrong
-        return test_http_basic_auth(url, username, password)
+        return test_http_basic_auth(url, username, password, session, probes)
 
 
-def test_backdoor_files(base_url: str) -> List[Dict]:
-    """Check for common backdoor/sensitive files."""
-    results = []
+def test_backdoor_file(base_url: str, path: str, session: Optional[HttpSession] = None, timeout: ProbeTimeout = 5,
+                       probes: Optional[ProbeCache] = None) -> BackdoorFile:
+    """Check whether a single backdoor/sensitive file is reachable.
+
+    With `probes`, the path is fetched with GET and compared against the
+    target's answer for a random missing path of the same shape, so servers
+    answering 200 (or redirecting) for everything do not report every path.
+    Without it a HEAD request decides by status alone.
+    """
+    http = session or requests
     parsed = urlparse(base_url)
-    base = f"{parsed.scheme}://{parsed.netloc}"
+    origin = f"{parsed.scheme}://{parsed.netloc}"
+    url = origin + path
+    try:
+        if probes is None:
+            resp = http.head(url, timeout=timeout, allow_redirects=False)
+            return BackdoorFile(path, url, resp.status_code, found=resp.status_code < 400)
+        baseline = probes.not_found(origin, path)
+        resp, prefix = _get_prefix(http, url, timeout)
+        fingerprint = _fingerprint(resp, prefix, path)
+        soft_404 = is_soft_404(fingerprint, baseline)
+        return BackdoorFile(path, url, resp.status_code, found=resp.status_code < 400 and not soft_404,
+                            soft_404=soft_404, length=fingerprint["length"], sha256=fingerprint["sha256"],
+                            baseline_status=baseline.get("status_code"))
+    except Exception as e:
+        return BackdoorFile(path, url, error=str(e))
 
-    for path in BACKDOOR_FILES:
-        url = base + path
-        try:
-            resp = requests.head(url, timeout=5, allow_redirects=False)
-            found = resp.status_code < 400
-            results.append({
-                "type": "backdoor_file",
-                "path": path,
-                "url": url,
-                "status_code": resp.status_code,
-                "found": found,
-            })
-        except Exception as e:
-            results.append({
-                "type": "backdoor_file",
-                "path": path,
-                "url": url,
-                "error": str(e),
-            })
-
-    return results
-
-
-def test_ssh_access(host: str, username: str, password: str, port: int = 22) -> Dict:
+
+def test_ssh_access(host: str, username: str, password: str, port: int = 22, timeout: ProbeTimeout = 5) -> SshAccess:
     """Test SSH access with given credentials. If paramiko is not installed, return an explanatory error."""
-    if not HAS_PARAMIKO:
-        return {
-            "type": "ssh_access",
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-            "success": False,
-            "error": "paramiko not installed",
-        }
+    paramiko = _paramiko()
+    if paramiko is None:
+        return SshAccess(host, port, username, password, error="paramiko not installed")
 
     try:
         client = paramiko.SSHClient()
         client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(host, port=port, username=username, password=password, timeout=5)
+        connect, read = _split_timeout(timeout)
+        client.connect(host, port=port, username=username, password=password, timeout=connect,
+                       banner_timeout=read, auth_timeout=read)
         client.close()
-        return {
-            "type": "ssh_access",
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-            "success": True,
-        }
+        return SshAccess(host, port, username, password, success=True)
     except paramiko.AuthenticationException:
-        return {
-            "type": "ssh_access",
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-            "success": False,
-            "reason": "Authentication failed",
-        }
+        return SshAccess(host, port, username, password, reason="Authentication failed")
     except Exception as e:
-        return {
-            "type": "ssh_access",
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-            "error": str(e),
-        }
+        return SshAccess(host, port, username, password, error=str(e))
 
 
-def test_ftp_access(host: str, username: str, password: str, port: int = 21) -> Dict:
+def test_ftp_access(host: str, username: str, password: str, port: int = 21, timeout: ProbeTimeout = 5) -> FtpAccess:
     """Test FTP access with given credentials."""
     try:
         from ftplib import FTP
         ftp = FTP()
-        ftp.connect(host, port, timeout=5)
+        # one socket timeout covers connect, banner and login alike
+        ftp.connect(host, port, timeout=_split_timeout(timeout)[1])
         ftp.login(username, password)
         ftp.quit()
-        return {
-            "type": "ftp_access",
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-            "success": True,
-        }
+        return FtpAccess(host, port, username, password, success=True)
     except Exception as e:
-        return {
-            "type": "ftp_access",
-            "host": host,
-            "port": port,
-            "username": username,
-            "password": password,
-            "success": False,
-            "error": str(e),
-        }
-
-
-def scan_internet_security(url: str) -> Generator[Tuple[int, str, Dict], None, None]:
-    """Generator that tests various security vulnerabilities on a URL.
+        return FtpAccess(host, port, username, password, error=str(e))
 
-    Yields: (step_num, description, result_dict)
+
+def preflight(host: str, ports: Dict[str, int], timeout: float = PREFLIGHT_TIMEOUT) -> Dict[str, Dict]:
+    """TCP-connect to every family's port in parallel.
+
+    Returns {family: {"port", "reachable", "rtt" | "reason"}}.
     """
-    parsed = urlparse(url if url.startswith(('http://', 'https://')) else f"http://{url}")
-    host = parsed.netloc.split(':')[0]
-    base_url = f"{parsed.scheme}://{parsed.netloc}"
+    def connect(port: int) -> Dict:
+        start = time.perf_counter()
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return {"port": port, "reachable": True, "rtt": time.perf_counter() - start}
+        except ConnectionRefusedError:
+            reason = "Verbindung abgelehnt"
+        except socket.timeout:
+            reason = "Zeitüberschreitung"
+        except OSError as e:
+            reason = e.strerror or str(e)
+        return {"port": port, "reachable": False, "reason": reason}
+
+    unique_ports = sorted(set(ports.values()))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(unique_ports)) as executor:
+        by_port = dict(zip(unique_ports, executor.map(connect, unique_ports)))
+    return {family: by_port[port] for family, port in ports.items()}
+
+
+def adaptive_timeout(rtt: Optional[float]) -> Tuple[float, float]:
+    """(connect, read) probe timeout; only the connect part follows a measured connect RTT."""
+    if rtt is None:
+        return MAX_PROBE_TIMEOUT, MAX_PROBE_TIMEOUT
+    return min(MAX_PROBE_TIMEOUT, max(MIN_PROBE_TIMEOUT, rtt * RTT_FACTOR)), MAX_PROBE_TIMEOUT
+
+
+def _split_timeout(timeout: ProbeTimeout) -> Tuple[float, float]:
+    return timeout if isinstance(timeout, tuple) else (timeout, timeout)
+
+
+class Probe(NamedTuple):
+    step: int
+    description: str
+    family: str
+    func: Callable[..., ProbeResult]
+    args: Tuple
+
+
+def _skipped(result: Skipped) -> Skipped:
+    return result
+
+
+def build_probes(base_url: str, host: str, session: Optional[HttpSession] = None,
+                 probes: Optional[ProbeCache] = None, auth_challenge: Optional[Dict] = None,
+                 curl_batch: Optional[CurlBatch] = None,
+                 reachability: Optional[Dict[str, Dict]] = None,
+                 paths: Optional[Sequence[str]] = None) -> List[Probe]:
+    """All probes of a scan in their canonical order, each with its fixed `step`.
+
+    The plain access check comes first so its connection (and TLS handshake)
+    is already pooled when the credential and path probes start. If
+    `auth_challenge` shows the target does not ask for credentials, the
+    Basic Auth phase is replaced by a single "skipped" result. The curl
+    cross-check probes are only added when a `curl_batch` is given.
+
+    With `reachability` (see `preflight`), families whose port is closed are
+    replaced by a "skipped" result and the others get RTT-based timeouts.
+    `paths` are the sensitive paths to check (default: `load_paths()`).
+
+    Steps are numbered over the full list before anything is skipped, so a
+    probe keeps its step whatever else is left out; a skipped result takes
+    the first step of the range it replaces and names the last one in
+    `last_step`.
+    """
+    reachability = reachability or {}
 
-    step = 0
+    def status(family: str) -> Optional[Dict]:
+        # the file checks go to the same port as the HTTP checks
+        return reachability.get("http" if family == "backdoor" else family)
 
-    # Step 1: Test basic accessibility
-    step += 1
-    r = test_http_access(base_url)
-    r['analysis'] = analyze_result(r, "Teste HTTP-Zugriff")
-    yield (step, "Teste HTTP-Zugriff", r)
+    def timeout(family: str) -> Tuple[float, float]:
+        st = status(family)
+        return adaptive_timeout(st.get("rtt") if st else None)
 
-    # Step 2-N: Test HTTP Basic Auth with default credentials (requests + curl)
-    for username, password in DEFAULT_CREDENTIALS:
-        step += 1
-        r1 = test_http_basic_auth(base_url, username, password)
-        r1['analysis'] = analyze_result(r1, f"Teste HTTP Basic Auth (requests): {username}/{password}")
-        yield (step, f"Teste HTTP Basic Auth (requests): {username}/{password}", r1)
-
-        step += 1
-        r2 = test_http_basic_auth_curl(base_url, username, password)
-        r2['analysis'] = analyze_result(r2, f"Teste HTTP Basic Auth (curl): {username}/{password}")
-        yield (step, f"Teste HTTP Basic Auth (curl): {username}/{password}", r2)
-
-    # Step N+1: Check for backdoor files
-    step += 1
-    backdoor_results = test_backdoor_files(base_url)
-    for result in backdoor_results:
-        result['analysis'] = analyze_result(result, f"Prüfe Datei: {result.get('path', '?')}")
-        yield (step, f"Prüfe Datei: {result.get('path', '?')}", result)
-        step += 1
-
-    # Step N+2: Try SSH access
-    for username, password in DEFAULT_CREDENTIALS:
-        step += 1
-        r = test_ssh_access(host, username, password)
-        r['analysis'] = analyze_result(r, f"Teste SSH: {username}/{password}")
-        yield (step, f"Teste SSH: {username}/{password}", r)
+    def unreachable(family: str) -> Optional[Skipped]:
+        st = status(family)
+        if st is None or st["reachable"]:
+            return None
+        reason = f'Port {st["port"]} nicht erreichbar ({st["reason"]})'
+        return Skipped(FAMILY_LABELS[family], family, reason, port=st["port"])
+
+    # (specs, skipped): every phase in canonical order; `skipped` replaces the phase
+    phases: List[Tuple[List[Tuple], Optional[Skipped]]] = []
 
-    # Step N+3: Try FTP access
+    http_skipped = unreachable("http")
+    phases.append(([("Teste HTTP-Zugriff", "http", test_http_access, (base_url, session, timeout("http")))],
+                   http_skipped))
+
+    # HTTP Basic Auth with default credentials (requests + curl)
+    basic_auth = []
     for username, password in DEFAULT_CREDENTIALS:
-        step += 1
-        r = test_ftp_access(host, username, password)
-        r['analysis'] = analyze_result(r, f"Teste FTP: {username}/{password}")
-        yield (step, f"Teste FTP: {username}/{password}", r)
-
-
-def analyze_result(result: Dict, description: str) -> Dict:
-    """Produce a small analysis with severity and remediation suggestions for a scan result."""
-    sev = 'info'
-    summary = 'Keine Aktion nötig'
-    remediation: List[str] = []
-
-    t = result.get('type')
-
-    if t == 'http_basic_auth':
-        # success true indicates credentials worked, but only if auth was required
-        if result.get('auth_required') and result.get('success'):
-            user = result.get('username', '?')
-            pwd = result.get('password', '?')
-            sev = 'high'
-            summary = f'✗ Anmeldung möglich mit: {user} / {pwd}'
-            method = result.get('method', 'requests')
-            if method == 'curl':
-                cmd_example = f'curl -u {user}:{pwd} {result.get("url", "")}'
-            else:
-                cmd_example = f'requests.get("{result.get("url", "")}", auth=("{user}", "{pwd}"))'
-            remediation = [
-                f'Sofort Passwort für "{user}" ändern oder Account deaktivieren',
-                'HTTPS erzwingen, Basic-Auth hinter zusätzlicher Auth oder VPN betreiben',
-                'Logs auf verdächtige Aktivitäten prüfen',
-                f'Beispiel-Befehl: {cmd_example}',
-            ]
-        elif result.get('auth_required') and not result.get('success'):
-            sev = 'info'
-            summary = f'Zugang verweigert ({result.get("username", "?")} / {result.get("password", "?")})'
-        elif not result.get('auth_required'):
-            sev = 'info'
-            summary = f'Keine Auth erforderlich ({result.get("username", "?")} / {result.get("password", "?")})'
-        elif result.get('error'):
-            sev = 'warning'
-            summary = 'Fehler beim Test: ' + str(result.get('error'))
-
-    elif t == 'backdoor_file':
-        path = result.get('path', '?')
-        url = result.get('url', '?')
-        if result.get('found'):
-            sev = 'critical'
-            status = result.get('status_code', '?')
-            summary = f'✗ Datei erreichbar: {path} (HTTP {status})'
-            remediation = [
-                f'Sofort "{path}" aus Webroot entfernen/sperren',
-                'Gegebenenfalls Server isolieren und forensisch untersuchen',
-                'Alle Secrets/Keys/Passwörter rotieren',
-                f'Zugriff testen: curl {url} oder requests.get("{url}")',
-            ]
-        else:
-            sev = 'info'
-            summary = f'Datei nicht erreichbar: {path}'
-
-    elif t == 'http_access':
-        sc = result.get('status_code')
-        if sc and sc < 400:
-            sev = 'info'
-            summary = f'HTTP erreichbar (Status {sc})'
-            remediation = ['HTTPS erzwingen, Header prüfen (HSTS)']
-        else:
-            sev = 'info'
-            summary = f'Nicht erreichbar oder Fehler (Status {sc})'
-
-    elif t in ('ssh_access', 'ftp_access'):
-        proto = t.split("_")[0].upper()
-        user = result.get('username', '?')
-        pwd = result.get('password', '?')
-        if result.get('success'):
-            sev = 'critical'
-            summary = f'✗ {proto} Anmeldung möglich mit: {user} / {pwd}'
-            remediation = [
-                f'Sofort Passwort für "{user}" ändern oder Account sperren',
-                'Passwort-Authentifizierung deaktivieren (SSH) und nur Schlüssel verwenden',
-                'Zugriffs-Ports beschränken und Logins prüfen',
-            ]
-        elif result.get('error') == 'paramiko not installed':
-            sev = 'info'
-            summary = f'{proto}-Test übersprungen (paramiko fehlt)'
+        basic_auth.append((f"Teste HTTP Basic Auth (requests): {username}/{password}", "http",
+                           test_http_basic_auth,
+                           (base_url, username, password, session, probes, timeout("http"))))
+        if curl_batch is not None:
+            basic_auth.append((f"Teste HTTP Basic Auth (curl): {username}/{password}", "http",
+                               test_http_basic_auth_curl,
+                               (base_url, username, password, session, probes, curl_batch)))
+    basic_auth_skipped = http_skipped
+    if basic_auth_skipped is None and auth_challenge is not None and not auth_challenge.get("auth_required"):
+        if "error" in auth_challenge:
+            reason = f'Fehler beim Abruf: {auth_challenge["error"]}'
         else:
-            sev = 'info'
-            summary = f'{proto} Zugang nicht möglich ({user} / {pwd})'
+            reason = f'keine Anmeldung verlangt (HTTP {auth_challenge.get("status_code")})'
+        basic_auth_skipped = Skipped("HTTP Basic Auth", "http", reason, url=base_url,
+                                     status_code=auth_challenge.get("status_code"))
+    phases.append((basic_auth, basic_auth_skipped))
+
+    # backdoor files
+    phases.append(([(f"Prüfe Datei: {path}", "backdoor", test_backdoor_file,
+                     (base_url, path, session, timeout("backdoor"), probes))
+                    for path in paths or load_paths()], unreachable("backdoor")))
+
+    # SSH and FTP access
+    phases.append(([(f"Teste SSH: {username}/{password}", "ssh", test_ssh_access,
+                     (host, username, password, FAMILY_PORTS["ssh"], timeout("ssh")))
+                    for username, password in DEFAULT_CREDENTIALS], unreachable("ssh")))
+    phases.append(([(f"Teste FTP: {username}/{password}", "ftp", test_ftp_access,
+                     (host, username, password, FAMILY_PORTS["ftp"], timeout("ftp")))
+                    for username, password in DEFAULT_CREDENTIALS], unreachable("ftp")))
+
+    result = []
+    step = 1
+    for specs, skipped in phases:
+        first, step = step, step + len(specs)
+        if not specs:
+            continue
+        if skipped is None:
+            result.extend(Probe(first + n, *spec) for n, spec in enumerate(specs))
+            continue
+        # a closed port stands for several phases in a row: one result covers them
+        if skipped.last_step is None:
+            result.append(Probe(first, f"{skipped.label} übersprungen: {skipped.reason}", skipped.family,
+                                _skipped, (skipped,)))
+        skipped.last_step = step - 1
+    return result
+
+
+def _target_semaphore(host: str, limit: int) -> threading.BoundedSemaphore:
+    with _target_slots_lock:
+        sem = _target_slots.get(host)
+        if sem is None:
+            sem = _target_slots[host] = threading.BoundedSemaphore(limit)
+        return sem
+
+
+def _probe_outcome(result: ProbeResult) -> str:
+    if result.skipped:
+        return "skipped"
+    if not result.error:
+        return "ok"
+    return "timeout" if "timed out" in result.error.lower() else "error"
+
+
+def _run_probe(probe: Probe, target_slots: threading.BoundedSemaphore) -> ProbeResult:
+    with target_slots, _global_slots, PROBE_BUDGET, metrics.PROBES_IN_FLIGHT.track(family=probe.family):
+        start = time.perf_counter()
+        r = probe.func(*probe.args)
+        elapsed = time.perf_counter() - start
+    outcome = _probe_outcome(r)
+    metrics.PROBES.inc(family=probe.family, outcome=outcome)
+    if outcome != "skipped":
+        metrics.PROBE_SECONDS.observe(elapsed, family=probe.family, type=r.type)
+    return r
+
+
+def run_probes(probes: List[Probe], host: str, per_target: int = PER_TARGET_LIMIT,
+               family_limits: Dict[str, int] = FAMILY_LIMITS) -> Iterator[Tuple[Probe, ProbeResult]]:
+    """Run probes concurrently and yield (probe, result) in completion order.
+
+    Families are scheduled round-robin so independent checks (HTTP, SSH, FTP)
+    overlap; each family is capped by `family_limits`, the target by
+    `per_target` and the process by GLOBAL_PROBE_LIMIT. Closing the iterator
+    drops probes that have not started yet.
+    """
+    target_slots = _target_semaphore(host, per_target)
+    queues: Dict[str, deque] = {}
+    for probe in probes:
+        queues.setdefault(probe.family, deque()).append(probe)
+    running = {family: 0 for family in queues}
+    futures: Dict[concurrent.futures.Future, Probe] = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=per_target, thread_name_prefix="networkip-probe")
+
+    def fill():
+        submitted = True
+        while submitted and len(futures) < per_target:
+            submitted = False
+            for family, queue in queues.items():
+                if queue and running[family] < family_limits.get(family, per_target) and len(futures) < per_target:
+                    probe = queue.popleft()
+                    running[family] += 1
+                    futures[executor.submit(_run_probe, probe, target_slots)] = probe
+                    submitted = True
 
-    else:
-        summary = 'Unbekannter Befund'
+    try:
+        fill()
+        while futures:
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in done:
+                probe = futures.pop(fut)
+                running[probe.family] -= 1
+                fill()
+                yield probe, fut.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def scan_internet_security(url: str, http_backend: Optional[str] = None, curl_cross_check: Optional[bool] = None,
+                           path_lists: Optional[str] = None) -> Generator[Tuple[int, str, ProbeResult], None, None]:
+    """Generator that tests various security vulnerabilities on a URL.
 
-    return {
-        'severity': sev,
-        'summary': summary,
-        'remediation': remediation,
-        'description': description,
-    }
+    Probes run concurrently (see `run_probes`), so results arrive in
+    completion order; `step_num` is the probe's fixed position in the scan.
+    All HTTP probes of one run share a pooled keep-alive session, and the
+    unauthenticated request behind the Basic Auth checks is made only once.
+    `http_backend`, `curl_cross_check` and `path_lists` default to the
+    NETWORKIP_HTTP_BACKEND, NETWORKIP_CURL_CROSS_CHECK and NETWORKIP_PATH_LISTS
+    settings.
+    Sensitive paths are judged against a per-target soft-404 fingerprint (see
+    `test_backdoor_file`).
+
+    A pre-flight TCP connect to the HTTP, SSH and FTP ports runs first;
+    families on closed or filtered ports are reported as skipped instead of
+    waiting out every probe's timeout.
+
+    Yields: (step_num, description, result_dict)
+    """
+    parsed = urlparse(url if url.startswith(('http://', 'https://')) else f"http://{url}")
+    host = parsed.netloc.split(':')[0]
+    base_url = f"{parsed.scheme}://{parsed.netloc}"
+    http_port = parsed.port or (443 if parsed.scheme == "https" else 80)
+
+    reachability = preflight(host, {"http": http_port, **FAMILY_PORTS})
+
+    if http_backend is None:
+        http_backend = getattr(settings, "NETWORKIP_HTTP_BACKEND", DEFAULT_HTTP_BACKEND)
+    if curl_cross_check is None:
+        curl_cross_check = getattr(settings, "NETWORKIP_CURL_CROSS_CHECK", False)
+    if path_lists is None:
+        path_lists = getattr(settings, "NETWORKIP_PATH_LISTS", DEFAULT_PATH_LISTS)
+    curl_batch = CurlBatch(base_url, DEFAULT_CREDENTIALS) if curl_cross_check else None
+
+    with make_session(http_backend) as session:
+        probes = ProbeCache(session, adaptive_timeout(reachability["http"].get("rtt")))
+        challenge = probes.auth_challenge(base_url) if reachability["http"]["reachable"] else None
+        plan = build_probes(base_url, host, session, probes, challenge, curl_batch, reachability,
+                            load_paths(path_lists))
+        for probe, r in run_probes(plan, host):
+            yield (probe.step, probe.description, r)
+
+
+def vulnerability_report(step: int, description: str, result: ProbeResult) -> Optional[Finding]:
+    """The reportable vulnerability behind a probe result, or None if the probe found nothing."""
+    if result.skipped:
+        return None
+    analysis = analyze_result(result)
+    # Only report real vulnerabilities (success or found)
+    is_vulnerable = (
+        getattr(result, 'success', False) or
+        getattr(result, 'found', False) or
+        analysis.severity in ('high', 'critical')
+    )
+    if not is_vulnerable:
+        return None
+    return Finding(step, description, result, analysis)
+
+
+def _analyze_skipped(result: Skipped) -> Analysis:
+    return Analysis(summary=f'{result.label} übersprungen: {result.reason}')
+
+
+def _analyze_http_basic_auth(result: HttpBasicAuth) -> Analysis:
+    user, pwd = result.username, result.password
+    if result.error:
+        return Analysis('warning', 'Fehler beim Test: ' + result.error)
+    if not result.auth_required:
+        return Analysis(summary=f'Keine Auth erforderlich ({user} / {pwd})')
+    if not result.success:
+        return Analysis(summary=f'Zugang verweigert ({user} / {pwd})')
+    # credentials worked on a resource that asks for them
+    if result.method == 'curl':
+        cmd_example = f'curl -u {user}:{pwd} {result.url}'
+    else:
+        cmd_example = f'requests.get("{result.url}", auth=("{user}", "{pwd}"))'
+    return Analysis('high', f'✗ Anmeldung möglich mit: {user} / {pwd}', [
+        f'Sofort Passwort für "{user}" ändern oder Account deaktivieren',
+        'HTTPS erzwingen, Basic-Auth hinter zusätzlicher Auth oder VPN betreiben',
+        'Logs auf verdächtige Aktivitäten prüfen',
+        f'Beispiel-Befehl: {cmd_example}',
+    ])
+
+
+def _analyze_backdoor_file(result: BackdoorFile) -> Analysis:
+    path, url = result.path, result.url
+    if result.found:
+        return Analysis('critical', f'✗ Datei erreichbar: {path} (HTTP {result.status_code})', [
+            f'Sofort "{path}" aus Webroot entfernen/sperren',
+            'Gegebenenfalls Server isolieren und forensisch untersuchen',
+            'Alle Secrets/Keys/Passwörter rotieren',
+            f'Zugriff testen: curl {url} oder requests.get("{url}")',
+        ])
+    if result.soft_404:
+        return Analysis(summary=f'Datei nicht erreichbar: {path} (Server antwortet auf unbekannte Pfade '
+                                f'ebenfalls mit HTTP {result.status_code})')
+    return Analysis(summary=f'Datei nicht erreichbar: {path}')
+
+
+def _analyze_http_access(result: HttpAccess) -> Analysis:
+    if result.accessible:
+        return Analysis(summary=f'HTTP erreichbar (Status {result.status_code})',
+                        remediation=['HTTPS erzwingen, Header prüfen (HSTS)'])
+    return Analysis(summary=f'Nicht erreichbar oder Fehler (Status {result.status_code})')
+
+
+def _analyze_login(result: Union[SshAccess, FtpAccess]) -> Analysis:
+    proto = result.type.split("_")[0].upper()
+    user, pwd = result.username, result.password
+    if result.success:
+        return Analysis('critical', f'✗ {proto} Anmeldung möglich mit: {user} / {pwd}', [
+            f'Sofort Passwort für "{user}" ändern oder Account sperren',
+            'Passwort-Authentifizierung deaktivieren (SSH) und nur Schlüssel verwenden',
+            'Zugriffs-Ports beschränken und Logins prüfen',
+        ])
+    if result.error == 'paramiko not installed':
+        return Analysis(summary=f'{proto}-Test übersprungen (paramiko fehlt)')
+    return Analysis(summary=f'{proto} Zugang nicht möglich ({user} / {pwd})')
+
+
+ANALYZERS: Dict[type, Callable[..., Analysis]] = {
+    Skipped: _analyze_skipped,
+    HttpBasicAuth: _analyze_http_basic_auth,
+    BackdoorFile: _analyze_backdoor_file,
+    HttpAccess: _analyze_http_access,
+    SshAccess: _analyze_login,
+    FtpAccess: _analyze_login,
+}
+
+
+def analyze_result(result: ProbeResult) -> Analysis:
+    """Severity, summary and remediation suggestions for a probe result."""
+    analyzer = ANALYZERS.get(type(result))
+    if analyzer is None:
+        return Analysis(summary='Unbekannter Befund')
+    return analyzer(result)
@@ -0,0 +1,99 @@
+import ipaddress
+import itertools
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Host, ScanRun
+from .networkscanner import Networks, iter_hosts, parse_networks
+
+# rows per INSERT ... ON CONFLICT / UPDATE statement
+BATCH_SIZE = 500
+# hosts seen alive within this window are probed first
+RECENT_WINDOW = timedelta(days=7)
+
+
+def _network_names(networks: Networks) -> List[str]:
+    return [str(net) for net in parse_networks(networks)]
+
+
+def _host_dict(host: Dict) -> Dict:
+    return {
+        "ip": host["address"],
+        "hostname": host["hostname"] or "-",
+        "alive": host["alive"],
+        "last_seen": host["last_seen"].isoformat(),
+    }
+
+
+def _known_queryset(networks: Networks):
+    return (Host.objects.filter(network__in=_network_names(networks), alive=True)
+            .order_by("-last_seen")
+            .values("address", "hostname", "alive", "last_seen"))
+
+
+async def aknown_hosts(networks: Networks) -> List[Dict]:
+    """Hosts currently considered alive in `networks`, most recently seen first."""
+    return [_host_dict(h) async for h in _known_queryset(networks)]
+
+
+def prioritized_hosts(networks: Networks, window: timedelta = RECENT_WINDOW) -> Iterator[str]:
+    """Every address of `networks`, with hosts alive within `window` first.
+
+    The remaining addresses follow lazily in network order; only the recent
+    set is held in memory. The query runs here, not on first iteration, so
+    the iterator can be consumed from an event loop.
+    """
+    recent = list(Host.objects.filter(network__in=_network_names(networks),
+                                      last_seen__gte=timezone.now() - window)
+                  .order_by("-last_seen")
+                  .values_list("address", flat=True))
+    seen = set(recent)
+    return itertools.chain(recent, (ip for ip in iter_hosts(networks) if ip not in seen))
+
+
+def _chunks(items: List, size: int) -> Iterator[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def record_sweep(networks: Networks, alive: List[Dict], probed: int, started: datetime,
+                 finished: datetime) -> ScanRun:
+    """Persist a completed sweep: upsert alive hosts, mark vanished ones, log the run.
+
+    Everything is written in batches inside one transaction.
+    """
+    nets = parse_networks(networks)
+    names = [str(net) for net in nets]
+
+    def network_of(ip: str) -> str:
+        addr = ipaddress.ip_address(ip)
+        return next((str(net) for net in nets if addr in net), names[0])
+
+    alive_ips = {r["ip"] for r in alive}
+    with transaction.atomic():
+        previously = set(Host.objects.filter(network__in=names, alive=True).values_list("address", flat=True))
+        Host.objects.bulk_create(
+            [Host(network=network_of(r["ip"]), address=r["ip"],
+                  hostname="" if r.get("hostname", "-") == "-" else r["hostname"],
+                  alive=True, first_seen=finished, last_seen=finished, last_checked=finished)
+             for r in alive],
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["network", "address"],
+            update_fields=["hostname", "alive", "last_seen", "last_checked"],
+        )
+        gone = sorted(previously - alive_ips)
+        for batch in _chunks(gone, BATCH_SIZE):
+            Host.objects.filter(network__in=names, address__in=batch).update(alive=False, last_checked=finished)
+        return ScanRun.objects.create(
+            networks=",".join(names)[:255],
+            started=started,
+            finished=finished,
+            probed=probed,
+            alive_count=len(alive_ips),
+            appeared=len(alive_ips - previously),
+            disappeared=len(gone),
+        )
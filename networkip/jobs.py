@@ -0,0 +1,364 @@
+import heapq
+import itertools
+import json
+import logging
+import math
+import re
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.utils import timezone
+
+from . import metrics
+from .admission import Overloaded, Ticket, admission
+from .aio import iter_sync
+from .coordinator import coordinator, scan_key
+from .networkscanner import Networks, checked_host_count, ip_sort_key
+from .results import to_json
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# a running job's state reaches the shared cache at most this often (seconds)
+PUBLISH_INTERVAL = 1.0
+_JOB_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+class QueueFull(Overloaded):
+    pass
+
+
+class Job:
+    """A scan running (or waiting to run) outside any request.
+
+    Events are appended to `events` and never rewritten, so a reader can
+    follow a job by remembering how many it has seen.
+    """
+
+    def __init__(self, kind: str, target: str, params: Dict, priority: int = 0):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.target = target
+        self.params = params
+        self.priority = priority
+        self.state = QUEUED
+        self.created = timezone.now()
+        self.started = None
+        self.finished = None
+        self.events: List[Dict] = []
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.cancelled = threading.Event()
+        # set by the registry: publishes the job's state for other worker processes
+        self.changed: Callable[["Job"], None] = lambda job: None
+        self.published = 0.0
+        self._progress: Tuple[int, int] = (0, 0)
+
+    @property
+    def progress(self) -> Tuple[int, int]:
+        return self._progress
+
+    @progress.setter
+    def progress(self, value: Tuple[int, int]) -> None:
+        self._progress = value
+        self.changed(self)
+
+    def emit(self, event: Dict) -> None:
+        self.events.append(event)
+        self.changed(self)
+
+    @property
+    def done(self) -> bool:
+        return self.state in FINISHED
+
+    def to_dict(self, with_result: bool = False) -> Dict:
+        data = {
+            "id": self.id,
+            "kind": self.kind,
+            "target": self.target,
+            "state": self.state,
+            "priority": self.priority,
+            "created": self.created.isoformat(),
+            "started": self.started.isoformat() if self.started else None,
+            "finished": self.finished.isoformat() if self.finished else None,
+            "progress": self.progress[0],
+            "total": self.progress[1],
+            "events": len(self.events),
+        }
+        if self.error:
+            data["error"] = self.error
+        if with_result and self.result is not None:
+            data["result"] = self.result
+        return data
+
+    def snapshot(self) -> Dict:
+        """Status, result and events as plain JSON data, as other processes see the job."""
+        data = {"job": self.to_dict(with_result=True), "events": self.events}
+        return json.loads(json.dumps(data, default=to_json))
+
+
+def run_sweep(job: Job) -> Dict:
+    alive = []
+    total = 0
+    scan = iter_sync(coordinator.stream(job.params["networks"]))
+    try:
+        for current, total, result in scan:
+            if job.cancelled.is_set():
+                break
+            job.progress = (current, total)
+            if result.get("alive"):
+                alive.append(result)
+                job.emit({"alive": result})
+    finally:
+        # leaving the sweep early stops it if nobody else is watching
+        scan.close()
+    alive.sort(key=ip_sort_key)
+    return {"results": alive, "total": total}
+
+
+def run_internet_scan(job: Job) -> Dict:
+    # the internet scanner (requests, paramiko) is loaded by the first such job
+    from .internet_scanner import scan_internet_security, vulnerability_report
+
+    url = job.params["url"]
+    vulnerabilities = []
+    skipped = []
+    scan = scan_internet_security(url)
+    try:
+        for n, (step, description, result) in enumerate(scan, start=1):
+            if job.cancelled.is_set():
+                break
+            job.progress = (n, 0)
+            if result.skipped:
+                note = {"step": step, "last_step": result.last_step, "description": description}
+                skipped.append(note)
+                job.emit({"skipped": note})
+                continue
+            vuln = vulnerability_report(step, description, result)
+            if vuln is not None:
+                vulnerabilities.append(vuln)
+                job.emit({"vulnerability": vuln})
+    finally:
+        scan.close()
+    return {"url": url, "vulnerabilities": vulnerabilities, "skipped": skipped}
+
+
+RUNNERS: Dict[str, Callable[[Job], Dict]] = {
+    "sweep": run_sweep,
+    "internet": run_internet_scan,
+}
+
+
+class JobRegistry:
+    """Queue and worker threads for scan jobs, plus the finished jobs kept for later retrieval.
+
+    Jobs start in priority order (higher first, then submission order). Only
+    a limited number of jobs run against the same networks or host at a time;
+    a job whose target is busy waits without blocking the jobs behind it.
+    A job then takes an admission ticket like a scan started from a page, so
+    it counts against (and waits in) the same scan queue.
+
+    Jobs run on threads of the process that accepted them; there is no
+    process pool. Sweeps are asyncio I/O and the internet probes block on
+    sockets, so extra processes would not scan faster, and their jobs could
+    not be pickled. To use more processes, run more server workers. Every
+    job's state is published to the configured cache, so any worker can
+    answer a status or events poll and take a cancel request. The job list
+    covers the answering worker's jobs only.
+
+    Settings:
+      NETWORKIP_JOB_WORKERS: worker threads (default 4)
+      NETWORKIP_JOB_QUEUE_SIZE: jobs allowed to wait (default 100)
+      NETWORKIP_JOB_MAX_PER_TARGET: concurrent jobs per network/host (default 1)
+      NETWORKIP_JOB_RETENTION: seconds a finished job is kept (default 3600)
+      NETWORKIP_JOB_MAX_FINISHED: finished jobs kept at most (default 200)
+      NETWORKIP_JOB_CACHE_ALIAS: cache shared by the worker processes (default "default")
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._queue: List[Tuple[int, int, Job]] = []
+        self._order = itertools.count()
+        self._running: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        # smoothed seconds a job runs, for Retry-After
+        self._hold = 10.0
+
+    def _start_workers(self) -> None:
+        # with the lock held; threads are started lazily so forked servers get their own
+        for n in range(len(self._workers), getattr(settings, "NETWORKIP_JOB_WORKERS", 4)):
+            worker = threading.Thread(target=self._work, name=f"networkip-job-{n}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, kind: str, target: str, params: Dict, priority: int = 0) -> Job:
+        if kind not in RUNNERS:
+            raise ValueError(f"unknown job kind: {kind!r}")
+        job = Job(kind, target, params, priority)
+        job.changed = self._publish
+        with self._cond:
+            self._prune()
+            if len(self._queue) >= getattr(settings, "NETWORKIP_JOB_QUEUE_SIZE", 100):
+                waves = (len(self._queue) + 1) / max(1, getattr(settings, "NETWORKIP_JOB_WORKERS", 4))
+                raise QueueFull(max(1, math.ceil(self._hold * waves)))
+            self._jobs[job.id] = job
+            heapq.heappush(self._queue, (-priority, next(self._order), job))
+            metrics.JOB_QUEUE_DEPTH.set(len(self._queue))
+            self._start_workers()
+            self._cond.notify()
+        self._publish(job, force=True)
+        return job
+
+    def submit_sweep(self, networks: Networks, priority: int = 0) -> Job:
+        checked_host_count(networks)
+        return self.submit("sweep", scan_key(networks), {"networks": networks}, priority)
+
+    def submit_internet_scan(self, url: str, priority: int = 0) -> Job:
+        parsed = urlparse(url if url.startswith(("http://", "https://")) else f"http://{url}")
+        return self.submit("internet", parsed.hostname or url, {"url": url}, priority)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, "NETWORKIP_JOB_CACHE_ALIAS", "default")]
+
+    @staticmethod
+    def _key(job_id: str, part: str = "") -> str:
+        return f"networkip:job:{job_id}{part}"
+
+    def _publish(self, job: Job, force: bool = False) -> None:
+        # also where a cancel request made on another worker reaches the job
+        now = time.monotonic()
+        if not force and now - job.published < PUBLISH_INTERVAL:
+            return
+        job.published = now
+        try:
+            self.cache.set(self._key(job.id), job.snapshot(), getattr(settings, "NETWORKIP_JOB_RETENTION", 3600))
+            if not job.done and self.cache.get(self._key(job.id, ":cancel")):
+                job.cancelled.set()
+        except Exception:
+            logger.exception("could not publish scan job %s", job.id)
+
+    def snapshot(self, job_id: str) -> Optional[Dict]:
+        """`Job.snapshot()` of a job accepted by any worker process, or None."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        if not _JOB_ID_RE.fullmatch(job_id):
+            return None
+        return self.cache.get(self._key(job_id))
+
+    def list(self) -> List[Job]:
+        return sorted(self._jobs.values(), key=lambda job: job.created, reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """Cancel a job wherever it runs; return its snapshot, or None if unknown."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.done:
+                job.cancelled.set()
+                if job.state == QUEUED:
+                    self._queue = [entry for entry in self._queue if entry[2] is not job]
+                    heapq.heapify(self._queue)
+                    metrics.JOB_QUEUE_DEPTH.set(len(self._queue))
+                    self._finish(job, CANCELLED)
+        if job is not None:
+            self._publish(job, force=True)
+            return job.snapshot()
+        shared = self.snapshot(job_id)
+        if shared is not None and shared["job"]["state"] not in FINISHED:
+            # the worker running it picks this up the next time it publishes
+            self.cache.set(self._key(job_id, ":cancel"), True, getattr(settings, "NETWORKIP_JOB_RETENTION", 3600))
+        return shared
+
+    def _next(self) -> Optional[Job]:
+        limit = getattr(settings, "NETWORKIP_JOB_MAX_PER_TARGET", 1)
+        for entry in sorted(self._queue):
+            job = entry[2]
+            if self._running.get(job.target, 0) < limit:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                metrics.JOB_QUEUE_DEPTH.set(len(self._queue))
+                return job
+        return None
+
+    def _finish(self, job: Job, state: str) -> None:
+        job.state = state
+        job.finished = timezone.now()
+        metrics.JOBS.inc(kind=job.kind, state=state)
+
+    def _ticket(self, job: Job) -> Optional[Ticket]:
+        # accepted jobs wait for room in the scan queue instead of failing;
+        # None if the job was cancelled meanwhile
+        key = job.target if job.kind == "sweep" else f"internet:{job.params['url']}"
+        while not job.cancelled.is_set():
+            try:
+                ticket = admission.ticket(key)
+            except Overloaded as e:
+                job.cancelled.wait(e.retry_after)
+                continue
+            if ticket.wait_sync(lambda position: job.emit({"queued": position}), job.cancelled):
+                return ticket
+            ticket.release()
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next()
+                job.state = RUNNING
+                job.started = timezone.now()
+                started = time.monotonic()
+                self._running[job.target] = self._running.get(job.target, 0) + 1
+            self._publish(job, force=True)
+            state = DONE
+            ticket = None
+            try:
+                ticket = self._ticket(job)
+                if ticket is not None:
+                    job.result = RUNNERS[job.kind](job)
+                if job.cancelled.is_set():
+                    state = CANCELLED
+            except Exception as e:
+                logger.exception("scan job %s failed", job.id)
+                job.error = str(e)
+                state = FAILED
+            finally:
+                if ticket is not None:
+                    ticket.release()
+                connections.close_all()
+                with self._cond:
+                    self._finish(job, state)
+                    self._hold = 0.8 * self._hold + 0.2 * (time.monotonic() - started)
+                    self._running[job.target] -= 1
+                    if not self._running[job.target]:
+                        del self._running[job.target]
+                    # a job waiting for this target may be runnable now
+                    self._cond.notify_all()
+                self._publish(job, force=True)
+
+    def _prune(self) -> None:
+        # with the lock held
+        cutoff = time.time() - getattr(settings, "NETWORKIP_JOB_RETENTION", 3600)
+        finished = sorted((job for job in self._jobs.values() if job.done), key=lambda job: job.finished)
+        excess = len(finished) - getattr(settings, "NETWORKIP_JOB_MAX_FINISHED", 200)
+        for n, job in enumerate(finished):
+            if n < excess or job.finished.timestamp() < cutoff:
+                del self._jobs[job.id]
+
+
+registry = JobRegistry()
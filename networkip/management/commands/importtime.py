@@ -0,0 +1,59 @@
+import json
+import re
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# modules that should only be loaded once a scan needs them
+HEAVY_MODULES = ["requests", "urllib3", "paramiko", "cryptography"]
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+class Command(BaseCommand):
+    help = ("Import Django plus the given modules in a fresh interpreter under "
+            "-X importtime and list the slowest imports.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*', default=['projekte.urls'],
+                            help='modules to import after django.setup() (default: projekte.urls)')
+        parser.add_argument('--top', type=int, default=20, help='number of imports to list')
+        parser.add_argument('--json', action='store_true', help='print the report as JSON')
+        parser.add_argument('--check', action='store_true',
+                            help='fail if any of %s got imported' % ', '.join(HEAVY_MODULES))
+
+    def handle(self, *args, **options):
+        code = ("import django, sys; django.setup(); "
+                + "".join(f"import {name}; " for name in options['modules'])
+                + "print(len(sys.modules)); "
+                + f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                              capture_output=True, text=True)
+        if proc.returncode:
+            raise CommandError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'import failed')
+
+        imports = []
+        for line in proc.stderr.splitlines():
+            match = _LINE.match(line)
+            if match:
+                imports.append({'module': match.group(4), 'self_us': int(match.group(1)),
+                                'cumulative_us': int(match.group(2))})
+        total = sum(entry['self_us'] for entry in imports)
+        count, heavy = (proc.stdout.splitlines() + ['', ''])[:2]
+        heavy = heavy.split()
+        top = sorted(imports, key=lambda entry: entry['cumulative_us'], reverse=True)[:options['top']]
+
+        if options['json']:
+            self.stdout.write(json.dumps({'modules': int(count), 'total_us': total,
+                                          'heavy': heavy, 'top': top}, indent=2))
+        else:
+            self.stdout.write(f"{count} modules, {total / 1000:.1f} ms import time")
+            self.stdout.write(f"{'cumulative ms':>14} {'self ms':>9}  module")
+            for entry in top:
+                self.stdout.write(f"{entry['cumulative_us'] / 1000:>14.1f} {entry['self_us'] / 1000:>9.1f}  "
+                                  f"{entry['module']}")
+            self.stdout.write("heavy modules loaded: " + (", ".join(heavy) or "none"))
+
+        if options['check'] and heavy:
+            raise CommandError("loaded at startup: " + ", ".join(heavy))
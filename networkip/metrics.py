@@ -0,0 +1,258 @@
+"""In-process metrics in the Prometheus text format (served at /networkip/metrics/).
+
+Set NETWORKIP_METRICS = False to turn recording off; every recording call
+then returns after a single flag check. The setting is read once, by
+`configure()` when the app is ready.
+"""
+import bisect
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Sequence, Tuple
+
+ENABLED = True
+
+# seconds; spans a cached DNS answer up to a probe running into its timeout
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class _Tracked:
+    __slots__ = ("gauge", "key")
+
+    def __init__(self, gauge: "Gauge", key: Tuple[str, ...]):
+        self.gauge = gauge
+        self.key = key
+
+    def __enter__(self):
+        self.gauge._add(self.key, 1)
+
+    def __exit__(self, *exc):
+        self.gauge._add(self.key, -1)
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullContext()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _add(self, key: Tuple[str, ...], amount: float) -> None:
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if ENABLED:
+            self._add(self._key(labels), amount)
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        if ENABLED:
+            self._add(self._key(labels), -amount)
+
+    def set(self, value: float, **labels) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def track(self, **labels):
+        """Context manager counting the code inside it as in flight."""
+        if not ENABLED:
+            return _NULL
+        return _Tracked(self, self._key(labels))
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class _Timer:
+    __slots__ = ("histogram", "key", "start")
+
+    def __init__(self, histogram: "Histogram", key: Tuple[str, ...]):
+        self.histogram = histogram
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram._observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _observe(self, key: Tuple[str, ...], value: float) -> None:
+        # per-bucket (not cumulative) counts; render() adds them up
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def observe(self, value: float, **labels) -> None:
+        if ENABLED:
+            self._observe(self._key(labels), value)
+
+    def time(self, **labels):
+        """Context manager observing the wall time spent inside it."""
+        if not ENABLED:
+            return _NULL
+        return _Timer(self, self._key(labels))
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def configure() -> None:
+    """Take ENABLED from the NETWORKIP_METRICS setting."""
+    global ENABLED
+    from django.conf import settings
+
+    ENABLED = bool(getattr(settings, "NETWORKIP_METRICS", True))
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# --- metrics of the networkip modules ---------------------------------------
+
+PING_SECONDS = Histogram("networkip_ping_seconds", "Time per ping probe.", ["backend"])
+PINGS = Counter("networkip_pings_total", "Ping probes by outcome (alive, dead, error).", ["backend", "outcome"])
+PINGS_IN_FLIGHT = Gauge("networkip_pings_in_flight", "Ping probes currently outstanding.", ["backend"])
+NEIGHBOR_HITS = Counter("networkip_neighbor_hits_total",
+                        "Hosts the kernel neighbor table confirmed (REACHABLE), so they were not pinged.")
+
+RDNS_SECONDS = Histogram("networkip_rdns_seconds", "Time per reverse DNS lookup (gethostbyaddr).")
+RDNS = Counter("networkip_rdns_total", "Reverse DNS requests by outcome (cached, resolved, unresolved, timeout).",
+               ["outcome"])
+RDNS_IN_FLIGHT = Gauge("networkip_rdns_in_flight", "Reverse DNS lookups running on the resolver pool.")
+
+PROBE_SECONDS = Histogram("networkip_probe_seconds", "Time per internet scanner probe.", ["family", "type"])
+PROBES = Counter("networkip_probes_total", "Internet scanner probes by outcome (ok, error, timeout, skipped).",
+                 ["family", "outcome"])
+PROBES_IN_FLIGHT = Gauge("networkip_probes_in_flight", "Internet scanner probes currently running.", ["family"])
+
+PORT_CHECKS = Counter("networkip_port_checks_total",
+                      "TCP connect checks by outcome (open, closed, timeout, unreachable, error).", ["outcome"])
+
+SWEEPS = Counter("networkip_sweeps_total", "Sweep requests by how they were served (started, joined, cached).",
+                 ["outcome"])
+
+ADMISSION_WAITING = Gauge("networkip_admission_waiting", "Scans queued for an admission slot.")
+ADMISSION_REJECTED = Counter("networkip_admission_rejected_total", "Scans turned away with 429.")
+
+JOB_QUEUE_DEPTH = Gauge("networkip_job_queue_depth", "Scan jobs waiting for a worker.")
+JOBS = Counter("networkip_jobs_total", "Scan jobs by kind and final state.", ["kind", "state"])
+
+STREAM_SECONDS = Histogram("networkip_stream_seconds", "Duration of streamed API responses.", ["endpoint"],
+                           buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+STREAM_LINES = Counter("networkip_stream_lines_total", "NDJSON lines sent by streamed API responses.", ["endpoint"])
+STREAMS_ACTIVE = Gauge("networkip_streams_active", "Streamed API responses currently open.", ["endpoint"])
+
+
+async def instrument_stream(stream: AsyncIterator, endpoint: str) -> AsyncIterator:
+    """Pass `stream` through, recording its duration, line count and open streams."""
+    try:
+        if not ENABLED:
+            async for item in stream:
+                yield item
+            return
+        with STREAMS_ACTIVE.track(endpoint=endpoint), STREAM_SECONDS.time(endpoint=endpoint):
+            async for item in stream:
+                STREAM_LINES.inc(endpoint=endpoint)
+                yield item
+    finally:
+        await stream.aclose()
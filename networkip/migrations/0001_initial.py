@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Host',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('network', models.CharField(max_length=64)),
+                ('address', models.GenericIPAddressField()),
+                ('hostname', models.CharField(blank=True, max_length=255)),
+                ('alive', models.BooleanField(default=True)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('last_checked', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['network', '-last_seen'], name='networkip_host_recent'), models.Index(fields=['address'], name='networkip_host_address'), models.Index(fields=['last_seen'], name='networkip_host_last_seen')],
+                'constraints': [models.UniqueConstraint(fields=('network', 'address'), name='networkip_host_network_address')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ScanRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('networks', models.CharField(max_length=255)),
+                ('started', models.DateTimeField()),
+                ('finished', models.DateTimeField()),
+                ('probed', models.PositiveIntegerField()),
+                ('alive_count', models.PositiveIntegerField()),
+                ('appeared', models.PositiveIntegerField(default=0)),
+                ('disappeared', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['networks', '-finished'], name='networkip_scanrun_recent')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import models
+
+
+class Host(models.Model):
+    """A host that answered a sweep at least once, per swept network."""
+    network = models.CharField(max_length=64)
+    address = models.GenericIPAddressField()
+    hostname = models.CharField(max_length=255, blank=True)
+    alive = models.BooleanField(default=True)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    last_checked = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['network', 'address'], name='networkip_host_network_address'),
+        ]
+        indexes = [
+            models.Index(fields=['network', '-last_seen'], name='networkip_host_recent'),
+            models.Index(fields=['address'], name='networkip_host_address'),
+            models.Index(fields=['last_seen'], name='networkip_host_last_seen'),
+        ]
+
+    def __str__(self):
+        return f"{self.address} ({self.network})"
+
+
+class ScanRun(models.Model):
+    """One completed sweep."""
+    networks = models.CharField(max_length=255)
+    started = models.DateTimeField()
+    finished = models.DateTimeField()
+    probed = models.PositiveIntegerField()
+    alive_count = models.PositiveIntegerField()
+    appeared = models.PositiveIntegerField(default=0)
+    disappeared = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['networks', '-finished'], name='networkip_scanrun_recent'),
+        ]
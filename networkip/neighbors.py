@@ -0,0 +1,143 @@
+"""Hosts the kernel already knows on the local segments.
+
+Entries come from the neighbor cache as listed by `ip -4 neigh` / `ip -6
+neigh`, or from /proc/net/arp (IPv4, without NUD state) if iproute2 is
+missing. Only entries with a link-layer address in a usable state are
+returned; failed and incomplete resolutions are skipped.
+
+Only REACHABLE entries say the host answered recently. Others (STALE in
+particular) can outlive the host by a long time on small networks, where
+the kernel does not garbage-collect below gc_thresh1, so they still need a
+probe.
+"""
+import ipaddress
+import subprocess
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+
+ARP_TABLE = "/proc/net/arp"
+# ATF_COM: the entry has a resolved hardware address; ATF_PERM: added by hand
+_ATF_COM = 0x2
+_ATF_PERM = 0x4
+# NUD states in which the address was answered for at some point
+USABLE_STATES = ("REACHABLE", "STALE", "DELAY", "PROBE", "PERMANENT", "NOARP")
+# NUD states in which the address was confirmed within the last base_reachable_time
+CONFIRMED_STATES = ("REACHABLE",)
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+class Neighbor(NamedTuple):
+    """One table entry; `state` is the NUD state, or COMPLETE/PERMANENT for ARP entries."""
+
+    ip: str
+    mac: str
+    device: str
+    state: str
+
+    @property
+    def confirmed(self) -> bool:
+        """True if the host answered recently enough to count as alive without a probe."""
+        return self.state in CONFIRMED_STATES
+
+
+def read_arp(path: str = ARP_TABLE) -> List[Neighbor]:
+    """Complete entries of the IPv4 ARP table (empty if it cannot be read).
+
+    The table does not tell REACHABLE from STALE, so none of these entries are `confirmed`.
+    """
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()[1:]
+    except OSError:
+        return []
+    neighbors = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 6:
+            continue
+        ip, _, flags, mac, _, device = fields[:6]
+        try:
+            flags = int(flags, 16)
+        except ValueError:
+            continue
+        if flags & _ATF_COM and mac != "00:00:00:00:00:00":
+            state = "PERMANENT" if flags & _ATF_PERM else "COMPLETE"
+            neighbors.append(Neighbor(ip, mac, device, state))
+    return neighbors
+
+
+def _field(fields: List[str], key: str) -> str:
+    # the value following a keyword such as "dev" or "lladdr"
+    index = fields.index(key) + 1 if key in fields else len(fields)
+    return fields[index] if index < len(fields) else ""
+
+
+def parse_ip_neigh(output: str) -> List[Neighbor]:
+    """Parse `ip neigh show` output, e.g. "fe80::1 dev eth0 lladdr 52:54:00:12:34:56 router STALE"."""
+    neighbors = []
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) < 2 or "lladdr" not in fields:
+            continue
+        state = fields[-1]
+        if state not in USABLE_STATES:
+            continue
+        neighbors.append(Neighbor(fields[0], _field(fields, "lladdr"), _field(fields, "dev"), state))
+    return neighbors
+
+
+def _ip_neigh(version: int, timeout: float) -> Optional[List[Neighbor]]:
+    # None if iproute2 is missing or fails
+    try:
+        proc = subprocess.run(["ip", f"-{version}", "neigh", "show"], capture_output=True, text=True,
+                              timeout=timeout)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if proc.returncode:
+        return None
+    return parse_ip_neigh(proc.stdout)
+
+
+def read_ipv4_neighbors(timeout: float = 2.0) -> List[Neighbor]:
+    """Usable entries of the IPv4 neighbor cache, from /proc/net/arp without iproute2."""
+    entries = _ip_neigh(4, timeout)
+    return read_arp() if entries is None else entries
+
+
+def read_ipv6_neighbors(timeout: float = 2.0) -> List[Neighbor]:
+    """Usable entries of the IPv6 neighbor cache (empty without iproute2)."""
+    return _ip_neigh(6, timeout) or []
+
+
+def _is_host(addr: Union[ipaddress.IPv4Address, ipaddress.IPv6Address], net: Network) -> bool:
+    # same addresses as net.hosts(): no network/broadcast (v4) or subnet-router anycast (v6)
+    if addr not in net:
+        return False
+    if net.version == 4 and net.prefixlen < 31:
+        return addr not in (net.network_address, net.broadcast_address)
+    if net.version == 6 and net.prefixlen < 127:
+        return addr != net.network_address
+    return True
+
+
+def neighbors_in(networks: Iterable[Network]) -> Dict[str, Neighbor]:
+    """Neighbor-table entries for host addresses of `networks`, keyed by address.
+
+    Each address family's cache is only read (one `ip` child process) if a
+    network of that family is asked for.
+    """
+    networks = list(networks)
+    entries = []
+    if any(net.version == 4 for net in networks):
+        entries.extend(read_ipv4_neighbors())
+    if any(net.version == 6 for net in networks):
+        entries.extend(read_ipv6_neighbors())
+    found = {}
+    for entry in entries:
+        try:
+            addr = ipaddress.ip_address(entry.ip.split("%", 1)[0])
+        except ValueError:
+            continue
+        if any(_is_host(addr, net) for net in networks):
+            found[str(addr)] = entry
+    return found
@@ -1,98 +1,325 @@
-import concurrent.futures
-import socket
-import subprocess
-from typing import List, Dict, Generator, Tuple
+import asyncio
+import ipaddress
+import itertools
+from typing import AsyncIterator, Iterable, Iterator, List, Dict, Generator, Optional, Tuple, Union
 
+from django.conf import settings
 
-def _ping_ip(ip: str) -> bool:
-    try:
-        # -c 1 : send 1 packet, -W 0.5 : timeout 0.5 second ( Linux )
-        completed = subprocess.run(["ping", "-c", "1", "-W", "0.5", ip],
-                                   stdout=subprocess.DEVNULL,
-                                   stderr=subprocess.DEVNULL)
-        return completed.returncode == 0
-    except Exception:
-        return False
+from . import metrics
+from .admission import PROBE_BUDGET
+from .aio import iter_sync
+from .icmp import IcmpPinger, icmp_available
+from .neighbors import Neighbor, neighbors_in
+from .resolver import ReverseResolver, get_resolver
 
+# refuse to sweep more than this many addresses in one call (e.g. an IPv6 /64)
+MAX_HOSTS = 1 << 16
+
+Networks = Union[str, ipaddress.IPv4Network, ipaddress.IPv6Network,
+                 Iterable[Union[str, ipaddress.IPv4Network, ipaddress.IPv6Network]]]
+
+# "auto" uses an in-process ICMP socket when permitted and falls back to `ping`;
+# NETWORKIP_PING_BACKEND picks another one
+DEFAULT_BACKEND = "auto"
+
+
+class SubprocessPinger:
+    """Fallback backend: one `ping` child process per address."""
+
+    name = "subprocess"
+
+    def __init__(self, timeout: float = 0.5):
+        self.timeout = timeout
+
+    async def ping(self, ip: str) -> bool:
+        try:
+            # -c 1 : send 1 packet, -W : timeout in seconds ( Linux )
+            proc = await asyncio.create_subprocess_exec(
+                "ping", "-c", "1", "-W", str(self.timeout), ip,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL)
+            return await proc.wait() == 0
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        pass
 
-def scan_network(base: str = "192.168.1.", start: int = 1, end: int = 255, max_workers: int = 100) -> List[Dict]:
-    """Scans a range of IPs and returns a list of dicts with ip, hostname and status.
 
-    Fast scan using concurrent pinging and hostname resolution.
-    For full /24 subnet (1-255): ~15-30 seconds depending on network.
+BACKENDS = {
+    "icmp": IcmpPinger,
+    "subprocess": SubprocessPinger,
+}
+
+
+def make_pinger(backend: Optional[str] = None, timeout: float = 0.5):
+    """Instantiate a ping backend by name ("auto", "icmp" or "subprocess").
+
+    `None` means the NETWORKIP_PING_BACKEND setting.
     """
-    start = max(1, int(start))
-    end = min(254, int(end))
-    ips = [f"{base}{i}" for i in range(start, end + 1)]
+    if backend is None:
+        backend = getattr(settings, "NETWORKIP_PING_BACKEND", DEFAULT_BACKEND)
+    if backend == "auto":
+        backend = "icmp" if icmp_available() else "subprocess"
+    try:
+        return BACKENDS[backend](timeout=timeout)
+    except KeyError:
+        raise ValueError(f"unknown ping backend: {backend!r}") from None
 
-    results: List[Dict] = []
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(ips))) as e:
-        futures = {e.submit(_ping_ip, ip): ip for ip in ips}
-        for fut in concurrent.futures.as_completed(futures):
-            ip = futures[fut]
-            alive = False
+async def _probe(pinger, ip: str) -> Tuple[str, bool]:
+    backend = pinger.name
+    # every sweep in the process draws from the same probe budget
+    async with PROBE_BUDGET:
+        with metrics.PINGS_IN_FLIGHT.track(backend=backend), metrics.PING_SECONDS.time(backend=backend):
             try:
-                alive = bool(fut.result())
+                alive = bool(await pinger.ping(ip))
             except Exception:
-                alive = False
+                metrics.PINGS.inc(backend=backend, outcome="error")
+                return ip, False
+    metrics.PINGS.inc(backend=backend, outcome="alive" if alive else "dead")
+    return ip, alive
+
 
-            hostname = "-"
-            if alive:
+async def sweep(ips: Iterable[str], max_in_flight: int = 256, backend: Optional[str] = None,
+                timeout: float = 0.5) -> AsyncIterator[Tuple[str, bool]]:
+    """Async generator yielding (ip, alive) in completion order.
+
+    At most `max_in_flight` probes are outstanding at any time; `ips` is
+    consumed lazily as slots free up.
+    """
+    pinger = make_pinger(backend, timeout)
+    it = iter(ips)
+    pending = {asyncio.ensure_future(_probe(pinger, ip)) for ip in itertools.islice(it, max_in_flight)}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for ip in itertools.islice(it, len(done)):
+                pending.add(asyncio.ensure_future(_probe(pinger, ip)))
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        pinger.close()
+
+
+async def _passive_then_sweep(ips: Iterable[str], neighbors: Dict[str, Neighbor], max_in_flight: int,
+                              backend: str, timeout: float) -> AsyncIterator[Tuple[str, bool]]:
+    # hosts the kernel confirmed recently count as alive without a probe; the
+    # other neighbor entries (STALE ...) may be long gone and are probed first
+    confirmed = [ip for ip, n in neighbors.items() if n.confirmed]
+    for ip in confirmed:
+        yield ip, True
+    metrics.NEIGHBOR_HITS.inc(len(confirmed))
+    unconfirmed = [ip for ip, n in neighbors.items() if not n.confirmed]
+    rest = (ip for ip in ips if ip not in neighbors)
+    probes = sweep(itertools.chain(unconfirmed, rest), max_in_flight=max_in_flight, backend=backend,
+                   timeout=timeout)
+    try:
+        async for pair in probes:
+            yield pair
+    finally:
+        await probes.aclose()
+
+
+async def with_hostnames(pairs: AsyncIterator[Tuple[str, bool]],
+                         resolver: Optional[ReverseResolver] = None) -> AsyncIterator[Dict]:
+    """Pipeline stage turning (ip, alive) pairs into result dicts with reverse-DNS names.
+
+    Lookups for alive hosts run concurrently with the sweep; dead hosts and
+    cache hits pass straight through, so a slow PTR query only delays its own
+    result.
+    """
+    resolver = resolver or get_resolver()
+
+    async def _resolved(ip: str) -> Dict:
+        return {"ip": ip, "hostname": await resolver.alookup(ip), "alive": True}
+
+    upstream = pairs.__aiter__()
+    next_pair = asyncio.ensure_future(upstream.__anext__())
+    lookups = set()
+    try:
+        while next_pair is not None or lookups:
+            waiting = lookups | {next_pair} if next_pair is not None else lookups
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not next_pair:
+                    lookups.discard(task)
+                    yield task.result()
+                    continue
                 try:
-                    hostname = socket.gethostbyaddr(ip)[0]
-                except Exception:
-                    hostname = "-"
+                    ip, alive = task.result()
+                except StopAsyncIteration:
+                    next_pair = None
+                    continue
+                next_pair = asyncio.ensure_future(upstream.__anext__())
+                if not alive:
+                    yield {"ip": ip, "hostname": "-", "alive": False}
+                    continue
+                hit, hostname = resolver.cached(ip)
+                if hit:
+                    yield {"ip": ip, "hostname": hostname, "alive": True}
+                else:
+                    lookups.add(asyncio.ensure_future(_resolved(ip)))
+    finally:
+        pending = lookups | {next_pair} if next_pair is not None else lookups
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        if hasattr(upstream, "aclose"):
+            await upstream.aclose()
+
+
+def parse_networks(networks: Networks) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+    """Normalize a CIDR string, network object or a list of them into network objects."""
+    if isinstance(networks, (str, ipaddress.IPv4Network, ipaddress.IPv6Network)):
+        networks = [networks]
+    return [ipaddress.ip_network(n, strict=False) for n in networks]
+
+
+def _host_count(net: Union[ipaddress.IPv4Network, ipaddress.IPv6Network]) -> int:
+    # mirrors what net.hosts() yields: no network/broadcast (v4) or subnet-router anycast (v6)
+    if net.version == 4:
+        return net.num_addresses if net.prefixlen >= 31 else net.num_addresses - 2
+    return net.num_addresses if net.prefixlen >= 127 else net.num_addresses - 1
+
+
+def count_hosts(networks: Networks) -> int:
+    """Number of addresses `iter_hosts` will produce for `networks`."""
+    return sum(_host_count(net) for net in parse_networks(networks))
+
+
+def iter_hosts(networks: Networks) -> Iterator[str]:
+    """Lazily yield every host address in `networks` as a string."""
+    for net in parse_networks(networks):
+        for addr in net.hosts():
+            yield str(addr)
+
 
-            results.append({"ip": ip, "hostname": hostname, "alive": alive})
+def ip_sort_key(item: Dict) -> Tuple[int, int]:
+    addr = ipaddress.ip_address(item["ip"])
+    return addr.version, int(addr)
 
-    # sort by ip
-    def _ip_key(item: Dict) -> List[int]:
-        parts = item["ip"].split('.')
-        return [int(p) for p in parts]
 
-    results.sort(key=_ip_key)
+def checked_host_count(networks: Networks) -> int:
+    """`count_hosts`, raising ValueError above MAX_HOSTS."""
+    total = count_hosts(networks)
+    if total > MAX_HOSTS:
+        raise ValueError(f"refusing to sweep {total} addresses (limit {MAX_HOSTS})")
+    return total
+
+
+async def _ascan_streaming(ips: Iterable[str], total: int, max_in_flight: int, backend: str,
+                           timeout: float,
+                           neighbors: Optional[Dict[str, Neighbor]] = None) -> AsyncIterator[Tuple[int, int, Dict]]:
+    if neighbors:
+        pairs = _passive_then_sweep(ips, neighbors, max_in_flight, backend, timeout)
+    else:
+        pairs = sweep(ips, max_in_flight=max_in_flight, backend=backend, timeout=timeout)
+    stage = with_hostnames(pairs)
+    processed = 0
+    try:
+        async for result in stage:
+            processed += 1
+            neighbor = neighbors.get(result["ip"]) if neighbors else None
+            if neighbor is not None:
+                result["mac"] = neighbor.mac
+            yield (processed, total, result)
+    finally:
+        await stage.aclose()
+
+
+async def ascan_networks_streaming(networks: Networks, max_in_flight: int = 256, backend: Optional[str] = None,
+                                   timeout: float = 0.5, passive: bool = False) -> AsyncIterator[Tuple[int, int, Dict]]:
+    """Async version of `scan_networks_streaming`.
+
+    Closing or cancelling the iterator (e.g. on client disconnect) stops the
+    sweep: outstanding probes are cancelled and no further addresses are sent.
+    """
+    total = checked_host_count(networks)
+    neighbors = await asyncio.to_thread(neighbors_in, parse_networks(networks)) if passive else None
+    stage = _ascan_streaming(iter_hosts(networks), total, max_in_flight, backend, timeout, neighbors)
+    try:
+        async for item in stage:
+            yield item
+    finally:
+        await stage.aclose()
+
+
+def scan_networks_streaming(networks: Networks, max_in_flight: int = 256, backend: Optional[str] = None,
+                            timeout: float = 0.5, passive: bool = False) -> Generator[Tuple[int, int, Dict], None, None]:
+    """Sweep one or more CIDR blocks, yielding (current, total, result_dict) as probes finish.
+
+    Addresses are generated on demand, so memory use does not depend on the
+    size of the range. Raises ValueError if the ranges exceed MAX_HOSTS.
+
+    With `passive`, hosts the kernel's neighbor table (ARP / IPv6 neighbor
+    cache) lists as REACHABLE are reported first without a probe, other
+    entries of the table are probed first; alive hosts found there carry
+    their "mac".
+    """
+    yield from iter_sync(ascan_networks_streaming(networks, max_in_flight, backend, timeout, passive))
+
+
+def scan_addresses_streaming(ips: Iterable[str], total: int, max_in_flight: int = 256,
+                             backend: Optional[str] = None, timeout: float = 0.5,
+                             neighbors: Optional[Dict[str, Neighbor]] = None
+                             ) -> Generator[Tuple[int, int, Dict], None, None]:
+    """Like `scan_networks_streaming`, for an explicit (e.g. prioritized) address sequence of length `total`.
+
+    Confirmed `neighbors` (see `neighbors.neighbors_in`) are reported alive up
+    front and not probed, the others are probed first; they must be addresses
+    out of `ips`.
+    """
+    yield from iter_sync(_ascan_streaming(ips, total, max_in_flight, backend, timeout, neighbors))
+
+
+def scan_networks(networks: Networks, max_in_flight: int = 256, backend: Optional[str] = None,
+                  timeout: float = 0.5, alive_only: bool = False, passive: bool = False) -> List[Dict]:
+    """Sweep one or more CIDR blocks and return the results sorted by address."""
+    results = [result for _, _, result
+               in scan_networks_streaming(networks, max_in_flight, backend, timeout, passive)
+               if result["alive"] or not alive_only]
+    results.sort(key=ip_sort_key)
+    return results
+
+
+def scan_network(base: str = "192.168.1.", start: int = 1, end: int = 255, max_workers: int = 100) -> List[Dict]:
+    """Scans a range of IPs and returns a list of dicts with ip, hostname and status.
+
+    Kept for callers using the `base` + `start..end` form; see `scan_networks`
+    for CIDR blocks.
+    """
+    results = [result for _, _, result in scan_network_streaming(base, start, end, max_workers)]
+    results.sort(key=ip_sort_key)
     return results
 
 
-def scan_network_streaming(base: str = "192.168.1.", start: int = 1, end: int = 255, max_workers: int = 100) -> Generator[Tuple[int, int, Dict], None, None]:
+def scan_network_streaming(base: str = "192.168.1.", start: int = 1, end: int = 255, max_workers: int = 100,
+                           backend: Optional[str] = None,
+                           passive: bool = False) -> Generator[Tuple[int, int, Dict], None, None]:
     """Generator that yields progress and alive hosts during scanning.
-    
+
     Yields: (current, total, result_dict)
       - current: IP index processed (1-based)
       - total: total IPs to scan
-      - result_dict: {"ip": "...", "hostname": "...", "alive": True/False} or None for progress-only
+      - result_dict: {"ip": "...", "hostname": "...", "alive": True/False}
     """
     start = max(1, int(start))
     end = min(254, int(end))
     ips = [f"{base}{i}" for i in range(start, end + 1)]
-    total = len(ips)
-    processed = 0
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(ips))) as e:
-        futures = {e.submit(_ping_ip, ip): ip for ip in ips}
-        for fut in concurrent.futures.as_completed(futures):
-            processed += 1
-            ip = futures[fut]
-            alive = False
-            try:
-                alive = bool(fut.result())
-            except Exception:
-                alive = False
-
-            hostname = "-"
-            if alive:
-                try:
-                    hostname = socket.gethostbyaddr(ip)[0]
-                except Exception:
-                    hostname = "-"
-
-            result = {"ip": ip, "hostname": hostname, "alive": alive}
-            yield (processed, total, result)
+    neighbors = None
+    if passive and ips:
+        wanted = set(ips)
+        neighbors = {ip: n for ip, n in neighbors_in(parse_networks(f"{ips[0]}/24")).items() if ip in wanted}
+    yield from iter_sync(_ascan_streaming(ips, len(ips), max_workers, backend, 0.5, neighbors))
 
 
 if __name__ == '__main__':
-    # quick manual test when invoked directly
-    for r in scan_network(start=1, end=10):
+    # quick manual test when invoked directly: python -m networkip.networkscanner
+    for r in scan_networks("127.0.0.0/28"):
         print(r)
-
@@ -0,0 +1,208 @@
+"""TCP service discovery for hosts a sweep found alive.
+
+Every check is a non-blocking connect on the running event loop; no threads
+are involved. Checks are bounded per host, per discovery and by the
+process-wide probe budget.
+"""
+import asyncio
+import errno
+import ipaddress
+import socket
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set
+
+from django.conf import settings
+
+from . import metrics
+from .admission import PROBE_BUDGET
+from .aio import iter_sync
+from .networkscanner import ip_sort_key
+
+# ssh, telnet, smtp, dns, http(s) and alternates, pop/imap, smb, rdp, vnc, databases, printers ...
+DEFAULT_SERVICE_PORTS = "21,22,23,25,53,80,110,139,143,443,445,631,993,1883,3306,3389,5432,5900,8080,8443"
+
+# a port list given by a client may not be longer than this
+MAX_PORTS = 1024
+
+
+def parse_ports(value: str) -> List[int]:
+    """Parse "22,80,8000-8010" into a sorted port list; ValueError if invalid or too long."""
+    ports: Set[int] = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        low, high = int(first), int(last or first)
+        if not 0 < low <= high <= 65535:
+            raise ValueError(f"invalid port range: {part!r}")
+        if len(ports) + high - low + 1 > MAX_PORTS:
+            raise ValueError(f"more than {MAX_PORTS} ports")
+        ports.update(range(low, high + 1))
+    if not ports:
+        raise ValueError("no ports given")
+    return sorted(ports)
+
+
+DEFAULT_PORTS = parse_ports(DEFAULT_SERVICE_PORTS)
+
+
+def configured_ports() -> List[int]:
+    """The NETWORKIP_SERVICE_PORTS setting as a port list; ValueError if invalid (see checks.py)."""
+    return parse_ports(getattr(settings, "NETWORKIP_SERVICE_PORTS", DEFAULT_SERVICE_PORTS))
+
+
+async def check_port(ip: str, port: int, timeout: float = 1.0) -> bool:
+    """True if a TCP connection to ip:port is accepted within `timeout`."""
+    family = socket.AF_INET6 if ipaddress.ip_address(ip).version == 6 else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    outcome = "error"
+    try:
+        await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, (ip, port)), timeout)
+        outcome = "open"
+        return True
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        return False
+    except ConnectionRefusedError:
+        outcome = "closed"
+        return False
+    except OSError as e:
+        if e.errno in (errno.EHOSTUNREACH, errno.ENETUNREACH):
+            outcome = "unreachable"
+        return False
+    finally:
+        sock.close()
+        metrics.PORT_CHECKS.inc(outcome=outcome)
+
+
+class ServiceDiscovery:
+    """Checks a port list on every host `add`ed to it, concurrently, on the current event loop.
+
+    At most `max_in_flight` connects are outstanding across all hosts and at
+    most `per_host` against a single host. Finished hosts are collected as
+    {"ip": ..., "open": [ports]} records. Must be used from one event loop;
+    `aclose()` cancels what is still running.
+    """
+
+    def __init__(self, ports: Sequence[int] = DEFAULT_PORTS, max_in_flight: int = 256, per_host: int = 16,
+                 timeout: float = 1.0):
+        self.ports = list(ports)
+        self.per_host = per_host
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._seen: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._finished: List[Dict] = []
+        self._changed = asyncio.Event()
+
+    def add(self, ip: str) -> None:
+        """Start checking `ip` (once; repeated adds are ignored)."""
+        if ip in self._seen:
+            return
+        self._seen.add(ip)
+        task = asyncio.ensure_future(self._scan_host(ip))
+        self._tasks.add(task)
+        task.add_done_callback(self._host_done)
+
+    def _host_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            self._finished.append(task.result())
+        self._changed.set()
+
+    async def _scan_host(self, ip: str) -> Dict:
+        # `per_host` workers share one port iterator, so no more connects than that hit the host
+        ports = iter(self.ports)
+        found = []
+
+        async def worker():
+            for port in ports:
+                async with self._slots, PROBE_BUDGET:
+                    if await check_port(ip, port, self.timeout):
+                        found.append(port)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.per_host, len(self.ports)))))
+        return {"ip": ip, "open": sorted(found)}
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def take(self) -> List[Dict]:
+        """Records of hosts finished since the last call."""
+        records, self._finished = self._finished, []
+        return records
+
+    async def wait(self, timeout: Optional[float] = None) -> None:
+        """Wait until another host finishes (or `timeout` passes)."""
+        self._changed.clear()
+        if self._finished or not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def drain(self) -> AsyncIterator[List[Dict]]:
+        """Yield finished records until every added host is done."""
+        while self._tasks or self._finished:
+            await self.wait()
+            records = self.take()
+            if records:
+                yield records
+
+    async def aclose(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def adiscover_services(ips: AsyncIterable[str], ports: Sequence[int] = DEFAULT_PORTS,
+                             max_in_flight: int = 256, per_host: int = 16,
+                             timeout: float = 1.0) -> AsyncIterator[Dict]:
+    """Check `ports` on each address of `ips` as it arrives; yield a record per host as it finishes."""
+    discovery = ServiceDiscovery(ports, max_in_flight, per_host, timeout)
+    upstream = ips.__aiter__()
+    next_ip = asyncio.ensure_future(upstream.__anext__())
+    try:
+        while next_ip is not None:
+            waiting = {next_ip}
+            if discovery.pending:
+                waiting.add(asyncio.ensure_future(discovery.wait()))
+            await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for task in waiting - {next_ip}:
+                task.cancel()
+            for record in discovery.take():
+                yield record
+            if next_ip.done():
+                try:
+                    discovery.add(next_ip.result())
+                except StopAsyncIteration:
+                    next_ip = None
+                    continue
+                next_ip = asyncio.ensure_future(upstream.__anext__())
+        async for records in discovery.drain():
+            for record in records:
+                yield record
+    finally:
+        if next_ip is not None:
+            next_ip.cancel()
+            await asyncio.gather(next_ip, return_exceptions=True)
+        await discovery.aclose()
+        if hasattr(upstream, "aclose"):
+            await upstream.aclose()
+
+
+def discover_services(ips: Iterable[str], ports: Sequence[int] = DEFAULT_PORTS, max_in_flight: int = 256,
+                      per_host: int = 16, timeout: float = 1.0) -> List[Dict]:
+    """Blocking version of `adiscover_services` for a known address list, sorted by address."""
+    async def source():
+        for ip in ips:
+            yield ip
+
+    records = list(iter_sync(adiscover_services(source(), ports, max_in_flight, per_host, timeout)))
+    records.sort(key=ip_sort_key)
+    return records
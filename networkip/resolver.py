@@ -0,0 +1,115 @@
+import asyncio
+import concurrent.futures
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from . import metrics
+
+
+class ReverseDnsCache:
+    """Thread-safe, size-bounded LRU of PTR answers with separate TTLs for hits and misses."""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 600.0, negative_ttl: float = 120.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data: "OrderedDict[str, Tuple[float, Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ip: str) -> Tuple[bool, Optional[str]]:
+        """Return (hit, hostname); hostname is None for a cached negative answer."""
+        with self._lock:
+            entry = self._data.get(ip)
+            if entry is None:
+                return False, None
+            expires, hostname = entry
+            if expires < time.monotonic():
+                del self._data[ip]
+                return False, None
+            self._data.move_to_end(ip)
+            return True, hostname
+
+    def set(self, ip: str, hostname: Optional[str]) -> None:
+        ttl = self.ttl if hostname is not None else self.negative_ttl
+        with self._lock:
+            self._data[ip] = (time.monotonic() + ttl, hostname)
+            self._data.move_to_end(ip)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class ReverseResolver:
+    """Concurrent reverse lookups on a small thread pool, backed by a ReverseDnsCache.
+
+    `gethostbyaddr` cannot be interrupted, so a lookup that exceeds `timeout`
+    is reported as unresolved but keeps running and still fills the cache
+    when it finally returns.
+    """
+
+    def __init__(self, cache: Optional[ReverseDnsCache] = None, max_workers: int = 16, timeout: float = 2.0):
+        self.cache = cache if cache is not None else ReverseDnsCache()
+        self.timeout = timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix="networkip-rdns")
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, ip: str) -> Optional[str]:
+        with metrics.RDNS_SECONDS.time():
+            try:
+                hostname = socket.gethostbyaddr(ip)[0]
+            except Exception:
+                hostname = None
+        metrics.RDNS.inc(outcome="resolved" if hostname else "unresolved")
+        self.cache.set(ip, hostname)
+        with self._lock:
+            self._inflight.pop(ip, None)
+            metrics.RDNS_IN_FLIGHT.set(len(self._inflight))
+        return hostname
+
+    def _submit(self, ip: str) -> concurrent.futures.Future:
+        # one lookup per address at a time, however many sweeps ask for it
+        with self._lock:
+            future = self._inflight.get(ip)
+            if future is None:
+                future = self._inflight[ip] = self._executor.submit(self._lookup, ip)
+                metrics.RDNS_IN_FLIGHT.set(len(self._inflight))
+            return future
+
+    def cached(self, ip: str) -> Tuple[bool, str]:
+        """Return (hit, hostname) from the cache only; misses and negatives give "-"."""
+        hit, hostname = self.cache.get(ip)
+        if hit:
+            metrics.RDNS.inc(outcome="cached")
+        return hit, hostname or "-"
+
+    async def alookup(self, ip: str) -> str:
+        hit, hostname = self.cached(ip)
+        if hit:
+            return hostname
+        future = asyncio.wrap_future(self._submit(ip))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout) or "-"
+        except asyncio.TimeoutError:
+            metrics.RDNS.inc(outcome="timeout")
+            return "-"
+
+
+_default_resolver: Optional[ReverseResolver] = None
+_default_lock = threading.Lock()
+
+
+def get_resolver() -> ReverseResolver:
+    """Process-wide resolver shared by all sweeps."""
+    global _default_resolver
+    with _default_lock:
+        if _default_resolver is None:
+            _default_resolver = ReverseResolver()
+        return _default_resolver
@@ -0,0 +1,138 @@
+"""Result records of the internet scanner's probes.
+
+Probes return these instead of dicts; they are turned into JSON only at the
+HTTP edge (`to_json`). Serialized records leave out fields that are None.
+"""
+from dataclasses import dataclass, field, fields
+from typing import ClassVar, Dict, List, Optional
+
+
+class ProbeResult:
+    """Base of the result records; `type` names the check, `skipped` marks checks that did not run."""
+
+    __slots__ = ()
+    type: ClassVar[str] = "unknown"
+    skipped: ClassVar[bool] = False
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        data = {"type": self.type}
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if value is not None:
+                data[f.name] = value
+        return data
+
+
+@dataclass(slots=True)
+class HttpAccess(ProbeResult):
+    url: str
+    status_code: Optional[int] = None
+    headers: Optional[Dict[str, str]] = None
+    error: Optional[str] = None
+    type: ClassVar[str] = "http_access"
+
+    @property
+    def accessible(self) -> bool:
+        return self.status_code is not None and self.status_code < 400
+
+
+@dataclass(slots=True)
+class HttpBasicAuth(ProbeResult):
+    url: str
+    username: str
+    password: str
+    method: str = "requests"
+    status_code: Optional[int] = None
+    auth_required: Optional[bool] = None
+    success: bool = False
+    error: Optional[str] = None
+    type: ClassVar[str] = "http_basic_auth"
+
+
+@dataclass(slots=True)
+class BackdoorFile(ProbeResult):
+    path: str
+    url: str
+    status_code: Optional[int] = None
+    found: bool = False
+    # the answer matched the target's response for a path that does not exist
+    soft_404: Optional[bool] = None
+    length: Optional[int] = None
+    sha256: Optional[str] = None
+    baseline_status: Optional[int] = None
+    error: Optional[str] = None
+    type: ClassVar[str] = "backdoor_file"
+
+
+@dataclass(slots=True)
+class LoginAccess(ProbeResult):
+    host: str
+    port: int
+    username: str
+    password: str
+    success: bool = False
+    reason: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass(slots=True)
+class SshAccess(LoginAccess):
+    type: ClassVar[str] = "ssh_access"
+
+
+@dataclass(slots=True)
+class FtpAccess(LoginAccess):
+    type: ClassVar[str] = "ftp_access"
+
+
+@dataclass(slots=True)
+class Skipped(ProbeResult):
+    """A check (or a whole probe family) left out, with the reason."""
+
+    label: str
+    family: str
+    reason: str
+    port: Optional[int] = None
+    url: Optional[str] = None
+    status_code: Optional[int] = None
+    # the step is the first of the probes left out; this is the last one
+    last_step: Optional[int] = None
+    type: ClassVar[str] = "skipped"
+    skipped: ClassVar[bool] = True
+
+
+@dataclass(slots=True)
+class Analysis:
+    severity: str = "info"
+    summary: str = "Keine Aktion nötig"
+    remediation: List[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Finding:
+    """A probe result worth reporting, with its analysis."""
+
+    step: int
+    description: str
+    result: ProbeResult
+    analysis: Analysis
+
+    def to_dict(self) -> Dict:
+        details = self.result.to_dict()
+        return {
+            "step": self.step,
+            "type": details.pop("type"),
+            "description": self.description,
+            "severity": self.analysis.severity,
+            "summary": self.analysis.summary,
+            "remediation": self.analysis.remediation,
+            "details": details,
+        }
+
+
+def to_json(obj):
+    """`default` hook for json.dumps / orjson / JSON encoders."""
+    if isinstance(obj, (ProbeResult, Finding)):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,572 @@
+import asyncio
+import http.server
+import json
+import socket
+import struct
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from networkip import metrics, views
+from networkip.admission import Admission, Overloaded
+from networkip.aio import SharedSemaphore
+from networkip.checks import check_service_ports
+from networkip.coordinator import ScanCoordinator
+from networkip.httpclient import StdlibSession
+from networkip.icmp import ICMP_ECHO_REPLY, ICMP_ECHO_REQUEST, IcmpPinger, _checksum, _echo_request
+from networkip.internet_scanner import (ANALYZERS, FINGERPRINT_BYTES, MAX_PROBE_TIMEOUT, ProbeCache, _fingerprint,
+                                        _get_prefix, adaptive_timeout, analyze_result, build_probes,
+                                        requests_session, vulnerability_report)
+from networkip.inventory import record_sweep
+from networkip.jobs import Job, JobRegistry
+from networkip.models import Host, ScanRun
+from networkip.neighbors import parse_ip_neigh
+from networkip.networkscanner import (MAX_HOSTS, SubprocessPinger, _passive_then_sweep, checked_host_count,
+                                     count_hosts, iter_hosts, make_pinger)
+from networkip.portscan import configured_ports
+from networkip.results import (BackdoorFile, Finding, FtpAccess, HttpAccess, HttpBasicAuth, ProbeResult, Skipped,
+                               SshAccess)
+from networkip.resolver import ReverseDnsCache, ReverseResolver
+
+
+class SharedSemaphoreTests(SimpleTestCase):
+    def test_acquire_sync_waits_for_release(self):
+        sem = SharedSemaphore(1)
+        sem.acquire_sync()
+        acquired = threading.Event()
+
+        def worker():
+            sem.acquire_sync()
+            acquired.set()
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.assertFalse(acquired.wait(0.1))
+        sem.release()
+        self.assertTrue(acquired.wait(1))
+        self.assertEqual(sem.available, 0)
+
+    @override_settings(NETWORKIP_PROBE_BUDGET=2)
+    def test_callable_size_is_read_on_first_use(self):
+        sem = SharedSemaphore(lambda: settings.NETWORKIP_PROBE_BUDGET)
+        with override_settings(NETWORKIP_PROBE_BUDGET=3):
+            with sem:
+                self.assertEqual(sem.available, 2)
+        self.assertEqual(sem.available, 3)
+
+    async def test_cancelled_waiter_does_not_keep_a_slot(self):
+        sem = SharedSemaphore(1)
+        await sem.acquire()
+        waiter = asyncio.ensure_future(sem.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        sem.release()
+        self.assertEqual(sem.available, 1)
+
+
+@override_settings(NETWORKIP_MAX_ACTIVE_SCANS=1, NETWORKIP_MAX_QUEUED_SCANS=2)
+class AdmissionTests(SimpleTestCase):
+    def test_ticket_refuses_beyond_max_queued(self):
+        admission = Admission()
+        running = admission.ticket("a")
+        admission.ticket("b")
+        admission.ticket("c")
+        with self.assertRaises(Overloaded):
+            admission.ticket("d")
+        # the same scan as a running one shares its slot
+        joined = admission.ticket("a")
+        self.assertTrue(joined.admitted)
+        self.assertEqual(admission.snapshot(), {"active": 2, "queued": 2})
+        running.release()
+        joined.release()
+        self.assertEqual(admission.snapshot(), {"active": 1, "queued": 1})
+
+    @override_settings(NETWORKIP_INVENTORY=False)
+    async def test_stream_closed_while_queued_releases_its_ticket(self):
+        admission = Admission()
+        blocker = admission.ticket("blocker")
+        networks = ["198.51.100.0/30"]
+        with mock.patch.object(views, "admission", admission):
+            streams = [views._scan_frames(networks) for _ in range(3)]
+            first = [await stream.__anext__() for stream in streams]
+            self.assertEqual([frame for _, frame in first[:2]], [{"queued": 1}, {"queued": 2}])
+            # the third one no longer fits in the queue
+            self.assertTrue(first[2][1]["done"])
+            self.assertIn("retry_after", first[2][1])
+            self.assertEqual(admission.snapshot(), {"active": 1, "queued": 2})
+            for stream in streams:
+                await stream.aclose()
+        self.assertEqual(admission.snapshot(), {"active": 1, "queued": 0})
+        blocker.release()
+        self.assertEqual(admission.snapshot(), {"active": 0, "queued": 0})
+
+
+@override_settings(NETWORKIP_INVENTORY=False, NETWORKIP_PASSIVE_DISCOVERY=False, NETWORKIP_SCAN_CACHE_TIMEOUT=0)
+class ScanCoordinatorTests(SimpleTestCase):
+    async def test_concurrent_sweeps_of_the_same_networks_run_once(self):
+        release = threading.Event()
+        calls = []
+
+        def fake_scan(ips, total, **kwargs):
+            calls.append(total)
+            release.wait(5)
+            for n, ip in enumerate(ips, start=1):
+                yield n, total, {"ip": ip, "alive": ip.endswith(".1"), "hostname": None}
+
+        coordinator = ScanCoordinator()
+        with mock.patch("networkip.coordinator.scan_addresses_streaming", fake_scan):
+            first = asyncio.ensure_future(coordinator.results(["198.51.100.0/30"]))
+            second = asyncio.ensure_future(coordinator.results(["198.51.100.0/30"]))
+            await asyncio.sleep(0.05)
+            release.set()
+            results = await asyncio.gather(first, second)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([r["ip"] for r in results[0]], ["198.51.100.1"])
+
+    async def test_cache_entry_expiring_after_the_check_starts_no_sweep(self):
+        cached = {"results": [{"ip": "198.51.100.2", "alive": True, "hostname": "-"},
+                              {"ip": "198.51.100.1", "alive": True, "hostname": "-"}], "total": 2, "token": "t"}
+        with mock.patch.object(views.coordinator, "_join", side_effect=AssertionError("sweep without a ticket")):
+            # the first lookup hits, a second one would find the entry expired
+            with mock.patch.object(views.coordinator, "cached", mock.AsyncMock(side_effect=[cached, None])):
+                response = await views._scan_json(["198.51.100.0/30"])
+            with mock.patch.object(views.coordinator, "cached", mock.AsyncMock(side_effect=[cached, None])):
+                frames = [frame async for _, frame in views._scan_frames(["198.51.100.0/30"])]
+        self.assertEqual([r["ip"] for r in json.loads(response.content)["results"]], ["198.51.100.1", "198.51.100.2"])
+        self.assertEqual(frames[-1]["alive_count"], 2)
+
+
+@override_settings(NETWORKIP_JOB_QUEUE_SIZE=0)
+class JobsApiTests(SimpleTestCase):
+    def test_script_client_submits_with_the_cookie_token(self):
+        client = Client(enforce_csrf_checks=True)
+        data = {"kind": "sweep", "preset": "home"}
+        self.assertEqual(client.post("/networkip/api/jobs/", data).status_code, 403)
+        token = client.get("/networkip/api/jobs/").cookies["csrftoken"].value
+        # a full queue turns the job away like an overloaded scan
+        response = client.post("/networkip/api/jobs/", data, HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], str(response.json()["retry_after"]))
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_any_worker_answers_for_a_job_through_the_cache(self):
+        # the job runs in another process, stood in for by a second registry
+        other = JobRegistry()
+        job = Job("sweep", "192.0.2.0/30", {})
+        job.changed = other._publish
+        job.emit({"alive": {"ip": "192.0.2.1"}})
+        other._publish(job, force=True)
+        self.assertIsNone(views.registry.get(job.id))
+
+        response = self.client.get(f"/networkip/api/jobs/{job.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["state"], response.json()["events"]), ("queued", 1))
+        self.assertEqual(self.client.get("/networkip/api/jobs/0123/").status_code, 404)
+
+        # a cancel reaches the job the next time its worker publishes
+        self.assertEqual(self.client.delete(f"/networkip/api/jobs/{job.id}/").status_code, 200)
+        self.assertFalse(job.cancelled.is_set())
+        other._publish(job, force=True)
+        self.assertTrue(job.cancelled.is_set())
+
+        other._finish(job, "cancelled")
+        other._publish(job, force=True)
+        response = self.client.get(f"/networkip/api/jobs/{job.id}/events/")
+        [frame] = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(frame["events"], [{"alive": {"ip": "192.0.2.1"}}])
+        self.assertTrue(frame["done"])
+
+    @override_settings(NETWORKIP_MAX_ACTIVE_SCANS=1)
+    def test_job_waits_for_an_admission_ticket(self):
+        admission = Admission()
+        blocker = admission.ticket("198.51.100.0/30")
+        job = Job("sweep", "192.0.2.0/30", {})
+        tickets = []
+        with mock.patch("networkip.jobs.admission", admission):
+            thread = threading.Thread(target=lambda: tickets.append(JobRegistry()._ticket(job)), daemon=True)
+            thread.start()
+            for _ in range(100):
+                if job.events:
+                    break
+                threading.Event().wait(0.01)
+            self.assertEqual(job.events, [{"queued": 1}])
+            blocker.release()
+            thread.join(2)
+        [ticket] = tickets
+        self.assertTrue(ticket.admitted)
+        ticket.release()
+        self.assertEqual(admission.snapshot(), {"active": 0, "queued": 0})
+
+
+class PassiveDiscoveryTests(SimpleTestCase):
+    NEIGH = (
+        "192.0.2.1 dev eth0 lladdr 02:00:00:00:00:01 REACHABLE\n"
+        "192.0.2.2 dev eth0 lladdr 02:00:00:00:00:02 STALE\n"
+        "192.0.2.3 dev eth0  FAILED\n"
+    )
+
+    async def test_only_reachable_entries_skip_the_probe(self):
+        neighbors = {n.ip: n for n in parse_ip_neigh(self.NEIGH)}
+        self.assertEqual(sorted(neighbors), ["192.0.2.1", "192.0.2.2"])
+        probed = []
+
+        async def fake_sweep(ips, **kwargs):
+            # every probed host is down
+            for ip in ips:
+                probed.append(ip)
+                yield ip, False
+
+        ips = ["192.0.2.1", "192.0.2.2", "192.0.2.3", "192.0.2.4"]
+        with mock.patch("networkip.networkscanner.sweep", fake_sweep):
+            pairs = [pair async for pair in _passive_then_sweep(ips, neighbors, 16, "tcp", 0.5)]
+        self.assertEqual(pairs[0], ("192.0.2.1", True))
+        # the stale entry is probed first and, being down, not reported alive
+        self.assertEqual(probed, ["192.0.2.2", "192.0.2.3", "192.0.2.4"])
+        self.assertIn(("192.0.2.2", False), pairs)
+
+
+class ProbeCacheTests(SimpleTestCase):
+    def test_probe_cache_passes_errors_to_every_waiter(self):
+        probes = ProbeCache()
+        started = threading.Event()
+        errors = []
+
+        def failing():
+            started.set()
+            threading.Event().wait(0.1)
+            raise OSError("boom")
+
+        def waiter():
+            started.wait(1)
+            try:
+                probes._once(("x", "y"), failing)
+            except OSError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=waiter, daemon=True)
+        thread.start()
+        with self.assertRaises(OSError):
+            probes._once(("x", "y"), failing)
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(errors), 1)
+
+
+class _LargeFileHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    size = 8 * 1024 * 1024
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(self.size))
+        self.end_headers()
+        try:
+            for _ in range(self.size // 65536):
+                self.wfile.write(b"x" * 65536)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class SensitivePathTests(SimpleTestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _LargeFileHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/backup.zip"
+
+    def test_only_a_prefix_of_the_body_is_read(self):
+        for session in (requests_session(1), StdlibSession(stream_limit=FINGERPRINT_BYTES)):
+            with self.subTest(session=type(session).__name__):
+                resp, prefix = _get_prefix(session, self.url, timeout=(1, 5))
+                self.assertEqual(len(prefix), FINGERPRINT_BYTES)
+                self.assertEqual(_fingerprint(resp, prefix, "/backup.zip")["length"], _LargeFileHandler.size)
+                session.close()
+
+
+class ServicePortsSettingTests(SimpleTestCase):
+    @override_settings(NETWORKIP_SERVICE_PORTS="443, 22,8000-8002")
+    def test_setting_is_parsed_like_a_client_list(self):
+        self.assertEqual(configured_ports(), [22, 443, 8000, 8001, 8002])
+        self.assertEqual(check_service_ports(None), [])
+
+    @override_settings(NETWORKIP_SERVICE_PORTS="22,http")
+    def test_bad_setting_is_reported_by_the_system_check(self):
+        errors = check_service_ports(None)
+        self.assertEqual([e.id for e in errors], ["networkip.E001"])
+
+
+class _ReplySocket:
+    """Hands out queued datagrams, then reports that nothing more is waiting."""
+
+    def __init__(self, datagrams):
+        self.datagrams = list(datagrams)
+
+    def recvfrom(self, size):
+        if not self.datagrams:
+            raise BlockingIOError
+        return self.datagrams.pop(0)
+
+
+class IcmpTests(SimpleTestCase):
+    def test_checksum_matches_rfc_1071_example(self):
+        self.assertEqual(_checksum(bytes.fromhex("0001f203f4f5f6f7")), 0x220D)
+        # odd lengths are padded with a zero byte
+        self.assertEqual(_checksum(b"\x01"), _checksum(b"\x01\x00"))
+
+    def test_echo_request_packing(self):
+        packet = _echo_request(socket.AF_INET, 0x1234, 7)
+        kind, code, _, ident, seq = struct.unpack("!BBHHH", packet[:8])
+        self.assertEqual((kind, code, ident, seq), (ICMP_ECHO_REQUEST, 0, 0x1234, 7))
+        # a correct checksum makes the checksum of the whole packet zero
+        self.assertEqual(_checksum(packet), 0)
+        # ICMPv6 leaves the checksum to the kernel
+        self.assertEqual(struct.unpack("!H", _echo_request(socket.AF_INET6, 1, 1)[2:4])[0], 0)
+
+    async def test_raw_replies_match_identifier_sequence_and_address(self):
+        pinger = IcmpPinger()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        pinger._pending[(socket.AF_INET, 5)] = ("192.0.2.7", fut)
+        ip_header = b"\x45" + bytes(19)
+
+        def reply(kind=ICMP_ECHO_REPLY, ident=pinger._ident, seq=5, addr="192.0.2.7"):
+            return ip_header + struct.pack("!BBHHH", kind, 0, 0, ident, seq), (addr, 0)
+
+        ignored = [
+            reply(kind=ICMP_ECHO_REQUEST),  # our own request, seen by the raw socket
+            reply(ident=pinger._ident ^ 1),  # another process's ping
+            reply(seq=6),
+            reply(addr="192.0.2.8"),
+        ]
+        pinger._on_readable(socket.AF_INET, _ReplySocket(ignored), raw=True)
+        self.assertFalse(fut.done())
+        pinger._on_readable(socket.AF_INET, _ReplySocket([reply()]), raw=True)
+        self.assertTrue(fut.result())
+
+    @override_settings(NETWORKIP_PING_BACKEND="subprocess")
+    def test_backend_comes_from_settings(self):
+        self.assertIsInstance(make_pinger(), SubprocessPinger)
+        with self.assertRaises(ValueError):
+            make_pinger("carrier-pigeon")
+
+
+class MetricsTests(SimpleTestCase):
+    def test_counter_text_escapes_label_values(self):
+        counter = metrics.Counter("test_total", "Test counter.", ["path"])
+        metrics.REGISTRY.remove(counter)
+        counter.inc(path='a"b')
+        counter.inc(2, path='a"b')
+        self.assertEqual(counter.render(), '# HELP test_total Test counter.\n'
+                                           '# TYPE test_total counter\n'
+                                           'test_total{path="a\\"b"} 3')
+
+    def test_histogram_buckets_are_cumulative_with_upper_bounds_inclusive(self):
+        histogram = metrics.Histogram("test_seconds", "Test histogram.", buckets=(0.5, 0.1))
+        metrics.REGISTRY.remove(histogram)
+        for value in (0.05, 0.1, 0.3, 7):
+            histogram.observe(value)
+        self.assertEqual(histogram._samples(), [
+            'test_seconds_bucket{le="0.1"} 2',
+            'test_seconds_bucket{le="0.5"} 3',
+            'test_seconds_bucket{le="+Inf"} 4',
+            "test_seconds_sum 7.45",
+            "test_seconds_count 4",
+        ])
+
+    def test_disabled_metrics_record_nothing(self):
+        counter = metrics.Counter("test_off_total", "Test counter.")
+        metrics.REGISTRY.remove(counter)
+        with override_settings(NETWORKIP_METRICS=False):
+            metrics.configure()
+            self.addCleanup(metrics.configure)
+            counter.inc()
+        self.assertEqual(counter._samples(), [])
+
+
+class HostCountTests(SimpleTestCase):
+    def test_count_matches_the_addresses_iterated(self):
+        for networks in (["192.0.2.0/29"], ["192.0.2.0/31", "192.0.2.8/32"], ["2001:db8::/125"],
+                         ["2001:db8::/127", "192.0.2.16/30"]):
+            with self.subTest(networks=networks):
+                self.assertEqual(count_hosts(networks), len(list(iter_hosts(networks))))
+        self.assertEqual(list(iter_hosts("192.0.2.0/30")), ["192.0.2.1", "192.0.2.2"])
+
+    def test_ranges_above_max_hosts_are_refused_without_iterating(self):
+        self.assertEqual(checked_host_count("10.0.0.0/16"), MAX_HOSTS - 2)
+        with self.assertRaises(ValueError):
+            checked_host_count("2001:db8::/64")
+        with self.assertRaises(ValueError):
+            checked_host_count(["10.0.0.0/16", "10.1.0.0/16"])
+
+
+class ReverseDnsCacheTests(SimpleTestCase):
+    def test_hits_and_misses_expire_after_their_own_ttl(self):
+        cache = ReverseDnsCache(ttl=60, negative_ttl=10)
+        with mock.patch("networkip.resolver.time.monotonic", return_value=1000.0) as now:
+            cache.set("192.0.2.1", "router.example")
+            cache.set("192.0.2.2", None)
+            self.assertEqual(cache.get("192.0.2.2"), (True, None))
+            now.return_value = 1011.0
+            self.assertEqual(cache.get("192.0.2.1"), (True, "router.example"))
+            self.assertEqual(cache.get("192.0.2.2"), (False, None))
+            now.return_value = 1061.0
+            self.assertEqual(cache.get("192.0.2.1"), (False, None))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ReverseDnsCache(maxsize=2)
+        cache.set("192.0.2.1", "a")
+        cache.set("192.0.2.2", "b")
+        cache.get("192.0.2.1")
+        cache.set("192.0.2.3", "c")
+        self.assertEqual([cache.get(ip)[0] for ip in ("192.0.2.1", "192.0.2.2", "192.0.2.3")],
+                         [True, False, True])
+
+    async def test_unresolvable_address_is_looked_up_once(self):
+        resolver = ReverseResolver(max_workers=2)
+        with mock.patch("networkip.resolver.socket.gethostbyaddr", side_effect=OSError) as lookup:
+            self.assertEqual(await resolver.alookup("192.0.2.9"), "-")
+            self.assertEqual(await resolver.alookup("192.0.2.9"), "-")
+        self.assertEqual(lookup.call_count, 1)
+        self.assertEqual(resolver.cached("192.0.2.9"), (True, "-"))
+
+
+class InventoryTests(TestCase):
+    def test_record_sweep_upserts_and_marks_disappeared_hosts(self):
+        first, second = timezone.now() - timedelta(minutes=5), timezone.now()
+        record_sweep(["192.0.2.0/29"], [{"ip": "192.0.2.1", "hostname": "-"},
+                                        {"ip": "192.0.2.2", "hostname": "nas"}], 6, first, first)
+        run = record_sweep(["192.0.2.0/29"], [{"ip": "192.0.2.2", "hostname": "nas.lan"},
+                                              {"ip": "192.0.2.3", "hostname": "-"}], 6, second, second)
+        self.assertEqual((run.alive_count, run.appeared, run.disappeared), (2, 1, 1))
+        self.assertEqual(Host.objects.count(), 3)
+        gone = Host.objects.get(address="192.0.2.1")
+        self.assertFalse(gone.alive)
+        self.assertEqual(gone.last_seen, first)
+        nas = Host.objects.get(address="192.0.2.2")
+        self.assertEqual((nas.hostname, nas.first_seen, nas.last_seen), ("nas.lan", first, second))
+        self.assertEqual(ScanRun.objects.count(), 2)
+
+
+class SweepResumeTests(SimpleTestCase):
+    HOSTS = [{"ip": f"192.0.2.{n}", "alive": n % 2 == 1, "hostname": "-"} for n in range(1, 9)]
+
+    async def frames(self, token, resume_token=None, resume_alive=0):
+        async def events():
+            for n, result in enumerate(self.HOSTS, start=1):
+                yield n, len(self.HOSTS), result
+
+        async def fake_open(networks):
+            return token, events()
+
+        with mock.patch.object(views.coordinator, "open", fake_open), mock.patch.object(views, "FRAME_INTERVAL", 0):
+            return [item async for item in views._sweep_frames(["192.0.2.0/28"], [], resume_token, resume_alive, None)]
+
+    def alive(self, frames):
+        return [host["ip"] for _, frame in frames for host in frame.get("alive", [])]
+
+    async def test_last_event_id_skips_exactly_the_delivered_hosts(self):
+        frames = await self.frames("t1")
+        self.assertEqual(self.alive(frames), ["192.0.2.1", "192.0.2.3", "192.0.2.5", "192.0.2.7"])
+        # every id counts the alive hosts delivered up to and including its frame
+        delivered = 0
+        for event_id, frame in frames:
+            delivered += len(frame.get("alive", []))
+            self.assertEqual(views._parse_event_id(event_id), ("t1", delivered))
+        # a client that got two hosts reconnects with "t1-2"
+        resumed = await self.frames("t1", *views._parse_event_id("t1-2"))
+        self.assertNotIn("known", resumed[0][1])
+        self.assertEqual(self.alive(resumed), ["192.0.2.5", "192.0.2.7"])
+        self.assertEqual(resumed[-1][0], "t1-4")
+        self.assertEqual(resumed[-1][1]["alive_count"], 4)
+
+    async def test_other_sweep_starts_over(self):
+        frames = await self.frames("t2", "t1", 2)
+        self.assertTrue(frames[0][1]["reset"])
+        self.assertEqual(len(self.alive(frames)), 4)
+
+
+class AnalyzerDispatchTests(SimpleTestCase):
+    RESULTS = [
+        Skipped(label="FTP", family="ftp", reason="Port 21 geschlossen", port=21),
+        HttpBasicAuth(url="http://192.0.2.1/", username="admin", password="admin", status_code=200,
+                      auth_required=True, success=True),
+        BackdoorFile(path="/shell.php", url="http://192.0.2.1/shell.php", status_code=200, found=True),
+        HttpAccess(url="http://192.0.2.1/", status_code=200),
+        SshAccess(host="192.0.2.1", port=22, username="root", password="root", success=True),
+        FtpAccess(host="192.0.2.1", port=21, username="ftp", password="ftp"),
+    ]
+
+    def test_every_result_type_has_one_analyzer(self):
+        self.assertEqual({type(r) for r in self.RESULTS}, set(ANALYZERS))
+        for result in self.RESULTS:
+            with self.subTest(type=result.type):
+                with mock.patch.dict(ANALYZERS, {type(result): mock.Mock(return_value="analysis")}):
+                    self.assertEqual(analyze_result(result), "analysis")
+                    ANALYZERS[type(result)].assert_called_once_with(result)
+        self.assertEqual(analyze_result(ProbeResult()).summary, "Unbekannter Befund")
+        # the shared login analyzer names the protocol of its result
+        self.assertIn("SSH", analyze_result(self.RESULTS[4]).summary)
+        self.assertIn("FTP", analyze_result(self.RESULTS[5]).summary)
+
+    def test_finding_to_dict(self):
+        finding = vulnerability_report(3, "Prüfe Datei: /shell.php", self.RESULTS[2])
+        self.assertIsInstance(finding, Finding)
+        data = finding.to_dict()
+        self.assertEqual((data["step"], data["type"], data["severity"]), (3, "backdoor_file", "critical"))
+        # fields left at None are not serialized, and the type is not repeated in the details
+        self.assertEqual(data["details"], {"path": "/shell.php", "url": "http://192.0.2.1/shell.php",
+                                           "status_code": 200, "found": True})
+        self.assertIsNone(vulnerability_report(1, "HTTP", self.RESULTS[3]))
+        self.assertIsNone(vulnerability_report(0, "FTP", self.RESULTS[0]))
+
+
+class BuildProbesTests(SimpleTestCase):
+    OPEN = {"reachable": True, "rtt": 0.001}
+
+    def reachability(self, **closed):
+        ports = {"http": 80, "ssh": 22, "ftp": 21}
+        return {family: dict(self.OPEN, port=port) if family not in closed
+                else {"port": port, "reachable": False, "reason": closed[family]}
+                for family, port in ports.items()}
+
+    def steps(self, probes):
+        return {probe.description: probe.step for probe in probes}
+
+    def test_steps_do_not_move_when_phases_are_skipped(self):
+        paths = ["/a", "/b"]
+        full = build_probes("http://192.0.2.1", "192.0.2.1", reachability=self.reachability(), paths=paths)
+        self.assertEqual([p.step for p in full], list(range(1, len(full) + 1)))
+        partial = build_probes("http://192.0.2.1", "192.0.2.1", reachability=self.reachability(ssh="zu"),
+                               auth_challenge={"auth_required": False, "status_code": 200}, paths=paths)
+        kept = {d: step for d, step in self.steps(partial).items() if "übersprungen" not in d}
+        self.assertEqual(kept, {d: step for d, step in self.steps(full).items() if d in kept})
+        # each skipped result stands for exactly the steps it replaces
+        for probe in partial:
+            if probe.family == "ssh" or "Basic Auth" in probe.description:
+                skipped = probe.args[0]
+                family = [p for p in full if p.family == probe.family
+                          and ("Basic Auth" in p.description) == ("Basic Auth" in probe.description)]
+                self.assertEqual((probe.step, skipped.last_step), (family[0].step, family[-1].step))
+
+    def test_closed_http_port_is_one_skip_for_access_and_basic_auth(self):
+        full = build_probes("http://192.0.2.1", "192.0.2.1", reachability=self.reachability(), paths=["/a"])
+        probes = build_probes("http://192.0.2.1", "192.0.2.1", reachability=self.reachability(http="zu"),
+                              paths=["/a"])
+        http = [p for p in probes if p.family in ("http", "backdoor")]
+        self.assertEqual([(p.step, p.args[0].last_step) for p in http],
+                         [(1, max(p.step for p in full if p.family == "http")),
+                          (self.steps(full)["Prüfe Datei: /a"],) * 2])
+
+    def test_rtt_only_shortens_the_connect_phase(self):
+        self.assertEqual(adaptive_timeout(0.001), (1.0, MAX_PROBE_TIMEOUT))
+        self.assertEqual(adaptive_timeout(None), (MAX_PROBE_TIMEOUT, MAX_PROBE_TIMEOUT))
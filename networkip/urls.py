@@ -9,5 +9,11 @@ urlpatterns = [
     path('api/vm/', views.api_scan_vm, name='api_scan_vm'),
     path('api/home/stream/', views.api_scan_home_stream, name='api_scan_home_stream'),
     path('api/vm/stream/', views.api_scan_vm_stream, name='api_scan_vm_stream'),
+    path('api/home/events/', views.api_scan_home_events, name='api_scan_home_events'),
+    path('api/vm/events/', views.api_scan_vm_events, name='api_scan_vm_events'),
     path('api/internet/', views.api_scan_internet, name='api_scan_internet'),
+    path('api/jobs/', views.api_jobs, name='api_jobs'),
+    path('api/jobs/<str:job_id>/', views.api_job, name='api_job'),
+    path('api/jobs/<str:job_id>/events/', views.api_job_events, name='api_job_events'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
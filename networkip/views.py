@@ -1,9 +1,31 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.http import HttpRequest, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_http_methods
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+import asyncio
 import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-from .networkscanner import scan_network, scan_network_streaming
-from .internet_scanner import scan_internet_security
+from . import metrics
+from .aio import batched, iter_sync, iterate_in_thread
+from .admission import Overloaded, admission
+from .coordinator import coordinator, scan_key
+from .inventory import aknown_hosts
+from .portscan import ServiceDiscovery, configured_ports, parse_ports
+from .results import to_json
+from .jobs import FINISHED, PUBLISH_INTERVAL, QueueFull, registry
+
+# CIDR blocks behind the preset endpoints
+HOME_NETWORKS = ["192.168.178.0/24"]
+VM_NETWORKS = ["192.168.122.0/24"]
+SWEEP_PRESETS = {'home': HOME_NETWORKS, 'vm': VM_NETWORKS}
 
 
 def index(request: HttpRequest):
@@ -11,97 +33,450 @@ def index(request: HttpRequest):
     return render(request, 'networkip/list.html')
 
 
-def api_scan_home(request: HttpRequest):
-    # API endpoint for home network (192.168.178.x) - scan all 255 addresses
-    results = scan_network(base="192.168.178.", start=1, end=255)
-    alive = [r for r in results if r.get('alive')]
-    return JsonResponse({'results': alive})
-
-
-def api_scan_vm(request: HttpRequest):
-    # API endpoint for VM network (192.168.122.x) - scan all 255 addresses
-    results = scan_network(base="192.168.122.", start=1, end=255)
-    alive = [r for r in results if r.get('alive')]
-    return JsonResponse({'results': alive})
-
-
-def api_scan_home_stream(request: HttpRequest):
-    # Streaming API for home network - sends newline-delimited JSON with progress
-    def stream():
-        alive = []
-        for current, total, result in scan_network_streaming(base="192.168.178.", start=1, end=255):
-            if result.get('alive'):
-                alive.append(result)
-            # Send progress update as JSON line
-            yield json.dumps({'progress': current, 'total': total, 'alive_count': len(alive)}) + '\n'
-        # Send final results
-        yield json.dumps({'results': alive, 'done': True}) + '\n'
-    
-    return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
-
-
-def api_scan_vm_stream(request: HttpRequest):
-    # Streaming API for VM network - sends newline-delimited JSON with progress
-    def stream():
-        alive = []
-        for current, total, result in scan_network_streaming(base="192.168.122.", start=1, end=255):
-            if result.get('alive'):
-                alive.append(result)
-            # Send progress update as JSON line
-            yield json.dumps({'progress': current, 'total': total, 'alive_count': len(alive)}) + '\n'
-        # Send final results
-        yield json.dumps({'results': alive, 'done': True}) + '\n'
-    
-    return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
-
-
-def api_scan_internet(request: HttpRequest):
+def _stream_response(request: HttpRequest, stream,
+                     content_type: str = 'application/x-ndjson') -> StreamingHttpResponse:
+    # Under ASGI the async generator is consumed natively; Django cancels it when
+    # the client disconnects, which stops the sweep. Under WSGI it is driven on
+    # a private event loop instead (Django would otherwise buffer it whole).
+    endpoint = request.resolver_match.url_name if request.resolver_match else 'unknown'
+    stream = metrics.instrument_stream(stream, endpoint)
+    if not isinstance(request, ASGIRequest):
+        stream = iter_sync(stream)
+    return StreamingHttpResponse(stream, content_type=content_type)
+
+
+OVERLOADED = 'Zu viele Scans gleichzeitig, bitte später erneut versuchen'
+
+
+def _overloaded(e: Overloaded, message: str = OVERLOADED) -> JsonResponse:
+    response = JsonResponse({'error': message, 'retry_after': e.retry_after}, status=429)
+    response['Retry-After'] = str(e.retry_after)
+    return response
+
+
+async def _scan_json(networks):
+    cached = await coordinator.cached(networks)
+    if cached is not None:
+        # no second lookup: the entry may expire in between
+        return JsonResponse({'results': await coordinator.replay_results(cached)})
+    try:
+        ticket = admission.ticket(scan_key(networks))
+    except Overloaded as e:
+        return _overloaded(e)
+    try:
+        async for _ in ticket.wait():
+            pass
+        results = await coordinator.results(networks)
+    finally:
+        ticket.release()
+    return JsonResponse({'results': results})
+
+
+# streamed scans send at most one progress frame per interval
+FRAME_INTERVAL = 0.1
+
+
+def _dumps(obj) -> bytes:
+    # the one place scanner result records become JSON
+    if orjson is not None:
+        return orjson.dumps(obj, default=to_json, option=orjson.OPT_PASSTHROUGH_DATACLASS)
+    return json.dumps(obj, separators=(',', ':'), default=to_json).encode()
+
+
+class _ResultEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        try:
+            return to_json(o)
+        except TypeError:
+            return super().default(o)
+
+
+def _parse_event_id(value: str):
+    # "<sweep token>-<alive hosts delivered>"
+    token, _, count = value.rpartition('-')
+    return (token, int(count)) if token and count.isdigit() else (None, 0)
+
+
+def _service_ports(request: HttpRequest):
+    # ?services=1 checks the default port list on every alive host, ?ports=22,80,8000-8010 a custom one;
+    # raises ValueError for an unusable list
+    if 'ports' in request.GET:
+        return parse_ports(request.GET['ports'])
+    if request.GET.get('services') in ('1', 'true'):
+        return configured_ports()
+    return None
+
+
+def _service_discovery(ports):
+    return ServiceDiscovery(
+        ports,
+        max_in_flight=getattr(settings, 'NETWORKIP_SERVICE_MAX_IN_FLIGHT', 256),
+        per_host=getattr(settings, 'NETWORKIP_SERVICE_PER_HOST', 16),
+        timeout=getattr(settings, 'NETWORKIP_SERVICE_TIMEOUT', 1.0),
+    )
+
+
+async def _scan_frames(networks, resume_token=None, resume_alive=0, ports=None):
+    """Yield (event_id, frame) for a sweep.
+
+    While the sweep waits for admission, frames are {'queued': position}
+    (event_id None); if the queue filled up since the request was checked,
+    the only frame is {'error', 'retry_after', 'done': True}. Then: first
+    {'known': [...]}, then {'progress', 'total', 'alive_count'} with the
+    newly found hosts under 'alive' (each host is sent once), and
+    finally {'done': True, ..., 'disappeared': [...]}. When `resume_token`
+    names the sweep being followed, the first `resume_alive` hosts and the
+    known list are not sent again.
+
+    With `ports`, every alive host is also checked for open TCP ports while
+    the sweep goes on; finished hosts arrive as 'services': [{'ip', 'open'}]
+    on the progress frames and, after the sweep, on frames of their own
+    before 'done'.
+    """
+    known = await aknown_hosts(networks) if getattr(settings, 'NETWORKIP_INVENTORY', True) else []
+    ticket = None
+    try:
+        cached = await coordinator.cached(networks)
+        if cached is None:
+            # a new sweep (or joining a running one) needs an admission slot;
+            # report the queue position while waiting for it
+            try:
+                ticket = admission.ticket(scan_key(networks))
+            except Overloaded as e:
+                yield None, {'error': OVERLOADED, 'retry_after': e.retry_after, 'done': True}
+                return
+            async for position in ticket.wait():
+                yield None, {'queued': position}
+        async for item in _sweep_frames(networks, known, resume_token, resume_alive, ports, cached):
+            yield item
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+async def _sweep_frames(networks, known, resume_token, resume_alive, ports, cached=None):
+    # concurrent viewers share one sweep; recent results come from the cache
+    # (`cached`, already looked up by the caller, or the lookup in open())
+    if cached is not None:
+        token, events = coordinator.replay(cached)
+    else:
+        token, events = await coordinator.open(networks)
+    resumed = resume_token is not None and token == resume_token
+    skip = resume_alive if resumed else 0
+    if not resumed:
+        frame = {'known': known}
+        if resume_token is not None:
+            # the sweep the client was following is gone; it has to start over
+            frame['reset'] = True
+        yield f'{token}-0', frame
+
+    alive_ips = set()
+    current = total = 0
+    services = _service_discovery(ports) if ports else None
+    batches = batched(events, FRAME_INTERVAL)
+    try:
+        async for batch in batches:
+            found = []
+            for current, total, result in batch:
+                if result.get('alive'):
+                    alive_ips.add(result['ip'])
+                    if len(alive_ips) > skip:
+                        found.append(result)
+                    if services is not None:
+                        services.add(result['ip'])
+            frame = {'progress': current, 'total': total, 'alive_count': len(alive_ips)}
+            if found:
+                frame['alive'] = found
+            if services is not None:
+                checked = services.take()
+                if checked:
+                    frame['services'] = checked
+            yield f'{token}-{max(len(alive_ips), skip)}', frame
+        if services is not None:
+            drained = batched(services.drain(), FRAME_INTERVAL)
+            try:
+                async for chunks in drained:
+                    yield f'{token}-{max(len(alive_ips), skip)}', {
+                        'services': [record for chunk in chunks for record in chunk],
+                        'services_pending': services.pending,
+                    }
+            finally:
+                await drained.aclose()
+    finally:
+        await batches.aclose()
+        if services is not None:
+            await services.aclose()
+
+    yield f'{token}-{max(len(alive_ips), skip)}', {
+        'done': True,
+        'progress': current,
+        'total': total,
+        'alive_count': len(alive_ips),
+        'disappeared': [h for h in known if h['ip'] not in alive_ips],
+    }
+
+
+async def _check_admission(networks):
+    # turn the request away before the response starts if the queue is full
+    if await coordinator.cached(networks) is None:
+        admission.check(scan_key(networks))
+
+
+async def _scan_stream(request: HttpRequest, networks):
+    # Streaming scan - newline-delimited JSON frames (see _scan_frames)
+    try:
+        ports = _service_ports(request)
+    except ValueError:
+        return JsonResponse({'error': 'Ungültige Portliste'}, status=400)
+    try:
+        await _check_admission(networks)
+    except Overloaded as e:
+        return _overloaded(e)
+
+    async def stream():
+        async for _, frame in _scan_frames(networks, ports=ports):
+            yield _dumps(frame) + b'\n'
+
+    return _stream_response(request, stream())
+
+
+async def _scan_events(request: HttpRequest, networks):
+    # Server-Sent Events variant; EventSource reconnects with Last-Event-ID and
+    # resumes the same sweep without receiving its hosts twice
+    try:
+        ports = _service_ports(request)
+    except ValueError:
+        return JsonResponse({'error': 'Ungültige Portliste'}, status=400)
+    try:
+        await _check_admission(networks)
+    except Overloaded as e:
+        return _overloaded(e)
+    resume_token, resume_alive = _parse_event_id(request.headers.get('Last-Event-ID', ''))
+
+    async def stream():
+        yield b'retry: 2000\n\n'
+        async for event_id, frame in _scan_frames(networks, resume_token, resume_alive, ports):
+            head = b'id: ' + event_id.encode() + b'\n' if event_id is not None else b''
+            yield head + b'data: ' + _dumps(frame) + b'\n\n'
+
+    response = _stream_response(request, stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def api_scan_home(request: HttpRequest):
+    # API endpoint for home network (192.168.178.0/24)
+    return await _scan_json(HOME_NETWORKS)
+
+
+async def api_scan_vm(request: HttpRequest):
+    # API endpoint for VM network (192.168.122.0/24)
+    return await _scan_json(VM_NETWORKS)
+
+
+async def api_scan_home_stream(request: HttpRequest):
+    # Streaming API for home network
+    return await _scan_stream(request, HOME_NETWORKS)
+
+
+async def api_scan_vm_stream(request: HttpRequest):
+    # Streaming API for VM network
+    return await _scan_stream(request, VM_NETWORKS)
+
+
+async def api_scan_home_events(request: HttpRequest):
+    # Server-Sent Events for home network
+    return await _scan_events(request, HOME_NETWORKS)
+
+
+async def api_scan_vm_events(request: HttpRequest):
+    # Server-Sent Events for VM network
+    return await _scan_events(request, VM_NETWORKS)
+
+
+async def api_scan_internet(request: HttpRequest):
     # Streaming API for internet security scanning
     url = request.GET.get('url', '').strip()
-    
+
     if not url:
         return JsonResponse({'error': 'URL erforderlich'}, status=400)
-    
-    def stream():
+    key = f'internet:{url}'
+    try:
+        admission.check(key)
+    except Overloaded as e:
+        return _overloaded(e)
+
+    async def stream():
+        try:
+            ticket = admission.ticket(key)
+        except Overloaded as e:
+            yield _dumps({'error': OVERLOADED, 'retry_after': e.retry_after, 'done': True}) + b'\n'
+            return
+        try:
+            async for position in ticket.wait():
+                yield _dumps({'queued': position, 'in_progress': True}) + b'\n'
+            async for line in scan_lines():
+                yield line
+        finally:
+            ticket.release()
+
+    async def scan_lines():
+        # loaded on first use (or by warm_up) so the app starts without requests/paramiko
+        from .internet_scanner import scan_internet_security, vulnerability_report
+
         vulnerabilities = []
-        
+        skipped = []
+        # the probes themselves are blocking; run them off the event loop
+        scan = iterate_in_thread(scan_internet_security(url))
+
         try:
-            for step, description, result in scan_internet_security(url):
+            async for step, description, result in scan:
+                # Report probe families the scanner left out (port closed, no auth ...)
+                if result.skipped:
+                    note = {'step': step, 'last_step': result.last_step, 'description': description}
+                    skipped.append(note)
+                    yield _dumps({'skipped': note, 'in_progress': True}) + b'\n'
+                    continue
+
                 # Only yield if this is a real vulnerability (success or found)
-                is_vulnerable = (
-                    result.get('success') or 
-                    result.get('found') or
-                    (result.get('analysis', {}).get('severity') in ['high', 'critical'])
-                )
-                
-                if is_vulnerable and result.get('analysis'):
-                    vuln = {
-                        'type': result.get('type', 'unknown'),
-                        'description': description,
-                        'severity': result.get('analysis', {}).get('severity'),
-                        'summary': result.get('analysis', {}).get('summary'),
-                        'remediation': result.get('analysis', {}).get('remediation', []),
-                        'details': result,
-                    }
+                vuln = vulnerability_report(step, description, result)
+                if vuln is not None:
                     vulnerabilities.append(vuln)
-                    
+
                     # Send update as JSON line (only vulnerabilities)
-                    yield json.dumps({
+                    yield _dumps({
                         'vulnerability': vuln,
                         'vulnerability_count': len(vulnerabilities),
                         'in_progress': True,
-                    }) + '\n'
-            
+                    }) + b'\n'
+
             # Send final results
-            yield json.dumps({
+            yield _dumps({
                 'vulnerabilities': vulnerabilities,
+                'skipped': skipped,
                 'done': True,
                 'url': url,
-            }) + '\n'
+            }) + b'\n'
         except Exception as e:
-            yield json.dumps({
+            yield _dumps({
                 'error': str(e),
                 'done': True,
-            }) + '\n'
-    
-    return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+            }) + b'\n'
+        finally:
+            await scan.aclose()
+
+    return _stream_response(request, stream())
+
+
+def _job_dict(data):
+    # `Job.to_dict()` or the 'job' part of a snapshot
+    data = dict(data)
+    data['status_url'] = reverse('networkip:api_job', args=[data['id']])
+    data['events_url'] = reverse('networkip:api_job_events', args=[data['id']])
+    return data
+
+
+@require_http_methods(['GET', 'POST'])
+@ensure_csrf_cookie
+async def api_jobs(request: HttpRequest):
+    # GET: list jobs; POST kind=sweep&preset=home|vm or kind=internet&url=...
+    # POST and DELETE are CSRF-protected like any form. Clients outside the
+    # browser take the csrftoken cookie a GET sets and send it back together
+    # with an X-CSRFToken header of the same value, e.g.
+    #   curl -c jar /networkip/api/jobs/
+    #   curl -b jar -H "X-CSRFToken: <csrftoken from jar>" -d kind=sweep -d preset=home /networkip/api/jobs/
+    # (over HTTPS the Referer must be same-origin or in CSRF_TRUSTED_ORIGINS)
+    if request.method == 'GET':
+        # this worker's jobs; any worker answers for a single job
+        return JsonResponse({'jobs': [_job_dict(job.to_dict()) for job in registry.list()]}, encoder=_ResultEncoder)
+
+    kind = request.POST.get('kind', '')
+    try:
+        priority = max(-10, min(10, int(request.POST.get('priority', 0))))
+    except ValueError:
+        return JsonResponse({'error': 'Ungültige Priorität'}, status=400)
+    try:
+        if kind == 'sweep':
+            preset = request.POST.get('preset', '')
+            if preset not in SWEEP_PRESETS:
+                return JsonResponse({'error': 'Unbekanntes Netzwerk'}, status=400)
+            job = registry.submit_sweep(SWEEP_PRESETS[preset], priority)
+        elif kind == 'internet':
+            url = request.POST.get('url', '').strip()
+            if not url:
+                return JsonResponse({'error': 'URL erforderlich'}, status=400)
+            job = registry.submit_internet_scan(url, priority)
+        else:
+            return JsonResponse({'error': 'Unbekannte Auftragsart'}, status=400)
+    except QueueFull as e:
+        return _overloaded(e, 'Zu viele wartende Aufträge')
+    return JsonResponse(_job_dict(job.to_dict()), status=202)
+
+
+@require_http_methods(['GET', 'DELETE'])
+@ensure_csrf_cookie
+async def api_job(request: HttpRequest, job_id: str):
+    # Job status, with the result once it is finished; DELETE cancels. Jobs
+    # of other worker processes are answered from the shared cache.
+    if request.method == 'DELETE':
+        snapshot = await asyncio.to_thread(registry.cancel, job_id)
+    else:
+        snapshot = await asyncio.to_thread(registry.snapshot, job_id)
+    if snapshot is None:
+        return JsonResponse({'error': 'Auftrag nicht gefunden'}, status=404)
+    return JsonResponse(_job_dict(snapshot['job']))
+
+
+async def api_job_events(request: HttpRequest, job_id: str):
+    # NDJSON frames {'events': [...], 'next': n, 'state', 'progress', 'total'}
+    # from event number ?after=n on, until the job is finished
+    job = registry.get(job_id)
+    if job is not None:
+        async def current():
+            return job.state, job.progress, job.events
+        interval = FRAME_INTERVAL
+    else:
+        # a job of another worker process: follow what it publishes
+        snapshot = await asyncio.to_thread(registry.snapshot, job_id)
+        if snapshot is None:
+            return JsonResponse({'error': 'Auftrag nicht gefunden'}, status=404)
+
+        async def current():
+            nonlocal snapshot
+            snapshot = await asyncio.to_thread(registry.snapshot, job_id) or snapshot
+            data = snapshot['job']
+            return data['state'], (data['progress'], data['total']), snapshot['events']
+        interval = PUBLISH_INTERVAL
+    try:
+        seen = max(0, int(request.GET.get('after', 0)))
+    except ValueError:
+        seen = 0
+
+    async def stream():
+        nonlocal seen
+        sent = None
+        while True:
+            state, progress, all_events = await current()
+            done = state in FINISHED
+            events = all_events[seen:]
+            seen += len(events)
+            frame = {'events': events, 'next': seen, 'state': state,
+                     'progress': progress[0], 'total': progress[1]}
+            if done:
+                frame['done'] = True
+                yield _dumps(frame) + b'\n'
+                return
+            if events or frame != sent:
+                sent = frame
+                yield _dumps(frame) + b'\n'
+            await asyncio.sleep(interval)
+
+    return _stream_response(request, stream())
+
+
+def metrics_view(request: HttpRequest):
+    # Prometheus scrape target (text exposition format)
+    if not metrics.ENABLED:
+        raise Http404('Metriken sind deaktiviert')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,37 @@
+"""Loading the scanner stack ahead of the first request.
+
+The internet scanner and its HTTP/SSH clients are imported on first use so
+management commands and workers that never scan start quickly. A server that
+would rather pay that cost up front (e.g. gunicorn --preload, where the
+forked workers share the imported modules) sets NETWORKIP_PRELOAD=1.
+"""
+import importlib
+import socket
+import time
+from typing import Dict
+
+# imported lazily by the scan endpoints; pulls in requests/urllib3
+SCANNER_MODULES = [
+    "networkip.internet_scanner",
+]
+
+
+def warm_up() -> Dict[str, float]:
+    """Import the scanner stack and probe ICMP support; returns seconds per step."""
+    timings = {}
+    for name in SCANNER_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        timings[name] = time.perf_counter() - start
+
+    from .internet_scanner import _paramiko
+    start = time.perf_counter()
+    if _paramiko() is not None:
+        timings["paramiko"] = time.perf_counter() - start
+
+    from .icmp import icmp_available
+    start = time.perf_counter()
+    icmp_available(socket.AF_INET)
+    icmp_available(socket.AF_INET6)
+    timings["icmp"] = time.perf_counter() - start
+    return timings
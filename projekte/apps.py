@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class ProjekteConfig(AppConfig):
+    name = 'projekte'
+
+    def ready(self):
+        from .sqlite import apply_pragmas
+        connection_created.connect(apply_pragmas, dispatch_uid='projekte.sqlite.apply_pragmas')
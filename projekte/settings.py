@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'gaestebuch',
     'demo',
     'networkip',
+    'projekte',
 ]
 
 
@@ -77,6 +78,10 @@ WSGI_APPLICATION = 'projekte.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# DJANGO_DB_PROFILE=production: WAL journal, relaxed fsync, bigger page cache,
+# busy timeout and persistent connections (pragmas applied in projekte/sqlite.py)
+DB_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'default')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -84,6 +89,66 @@ DATABASES = {
     }
 }
 
+SQLITE_PRAGMAS = {}
+
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # seconds to wait for a lock before "database is locked"
+            'timeout': 5,
+            # take the write lock at BEGIN, so writers queue instead of failing on upgrade
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'busy_timeout': 5000,
+        'cache_size': -20000,       # KiB, ~20 MB page cache per connection
+        'mmap_size': 268435456,     # 256 MB
+        'temp_store': 'memory',
+    }
+elif DB_PROFILE != 'default':
+    raise ValueError(f"unknown DJANGO_DB_PROFILE {DB_PROFILE!r}")
+
+
+# Cache: per-process memory by default. Pre-forked workers need a shared one,
+# or a guestbook post only invalidates the listing fragments of the worker that
+# took it; the production profile uses a file cache (DJANGO_CACHE_DIR).
+if DB_PROFILE == 'production':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('DJANGO_CACHE_DIR', BASE_DIR / 'cache'),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+
+# NETWORKIP_PRELOAD=1: import the scanner stack at startup instead of on the
+# first scan (pairs with gunicorn --preload; see networkip/warmup.py)
+NETWORKIP_PRELOAD = os.environ.get('NETWORKIP_PRELOAD') == '1'
+
+# Sensitive-path lists of the internet scan, comma-separated (networkip/paths/)
+NETWORKIP_PATH_LISTS = os.environ.get('NETWORKIP_PATH_LISTS', 'backdoor')
+# HTTP client of the internet scan ("requests" or "stdlib"); =1 repeats the
+# Basic Auth checks with curl
+NETWORKIP_HTTP_BACKEND = os.environ.get('NETWORKIP_HTTP_BACKEND', 'requests')
+NETWORKIP_CURL_CROSS_CHECK = os.environ.get('NETWORKIP_CURL_CROSS_CHECK') == '1'
+# NETWORKIP_METRICS=0 turns metric recording (and /networkip/metrics/) off
+NETWORKIP_METRICS = os.environ.get('NETWORKIP_METRICS', '1') != '0'
+# Ping backend of the sweeps: auto, icmp or subprocess
+NETWORKIP_PING_BACKEND = os.environ.get('NETWORKIP_PING_BACKEND', 'auto')
+# Probes in flight across all scans of this process
+NETWORKIP_PROBE_BUDGET = int(os.environ.get('NETWORKIP_PROBE_BUDGET', '512'))
+# Ports checked by ?services=1, e.g. "22,80,8000-8010" (validated by `manage.py check`)
+if 'NETWORKIP_SERVICE_PORTS' in os.environ:
+    NETWORKIP_SERVICE_PORTS = os.environ['NETWORKIP_SERVICE_PORTS']
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
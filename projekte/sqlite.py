@@ -0,0 +1,61 @@
+"""Per-connection SQLite tuning (see SQLITE_PRAGMAS in settings)."""
+from typing import Dict
+
+from django.conf import settings
+from django.core import checks
+from django.db import connections
+
+
+def _pragmas() -> Dict[str, object]:
+    return getattr(settings, 'SQLITE_PRAGMAS', {})
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    # connection_created receiver: runs once per new connection, so with
+    # CONN_MAX_AGE the cost is paid once per worker thread, not per request
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in _pragmas().items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def effective_pragmas(connection) -> Dict[str, str]:
+    with connection.cursor() as cursor:
+        values = {}
+        for name in _pragmas():
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            values[name] = str(row[0]) if row else ''
+        return values
+
+
+def _normalize(name: str, value) -> str:
+    value = str(value).lower()
+    if name == 'synchronous':
+        # PRAGMA synchronous reads back as a number
+        return {'off': '0', 'normal': '1', 'full': '2', 'extra': '3'}.get(value, value)
+    if name == 'temp_store':
+        return {'default': '0', 'file': '1', 'memory': '2'}.get(value, value)
+    return value
+
+
+@checks.register(checks.Tags.database)
+def check_sqlite_pragmas(app_configs, databases=None, **kwargs):
+    """Report the pragmas in effect and warn where SQLite did not accept the profile
+    (e.g. WAL on a network file system). Runs with `check --database` and `migrate`."""
+    messages = []
+    for alias in databases or []:
+        connection = connections[alias]
+        if connection.vendor != 'sqlite' or not _pragmas():
+            continue
+        effective = effective_pragmas(connection)
+        messages.append(checks.Info(
+            'SQLite pragmas: ' + ', '.join(f'{k}={v}' for k, v in effective.items()),
+            obj=alias, id='projekte.I001'))
+        for name, wanted in _pragmas().items():
+            if _normalize(name, effective.get(name, '')) != _normalize(name, wanted):
+                messages.append(checks.Warning(
+                    f'PRAGMA {name} is {effective.get(name)!r}, profile wants {wanted!r}',
+                    obj=alias, id='projekte.W001'))
+    return messages